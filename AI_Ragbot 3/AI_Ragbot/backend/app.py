@@ -1,27 +1,41 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Body, Query, status
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Body, Query, status, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import sqlite3
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple, Literal
 from database.chat_history import ChatHistoryHandler
+from database.async_chat_history import AsyncChatHistory
+from database.sharded_chat_history import ShardedChatHistory
+from database.archiver import ConversationArchiver
+from database.transfer import SECTIONS, export_records, encode_record, parse_cursor, iter_lines, NDJSONImporter
 from processors.code_executor import CodeExecutor
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
 import os
 import json
 import uuid
+import asyncio
 from datetime import datetime
 
 import hashlib
 
 from models.llm_handler import LlamaModel
+from models.backend_pool import OllamaBackendPool
+from models.generation_profile import GenerationProfile, TASK_PROFILES, load_generation_profiles
 from models.embedding import LocalEmbedder
+from models.residency import ModelResidencyScheduler
 from database.chromadb_handler import ChromaDBHandler
+from database.response_cache import SemanticResponseCache
 from processors.document_processor import DocumentProcessor
 from processors.text_processor import TextProcessor
+from processors.conversation_summarizer import ConversationSummarizer
+from processors.retrieval_gate import RetrievalGate
+from processors.batch_chat import BatchChatRunner
 from utils.config import Settings
+from utils.timing import StageTimer
+from utils.idempotency import IdempotencyStore, IdempotencyConflict
 
 settings = Settings()
 app = FastAPI(title="Advanced Chatbot API")
@@ -76,6 +90,17 @@ def load_app_settings():
         print(f"Error loading app settings: {e}")
 
         return {"default": "You are a helpful assistant.", "enable_docs": False}
+
+def get_app_config(app_name: Optional[str]) -> Dict[str, Any]:
+    """Return the settings block for an app, falling back to 'default' (empty dict if none)"""
+    app_prompts = load_app_settings()
+    app_config = app_prompts.get(app_name) if app_name else None
+    if app_config is None:
+        app_config = app_prompts.get("default", {})
+    # Handle old format (direct string)
+    if not isinstance(app_config, dict):
+        return {"system_prompt": app_config, "enable_docs": False}
+    return app_config
  
 
 # CORS middleware
@@ -94,7 +119,11 @@ class CodeExecutionRequest(BaseModel):
 # Initialize the code executor
 code_executor = CodeExecutor(    
     timeout=settings.CODE_EXECUTION_TIMEOUT,    
-    max_output_size=settings.MAX_CODE_OUTPUT_SIZE)
+    max_output_size=settings.MAX_CODE_OUTPUT_SIZE,
+    pool_size=settings.CODE_WORKER_POOL_SIZE if settings.CODE_EXECUTION_ENABLED else 0,
+    max_runs_per_worker=settings.CODE_WORKER_MAX_RUNS,
+    worker_memory_mb=settings.CODE_WORKER_MEMORY_MB,
+    preload=settings.CODE_WORKER_PRELOAD)
 
 # Get the absolute path to the frontend directory
 frontend_dir = os.path.abspath(os.path.join(
@@ -115,7 +144,32 @@ class ConversationUpdate(BaseModel):
     title: str
 
 # Initialize chat history handler with your app
-chat_history = ChatHistoryHandler(db_path="./database/chat_history.db")
+if settings.CHAT_SHARD_MODE:
+    chat_history = ShardedChatHistory(
+        db_dir=settings.CHAT_SHARD_DIR,
+        mode=settings.CHAT_SHARD_MODE,
+        shard_count=settings.CHAT_SHARD_COUNT,
+        apps=[name for name, config in load_app_settings().items()
+              if isinstance(config, (dict, str)) and name not in TASK_PROFILES]
+    )
+else:
+    chat_history = ChatHistoryHandler(db_path="./database/chat_history.db")
+# Async endpoints go through chat_store so SQLite calls never block the event loop
+chat_store = AsyncChatHistory(
+    chat_history,
+    max_readers=settings.DB_READ_THREADS,
+    write_behind_interval=settings.CHAT_WRITE_BEHIND_INTERVAL_MS / 1000 if settings.CHAT_WRITE_BEHIND else None,
+    write_behind_max_batch=settings.CHAT_WRITE_BEHIND_MAX_BATCH,
+    cache_size=settings.CONVERSATION_CACHE_SIZE,
+    cache_messages=settings.CONVERSATION_CACHE_MESSAGES
+)
+archiver = ConversationArchiver(
+    chat_store,
+    load_app_settings,
+    interval_seconds=settings.ARCHIVE_INTERVAL_SECONDS,
+    batch_size=settings.ARCHIVE_BATCH_SIZE,
+    vacuum_pages=settings.ARCHIVE_VACUUM_PAGES
+)
 
 # Create a custom StaticFiles class with JavaScript MIME type
 class JavaScriptStaticFiles(StaticFiles):
@@ -130,6 +184,25 @@ class ChatRequest(BaseModel):
     context: Optional[str] = None
     conversation_history: Optional[List[Dict[str, str]]] = None
 
+class ChatSyncMessage(BaseModel):
+    role: Literal["user", "assistant", "bot", "system"]
+    content: str
+
+class ChatSyncRequest(BaseModel):
+    base_seq: int = 0
+    title: Optional[str] = None
+    systemPrompt: Optional[str] = None
+    messages: List[ChatSyncMessage] = []
+
+class BatchChatRequest(BaseModel):
+    queries: List[str]
+    system_prompt: Optional[str] = None
+    app_name: Optional[str] = None
+    use_docs: bool = False
+    top_k: int = 5
+    persist: bool = False
+    max_concurrency: Optional[int] = None
+
 async def serialize_to_sse(data: Dict) -> str:
     """Serialize data to Server-Sent Events format"""
     return f"data: {json.dumps(data)}\n\n"
@@ -221,11 +294,97 @@ async def get_ui(request: Request):
     return templates.TemplateResponse("index.html", context)
 
 # Initialize components
-embedder = LocalEmbedder()
+# Validated once here so a bad "generation" block stops startup instead of being ignored
+generation_profiles = load_generation_profiles(load_app_settings())
+embedder = LocalEmbedder(
+    model_name=settings.EMBEDDING_MODEL,
+    keep_alive=settings.keep_alive_for(settings.EMBEDDING_MODEL)
+)
 chroma_db = ChromaDBHandler(embedder)
-llm = LlamaModel()
+ollama_pool = OllamaBackendPool.from_spec(
+    settings.OLLAMA_ENDPOINTS,
+    fallback_url=settings.LLAMA_API_URL,
+    health_interval=settings.OLLAMA_HEALTH_INTERVAL
+)
+llm = LlamaModel(
+    model=settings.CHAT_MODEL,
+    pool=ollama_pool,
+    keep_alive=settings.keep_alive_for(settings.CHAT_MODEL),
+    prompt_layout=settings.PROMPT_LAYOUT,
+    task_profiles=generation_profiles
+)
 doc_processor = DocumentProcessor()
 text_processor = TextProcessor()
+summarizer = ConversationSummarizer(
+    llm,
+    chat_store,
+    refresh_every_turns=settings.SUMMARY_REFRESH_TURNS,
+    max_summary_chars=settings.SUMMARY_MAX_CHARS,
+    profile=generation_profiles.get("summarizer")
+)
+retrieval_gate = RetrievalGate()
+response_cache = SemanticResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    default_threshold=settings.RESPONSE_CACHE_THRESHOLD,
+    default_ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS
+)
+residency = ModelResidencyScheduler(
+    embedder,
+    burst_size=settings.RESIDENCY_BURST_SIZE,
+    quiet_seconds=settings.RESIDENCY_QUIET_SECONDS,
+    max_defer_seconds=settings.RESIDENCY_MAX_DEFER_SECONDS
+)
+batch_runner = BatchChatRunner(
+    llm,
+    embedder,
+    chroma_db,
+    chat_store,
+    max_concurrency=settings.BATCH_MAX_CONCURRENCY
+)
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    max_keys=settings.IDEMPOTENCY_MAX_KEYS
+)
+def get_generation_profile(app_name: Optional[str]) -> GenerationProfile:
+    """Generation profile for an app: /settings temperature and max tokens, overridden by the app's profile"""
+    try:
+        base = GenerationProfile(
+            temperature=app_settings["model_temperature"],
+            num_predict=app_settings["model_max_tokens"]
+        )
+    except Exception as e:
+        print(f"[WARN] Ignoring invalid model settings: {e}")
+        base = GenerationProfile()
+    app_profile = generation_profiles.get(app_name) if app_name and app_name not in TASK_PROFILES else None
+    return base.merged(app_profile or generation_profiles.get("default"))
+
+async def warm_up_models():
+    """Load the chat and embedding models so the first request after startup doesn't pay for it"""
+    await asyncio.gather(
+        llm.warm_up(),
+        asyncio.to_thread(embedder.warm_up)
+    )
+
+@app.on_event("startup")
+async def start_model_warm_up():
+    if settings.WARMUP_ON_STARTUP:
+        # Don't block startup on model loads
+        asyncio.create_task(warm_up_models())
+
+@app.on_event("startup")
+async def start_conversation_archiver():
+    if settings.ARCHIVE_ENABLED:
+        asyncio.create_task(archiver.run_forever())
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    # Commit buffered messages before the writer thread stops
+    await chat_store.flush()
+    chat_store.close()
+
+@app.on_event("shutdown")
+async def stop_code_workers():
+    code_executor.close()
 
 # Store chat histories in memory (in production, use a proper database)
 chat_histories = {}
@@ -398,55 +557,138 @@ system_prompts = {}
 #         )
 #         raise HTTPException(status_code=500, detail=error_message)
 
+async def _embed_and_retrieve(message: str, use_docs: bool, timer: StageTimer,
+                              top_k: int = 5) -> Tuple[List[float], str]:
+    """Retrieval stage: embed the query and, for RAG turns, fetch the matching chunks"""
+    with timer.stage("embed"):
+        async with residency.interactive(embedder.model_name):
+            query_embeddings = await asyncio.to_thread(embedder.embed_query, message)
+    context = ""
+    if use_docs:
+        with timer.stage("vector_search"):
+            relevant_docs = await asyncio.to_thread(chroma_db.similarity_search_by_embedding, query_embeddings, top_k)
+        context = "\n\n".join([doc["content"] for doc in relevant_docs])
+        print(f"[DEBUG] Retrieved context: {context[:300]}...")
+    return query_embeddings, context
+
+async def _load_conversation(chat_id: str, system_prompt: Optional[str], timer: StageTimer) -> Dict[str, Any]:
+    """History stage: load the recent window of the conversation and store a changed system prompt"""
+    with timer.stage("history"):
+        # Only the messages the prompt can use; the cost doesn't grow with the conversation
+        conversation = await chat_store.get_conversation_window(chat_id, llm.max_history_messages)
+    metadata = conversation.setdefault("metadata", {})
+    if system_prompt and metadata.get("system_prompt") != system_prompt:
+        with timer.stage("metadata_update"):
+            await chat_store.update_conversation_metadata(chat_id, {"system_prompt": system_prompt})
+        metadata["system_prompt"] = system_prompt
+    return conversation
+
+async def _run_idempotent(scope: str, idempotency_key: str, fingerprint: str, fn, http_response: Response):
+    """Run fn once per Idempotency-Key; retries join the running request or get its stored result"""
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+    try:
+        result, replayed = await idempotency_store.run(scope, idempotency_key, fingerprint, fn)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        print(f"[INFO] Replayed {scope} result for Idempotency-Key {idempotency_key}")
+        http_response.headers["Idempotent-Replayed"] = "true"
+    return result
+
 @app.post("/chat")
 async def chat(
+    background_tasks: BackgroundTasks,
+    http_response: Response,
     message: str = Form(...),
     chat_id: Optional[str] = Form(None),
     use_docs: bool = Form(False),
     system_prompt: Optional[str] = Form(None),
+    app_name: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
+    """Answer a chat message; an Idempotency-Key header makes retries safe"""
+    def run_turn():
+        return _chat_turn(background_tasks, message, chat_id, use_docs, system_prompt, app_name)
+
+    if not idempotency_key:
+        return await run_turn()
+    fingerprint = IdempotencyStore.fingerprint(message, chat_id, use_docs, system_prompt, app_name)
+    return await _run_idempotent("chat", idempotency_key, fingerprint, run_turn, http_response)
+
+async def _chat_turn(
+    background_tasks: BackgroundTasks,
+    message: str,
+    chat_id: Optional[str],
+    use_docs: bool,
+    system_prompt: Optional[str],
+    app_name: Optional[str],
+) -> Dict[str, Any]:
+    timer = StageTimer()
+    persist_user_turn = None
     try:
         # Create a new conversation if chat_id is not provided
         print(f'[DEBUG] system_prompt: {system_prompt}')
         if not chat_id:
             # Create a new conversation in the database
             metadata = {"system_prompt": system_prompt} if system_prompt else {}
-            chat_id = chat_history.create_conversation(
-                title=message[:30] + "...",
-                metadata=metadata
-            )
-        
+            if app_name:
+                # Lets retention policies in appsettings.json apply per app
+                metadata["app_name"] = app_name
+            with timer.stage("create_conversation"):
+                chat_id = await chat_store.create_conversation(
+                    title=message[:30] + "...",
+                    metadata=metadata
+                )
+
+        app_config = get_app_config(app_name)
+        cache_config = SemanticResponseCache.get_config(app_config)
+        generation_profile = get_generation_profile(app_name)
+
+        # Stage 1: start retrieval, history loading and persistence of the user turn together.
+        # None of them depend on each other; only generation needs retrieval and history.
+        # History is started first: with write-behind on, a read waits for the conversation's
+        # buffered messages, and the new user turn doesn't need to be in it (see below).
+        history_load = asyncio.create_task(_load_conversation(chat_id, system_prompt, timer))
         print(f'Adding user message to chat_history: {message}')
-        
-        # Add the user message to the database
-        chat_history.add_message(
+        persist_user_turn = asyncio.create_task(chat_store.add_message(
             conversation_id=chat_id,
             role="user",
             content=message
-        )
-        
-        # Get the conversation to retrieve all previous messages
-        conversation = chat_history.get_conversation(chat_id)
+        ))
+
+        # Skip retrieval for turns that don't need documents (opt-in per app)
+        gate_config = RetrievalGate.get_config(app_config) if use_docs else None
+        gate_decision = retrieval_gate.decide(message, config=gate_config) if gate_config else None
+        if gate_decision and not gate_decision["confident"]:
+            # The rules on the query alone didn't settle it; decide again with the recent turns
+            conversation = await history_load
+            gate_decision = retrieval_gate.decide(
+                message, conversation.get("messages", [])[-llm.max_history_messages:], gate_config
+            )
+        retrieve_docs = use_docs and (gate_decision is None or gate_decision["retrieve"])
+        if gate_decision:
+            print(f"[DEBUG] Retrieval gate: {gate_decision}")
+
+        retrieval = None
+        if retrieve_docs or cache_config:
+            top_k = gate_decision["top_k"] if gate_decision else 5
+            retrieval = asyncio.create_task(_embed_and_retrieve(message, retrieve_docs, timer, top_k))
+        conversation = await history_load
+        query_embeddings, context = await retrieval if retrieval else (None, "")
+        timer.mark("ready_to_generate")
+
+        # The history may have been read before the user turn was written
         conversation_history = conversation.get("messages", [])
+        last = conversation_history[-1] if conversation_history else None
+        if not last or last["role"] != "user" or last["content"] != message.strip():
+            conversation_history.append({"role": "user", "content": message})
+            conversation["message_count"] += 1
         
         # Extract system prompt from metadata if available
-        metadata = conversation.get("metadata", {})
+        metadata = conversation["metadata"]
         current_system_prompt = metadata.get("system_prompt", "You are a helpful assistant.")
-        
-        # Update system prompt if provided in this request
-        if system_prompt:
-            metadata["system_prompt"] = system_prompt
-            current_system_prompt = system_prompt
-            
-            # Update the conversation metadata
-            conn = sqlite3.connect(chat_history.db_path, timeout=300)  # Increased timeout
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE conversations SET metadata = ? WHERE conversation_id = ?",
-                (json.dumps(metadata), chat_id)
-            )
-            conn.commit()
-            conn.close()
+        conversation_summary = ConversationSummarizer.get_summary(metadata)
 
         # Format conversation history for the LLM
         formatted_history = [
@@ -454,71 +696,115 @@ async def chat(
             for msg in conversation_history
         ]
         
-        # Generate response - Make both paths consistent
+        # Stage 2: generate response - Make both paths consistent
         response = ""
+        generation_failed = False
+        # Ollama token and timing counters for this turn, stored with the assistant message
+        usage = {}
+
+        # Serve repeated questions from the semantic response cache (opt-in per app). Only
+        # opening turns use it: a follow-up's answer depends on the turns before it.
+        if cache_config and (len(conversation_history) > 1 or conversation_summary):
+            cache_config = None
+        cache_scope = None
+        cached = None
+        if cache_config:
+            cache_scope = SemanticResponseCache.scope_key(
+                app_name,
+                current_system_prompt,
+                chroma_db.collection_version if use_docs else None
+            )
+            cached = await asyncio.to_thread(
+                response_cache.lookup,
+                cache_scope,
+                query_embeddings,
+                app_name=app_name,
+                threshold=cache_config.get("similarity_threshold")
+            )
         
-        if use_docs:
-            print('[DEBUG] Using docs for response generation')
-            query_embeddings = embedder.embed_query(message)
-            relevant_docs = chroma_db.similarity_search(query_embeddings)
-            context = "\n\n".join([doc["content"] for doc in relevant_docs])
-            print(f"[DEBUG] Retrieved context: {context[:300]}...")
-
-            # Check if generate_response is truly async or sync
-            try:
-                # Try async approach first
-                async for update in llm.generate_response(
-                    query=message,
-                    context=context,
-                    conversation_history=formatted_history,
-                    system_prompt=current_system_prompt
-                ):
-                    if update["status"] == "complete":
-                        response = update["message"]
-                        break
-            except TypeError as e:
-                # If async doesn't work, try sync approach
-                print(f"[DEBUG] Async generation failed, trying sync: {e}")
-                augmented_prompt = f"{current_system_prompt}\n\nContext information:\n{context}\n\nUser question: {message}"
-                response = llm.generate(augmented_prompt, formatted_history)
-        else:
-            print('[DEBUG] Using standard chat without docs')
-            # Ensure consistent timeout handling
-            try:
-                # Try to use async version if available
-                if hasattr(llm, 'generate_async'):
-                    response = await llm.generate_async(
-                        message, 
-                        formatted_history, 
-                        system_prompt=current_system_prompt
-                    )
+        # Chat activity holds back bulk ingestion embedding so the chat model stays loaded
+        generation_model = None if cached else (generation_profile.model or llm.model)
+        async with residency.interactive(generation_model):
+            with timer.stage("generate"):
+                if cached:
+                    print(f"[DEBUG] Response cache hit (similarity {cached['similarity']}): {cached['query'][:60]}")
+                    response = cached["response"]
+                elif retrieve_docs:
+                    print('[DEBUG] Using docs for response generation')
+                    async for update in llm.generate_response(
+                        query=message,
+                        context=context,
+                        conversation_history=formatted_history,
+                        system_prompt=current_system_prompt,
+                        conversation_summary=conversation_summary,
+                        sticky_key=chat_id,
+                        profile=generation_profile
+                    ):
+                        if update["status"] == "complete":
+                            response = update["message"]
+                            usage = update.get("usage", {})
+                            break
                 else:
-                    # Use synchronous version
-                    response = llm.generate(
-                        message, 
-                        formatted_history, 
-                        system_prompt=current_system_prompt
-                    )
-            except Exception as llm_error:
-                print(f"[ERROR] LLM Generation failed: {llm_error}")
-                response = "I apologize, but I encountered an error while generating a response. Please try again."
+                    print('[DEBUG] Using standard chat without docs')
+                    try:
+                        response = await llm.generate_async(
+                            message, 
+                            formatted_history, 
+                            system_prompt=current_system_prompt,
+                            conversation_summary=conversation_summary,
+                            sticky_key=chat_id,
+                            profile=generation_profile,
+                            usage=usage
+                        )
+                    except Exception as llm_error:
+                        print(f"[ERROR] LLM Generation failed: {llm_error}")
+                        generation_failed = True
+                        response = "I apologize, but I encountered an error while generating a response. Please try again."
+
+        # Only cache real answers, never errors or fallback text
+        if cache_config and not cached and not generation_failed and not llm.is_error_response(response):
+            await asyncio.to_thread(
+                response_cache.store,
+                cache_scope,
+                message,
+                query_embeddings,
+                response,
+                ttl_seconds=cache_config.get("ttl_seconds")
+            )
         
         # Ensure we got a response
         if not response or response.strip() == "":
             response = "I apologize, but I couldn't generate a proper response. Please try rephrasing your question."
         
-        # Add the assistant response to the database
-        chat_history.add_message(
-            conversation_id=chat_id,
-            role="assistant",
-            content=response
-        )
+        # Stage 3: add the assistant response to the database, after the user turn
+        with timer.stage("persist"):
+            await persist_user_turn
+            await chat_store.add_message(
+                conversation_id=chat_id,
+                role="assistant",
+                content=response,
+                usage=usage,
+                app_name=app_name
+            )
+
+        # Fold older turns into the running summary off the request path
+        conversation["messages"].append({"role": "assistant", "content": response})
+        conversation["message_count"] += 1
+        refresh_turns = app_config.get("summary_refresh_turns")
+        if summarizer.needs_refresh(conversation, refresh_turns):
+            background_tasks.add_task(summarizer.refresh, chat_id)
         
+        timings = timer.as_dict()
         print(f"[DEBUG] Response generated successfully: {response[:100]}...")
+        print(f"[DEBUG] /chat stage timings (ms): {timings}")
         
         return {
             "response": response,
-            "chat_id": chat_id
+            "chat_id": chat_id,
+            "cached": cached is not None,
+            "retrieval": gate_decision,
+            "timings": timings,
+            "usage": usage
         }
         
     except sqlite3.OperationalError as db_error:
@@ -530,9 +816,11 @@ async def chat(
         print(f'[ERROR] General error in /chat: {str(e)}')
         # Try to record the error in the database if possible
         try:
-            if 'chat_id' in locals() and chat_id:
+            if persist_user_turn is not None:
+                await persist_user_turn
+            if chat_id:
                 error_message = f"Error generating response: {str(e)}"
-                chat_history.add_message(
+                await chat_store.add_message(
                     conversation_id=chat_id,
                     role="system",
                     content=error_message
@@ -542,24 +830,197 @@ async def chat(
         
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many queries with shared app/system prompt settings in one call.
+
+    Streams one NDJSON line per query as it completes (with its index), then a
+    final summary line. Nothing is written to the chat history unless persist is set.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+    max_concurrency = min(request.max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+
+    app_config = get_app_config(request.app_name)
+    system_prompt = request.system_prompt or app_config.get("system_prompt") or "You are a helpful assistant."
+    gate_config = RetrievalGate.get_config(app_config) if request.use_docs else None
+    profile = get_generation_profile(request.app_name)
+
+    async def stream_results():
+        started = asyncio.get_running_loop().time()
+        failed = 0
+        async for result in batch_runner.run(
+            request.queries,
+            system_prompt=system_prompt,
+            use_docs=request.use_docs,
+            top_k=request.top_k,
+            profile=profile,
+            retrieval_gate=retrieval_gate,
+            gate_config=gate_config,
+            app_name=request.app_name,
+            persist=request.persist,
+            max_concurrency=max_concurrency
+        ):
+            failed += "error" in result
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        elapsed = round((asyncio.get_running_loop().time() - started) * 1000, 1)
+        print(f"[INFO] Batch of {len(request.queries)} queries done in {elapsed} ms ({failed} failed)")
+        yield json.dumps({"done": True, "count": len(request.queries), "failed": failed,
+                          "elapsed_ms": elapsed}) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/api/backends")
+async def get_backends():
+    """Get the Ollama backend pool's endpoints with health and load"""
+    return {"endpoints": ollama_pool.status()}
+
+@app.get("/api/metrics/response-cache")
+async def get_response_cache_metrics():
+    """Get semantic response cache hit/miss counters"""
+    return response_cache.stats()
+
+@app.get("/api/metrics/generation")
+async def get_generation_metrics(
+    since: Optional[str] = None,
+    app_name: Optional[str] = None,
+    model: Optional[str] = None,
+    load_stall_ms: float = 500.0
+):
+    """Get token counts, prefill/decode time, tokens/sec and model-load stalls by app and model"""
+    stats = await chat_store.get_generation_stats(since, app_name, model, load_stall_ms)
+    return {"since": since, "load_stall_ms": load_stall_ms, "groups": stats}
+
+@app.get("/api/metrics/residency")
+async def get_residency_metrics():
+    """Get resident Ollama models, embedding burst deferrals and model swap counters"""
+    await residency.refresh_resident()
+    return residency.status()
+
+@app.get("/api/metrics/write-behind")
+async def get_write_behind_metrics():
+    """Get batching counters of the chat history write-behind buffer"""
+    if chat_store.write_behind is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_store.write_behind.status()}
+
+@app.get("/api/metrics/conversation-cache")
+async def get_conversation_cache_metrics():
+    """Get hit/miss counters of the hot-conversation cache"""
+    if chat_store.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_store.cache.status()}
+
+@app.post("/api/execute-code")
+async def execute_code(request: CodeExecutionRequest):
+    """Run a Python snippet and return its output, error, execution_time and queue_wait (seconds)"""
+    if not settings.CODE_EXECUTION_ENABLED:
+        raise HTTPException(status_code=403, detail="Code execution is disabled")
+    return await asyncio.to_thread(code_executor.execute_python_code, request.code)
+
+@app.get("/api/metrics/code-executor")
+async def get_code_executor_metrics():
+    """Get warm code worker counters: runs, recycles, queue wait and execution time"""
+    if code_executor.pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **code_executor.pool.status()}
+
+@app.get("/api/metrics/shards")
+async def get_shard_metrics():
+    """Get the chat history shards with their sizes and conversation counts"""
+    if not isinstance(chat_history, ShardedChatHistory):
+        return {"enabled": False}
+    return {"enabled": True, **await chat_store.run_read(chat_history.status)}
+
+@app.get("/api/metrics/archive")
+async def get_archive_metrics():
+    """Get archiving counters, retention policies and the size of the archive"""
+    return {"enabled": settings.ARCHIVE_ENABLED, **archiver.status(),
+            "archive": await chat_store.get_archive_stats()}
+
+@app.post("/api/maintenance/archive")
+async def run_archive_pass():
+    """Apply the retention policies now (and compact the database if anything was archived or deleted)"""
+    return await archiver.run_once()
+
+@app.post("/api/maintenance/enable-incremental-vacuum")
+async def enable_incremental_vacuum():
+    """
+    One-time switch of an existing database to incremental auto-vacuum, so archiving can
+    return freed pages to the filesystem. Runs a full VACUUM and search index rebuild, which
+    blocks every chat write until it finishes: run it in a maintenance window.
+    """
+    return await chat_store.enable_incremental_vacuum()
+
+@app.get("/api/export")
+async def export_data(after: Optional[str] = None, sections: str = ",".join(SECTIONS)):
+    """
+    Stream the file catalog, document chunks and conversations as NDJSON.
+
+    Pass the cursor of the last checkpoint record received as after to resume.
+    """
+    try:
+        parse_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = [section for section in sections.split(",") if section in SECTIONS]
+    records = export_records(chat_store, chroma_db, after, settings.EXPORT_BATCH_SIZE, selected)
+    return StreamingResponse(
+        (encode_record(record) async for record in records),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="ragbot-export-{datetime.now():%Y%m%d-%H%M%S}.ndjson"'}
+    )
+
+@app.post("/api/import")
+async def import_data(request: Request):
+    """Import an NDJSON export from the request body (records that already exist are skipped)"""
+    importer = NDJSONImporter(chat_store, chroma_db, settings.IMPORT_BATCH_SIZE)
+    try:
+        async for line in iter_lines(request.stream()):
+            await importer.feed(line)
+        return await importer.finish()
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError too; batches before the bad line are committed
+        raise HTTPException(status_code=400, detail={"error": str(e), **importer.stats})
+
+@app.get("/api/metrics/idempotency")
+async def get_idempotency_metrics():
+    """Get counters for requests executed, joined and replayed by Idempotency-Key"""
+    return idempotency_store.status()
+
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @app.post("/upload")
 async def upload_document(
+    http_response: Response,
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None
+    background_tasks: BackgroundTasks = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    
+    """Ingest a document; an Idempotency-Key header makes retries safe"""
+    content = await file.read()
+
+    def ingest():
+        return _ingest_document(file.filename, content)
+
+    if not idempotency_key:
+        return await ingest()
+    fingerprint = IdempotencyStore.fingerprint(file.filename, hashlib.sha256(content).hexdigest())
+    return await _run_idempotent("upload", idempotency_key, fingerprint, ingest, http_response)
+
+async def _ingest_document(filename: str, content: bytes) -> Dict[str, Any]:
     # Generate a unique filename to avoid overwrites
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_filename = f"{timestamp}_{file.filename}"
+    unique_filename = f"{timestamp}_{filename}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
     # Save the file temporarily
     with open(file_path, "wb") as f:
-        content = await file.read()
         f.write(content)
     
     try:
@@ -568,7 +1029,7 @@ async def upload_document(
         
         # Check if the document hash is already in the ChromaDB
         if chroma_db.document_exists(doc_hash):
-            return {"message": f"Document '{file.filename}' has already been processed."}
+            return {"message": f"Document '{filename}' has already been processed."}
         
         # Process the document based on file type
         print('text_content')
@@ -585,16 +1046,17 @@ async def upload_document(
         doc_ids = [f"doc_{uuid.uuid4()}" for _ in chunks]
         
         # Embed and store in ChromaDB
-        embeddings = embedder.embed_documents(chunks)
-        print("DEBUG insides post upload"+file.filename+""+file_path+""+doc_hash)
+        # Embedded in deferred bursts so ingestion doesn't evict the chat model mid-conversation
+        embeddings = await residency.bulk_embed(chunks)
+        print("DEBUG insides post upload"+filename+""+file_path+""+doc_hash)
         # Store the embeddings with the document hash as metadata to track processed docs
         chroma_db.add_documents(doc_ids, chunks, embeddings, {
-            "source": file.filename,
+            "source": filename,
             "file_path": file_path,  # Store the path for future reference
             "doc_hash": doc_hash  # Add hash as metadata
         })
-        print("DEBUG 2 insides post upload"+file.filename+""+file_path+""+doc_hash)
-        return {"message": f"Document '{file.filename}' processed and stored successfully", "file_path": file_path}
+        print("DEBUG 2 insides post upload"+filename+""+file_path+""+doc_hash)
+        return {"message": f"Document '{filename}' processed and stored successfully", "file_path": file_path}
 
     except Exception as e:
         # In case of error, we should remove the file
@@ -691,42 +1153,38 @@ async def save_settings(request: Request):
 #     except Exception as e:
 #         return JSONResponse({"success": False, "message": str(e)}), 500
 
+def _delete_uploaded_files(deleted_files: List[str], failed_files: List[str]):
+    upload_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+    for filename in os.listdir(upload_dir):
+        file_path = os.path.join(upload_dir, filename)
+        try:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+                deleted_files.append(filename)
+        except Exception as e:
+            failed_files.append(f"{filename}: {str(e)}")
+
 @app.delete('/api/documents/delete-all')
-def delete_all_documents():
+async def delete_all_documents():
     try:
         deleted_files = []
         failed_files = []
         
-        # 1. Delete all files in the uploads directory
-        upload_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-        for filename in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    deleted_files.append(filename)
-            except Exception as e:
-                failed_files.append(f"{filename}: {str(e)}")
+        # 1. Delete all files in the uploads directory (off the event loop)
+        await asyncio.to_thread(_delete_uploaded_files, deleted_files, failed_files)
         
         # 2. Clear the ChromaDB collection
-        result = ChromaDBHandler.clear_collection()
+        result = await asyncio.to_thread(chroma_db.clear_collection)
         if not result.get("success", False):
             return JSONResponse({
                 "success": False, 
                 "message": f"Failed to clear ChromaDB: {result.get('error', 'Unknown error')}",
                 "deleted_files": deleted_files,
                 "failed_files": failed_files
-            }), 500
-        
-        # 3. Clear the uploaded_files table in the database
-        db_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'chat_history.db')
+            }, status_code=500)
         
-        # Use SQLite directly for this operation
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM uploaded_files")
-        conn.commit()
-        conn.close()
+        # 3. Clear the uploaded_files table in the database (on the writer thread, like every write)
+        await chat_store.clear_uploaded_files()
         
         # Log success details
         print(f"Document deletion completed. Files deleted: {len(deleted_files)}, Files failed: {len(failed_files)}")
@@ -740,13 +1198,16 @@ def delete_all_documents():
         })
     except Exception as e:
         print(f"Error in delete_all_documents: {str(e)}")
-        return JSONResponse({"success": False, "message": str(e)}), 500
+        return JSONResponse({"success": False, "message": str(e)}, status_code=500)
 # Chat history API endpoints
+# Largest page served by the paginated message endpoints
+MAX_MESSAGE_PAGE = 200
+
 @app.post("/api/conversations")
 async def create_conversation(conversation: ConversationCreate):
     """Create a new conversation"""
     try:
-        conversation_id = chat_history.create_conversation(
+        conversation_id = await chat_store.create_conversation(
             title=conversation.title,
             metadata=conversation.metadata
         )
@@ -758,25 +1219,70 @@ async def create_conversation(conversation: ConversationCreate):
 async def get_conversations(limit: int = 50, offset: int = 0):
     """Get a list of all conversations"""
     try:
-        conversations = chat_history.get_all_conversations(limit=limit, offset=offset)
+        conversations = await chat_store.get_all_conversations(limit=limit, offset=offset)
         return {"conversations": conversations}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving conversations: {str(e)}")
 
+@app.get("/api/conversation-list")
+async def list_conversations(limit: int = 50, before: Optional[str] = None):
+    """Page through the conversation list (id, title, updated_at, message count, last-message preview)"""
+    limit = min(max(limit, 1), MAX_MESSAGE_PAGE)
+    try:
+        return await chat_store.list_conversations(limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving conversations: {str(e)}")
+
 @app.get("/api/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """Get a specific with all its messages"""
     try:
-        conversation = chat_history.get_conversation(conversation_id)
+        conversation = await chat_store.get_conversation(conversation_id)
         return conversation
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Conversation not found: {str(e)}")
 
+@app.get("/api/conversations/{conversation_id}/usage")
+async def get_conversation_usage(conversation_id: str):
+    """Get the Ollama token and timing counters stored with a conversation's answers"""
+    try:
+        return {"conversation_id": conversation_id,
+                "usage": await chat_store.get_message_usage(conversation_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/conversations/{conversation_id}/messages")
+async def get_conversation_messages(conversation_id: str, limit: int = 50, before: Optional[str] = None):
+    """Page through a conversation's messages from the newest; pass next_cursor as before for older ones"""
+    limit = min(max(limit, 1), MAX_MESSAGE_PAGE)
+    try:
+        page = await chat_store.get_messages(conversation_id, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving messages: {str(e)}")
+    return {"conversation_id": conversation_id, **page}
+
+@app.get("/api/search")
+async def search_conversations(q: str, limit: int = 20, offset: int = 0):
+    """
+    Full-text search over past chats; returns ranked conversations with a snippet of the best match.
+    Archived conversations are not searchable until they are opened (which restores them).
+    """
+    limit = min(max(limit, 1), MAX_MESSAGE_PAGE)
+    try:
+        page = await chat_store.search_conversations(q, limit=limit, offset=max(offset, 0))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching conversations: {str(e)}")
+    return {"query": q, "limit": limit, "offset": offset, **page}
+
 @app.put("/api/conversations/{conversation_id}")
 async def update_conversation_title(conversation_id: str, update: ConversationUpdate):
     """Update a conversation's title"""
     try:
-        success = chat_history.update_conversation_title(conversation_id, update.title)
+        success = await chat_store.update_conversation_title(conversation_id, update.title)
         if not success:
             raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
         return {"message": "updated successfully"}
@@ -789,7 +1295,7 @@ async def update_conversation_title(conversation_id: str, update: ConversationUp
 async def delete_conversation(conversation_id: str):
     """Delete a and all its messages"""
     try:
-        success = chat_history.delete_conversation(conversation_id)
+        success = await chat_store.delete_conversation(conversation_id)
         if not success:
             raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
         return {"message": "Conversation deleted successfully"}
@@ -802,7 +1308,7 @@ async def delete_conversation(conversation_id: str):
 async def add_message(conversation_id: str, message: MessageCreate):
     """Add a message to a conversation"""
     try:
-        message_id = chat_history.add_message(
+        message_id = await chat_store.add_message(
             conversation_id=conversation_id,
             role=message.role,
             content=message.content
@@ -814,10 +1320,10 @@ async def add_message(conversation_id: str, message: MessageCreate):
 # DB routes for chat history to match the frontend's expected endpoints
 @app.get("/db/get-all-chats")
 async def get_all_chats():
-    """Get all chats for the frontend"""
-    print('inside get ALL chats---------------------')
+    """Get the 100 most recent chats for the frontend (list fields only, no metadata)"""
     try:
-        conversations = chat_history.get_all_conversations(limit=100)
+        page = await chat_store.list_conversations(limit=100)
+        conversations = page["conversations"]
         # Return in the format expected by frontend
         return conversations
     except Exception as e:
@@ -828,10 +1334,13 @@ async def get_all_chats():
         )
 
 @app.get("/db/get-chat/{chat_id}")
-async def get_chat(chat_id: str):
-    """Get a specific chat by ID"""
+async def get_chat(chat_id: str, limit: Optional[int] = None):
+    """Get a specific chat by ID; with limit, only its last messages and a cursor for older ones"""
     try:
-        conversation = chat_history.get_conversation(chat_id)
+        if limit:
+            conversation = await chat_store.get_conversation_window(chat_id, min(max(limit, 1), MAX_MESSAGE_PAGE))
+        else:
+            conversation = await chat_store.get_conversation(chat_id)
         return conversation
     except Exception as e:
         print(f"Error getting chat {chat_id}: {str(e)}")
@@ -840,106 +1349,35 @@ async def get_chat(chat_id: str):
             content={"error": f"Chat not found: {str(e)}"}
         )
 
-@app.post("/db/save-chat")
-async def save_chat(request: Request):
-    """Save a chat to the database"""
-    print('-----------------> Inside SaveChat : ')
+@app.post("/db/sync-chat/{chat_id}")
+async def sync_chat(chat_id: str, request: ChatSyncRequest):
+    """Apply the messages a client added after its last acknowledged sequence number"""
+    messages = []
+    for msg in request.messages:
+        content = msg.content.strip()
+        if not content:
+            continue
+        # The frontend labels answers "bot"; store them like /chat does so duplicates are caught
+        role = "assistant" if msg.role == "bot" else msg.role
+        messages.append({"role": role, "content": content})
+    metadata = {"system_prompt": request.systemPrompt or "You are a helpful assistant."}
     try:
-        data = await request.json()
-        chat_id = data.get("id")
-        title = data.get("title", "Untitled Chat")
-        messages = data.get("messages", [])
-        
-        # Check if this is a new conversation or an update
-        if not chat_id or chat_id == "null" or chat_id == "undefined":
-            # Create new conversation
-            metadata = {
-                "system_prompt": data.get("systemPrompt", "You are a helpful assistant.")
-            }
-            chat_id = chat_history.create_conversation(title=title, metadata=metadata)
-        else:
-            # Update existing conversation title if provided
-            try:
-                if title:
-                    chat_history.update_conversation_title(chat_id, title)
-            
-            # Get existing conversation to check if we need to add messages
-                print('save-chat ----->'+chat_id)
-                existing = []
-                try:
-                    existing = chat_history.get_conversation(chat_id)
-                    print('Conversation FOUND!!!!!!!!!!!!!!!!')
-                except:
-                    print('no existing conversation !!!!!')
-                
-                print('----------existing---------')
-                print(existing)
-                print('----------existing---------')
-                existing_msg_count = len(existing)#.get("messages", []))
-                print(f'----------existing_msg_count--------- {existing_msg_count}')
-                existing_messages = existing.get("messages", [])
-                existing_set = set(
-                    (m.get("role", ""), m.get("content", "").strip()) for m in existing_messages
-                )
-                # If all new messages are already in existing messages, skip
-                incoming_set = set(
-                    (m.get("role", ""), m.get("content", "").strip()) for m in messages
-                )
-                
-                # If the number of messages is the same, no need to add more
-                
-                
-                # if existing_msg_count >= len(messages):
-                #     return {"id": chat_id, "success": True, "message": "Chat already up to date"}
-
-                if incoming_set.issubset(existing_set):
-                    print("!!!!!!!!!No new messages to add!!!!!")
-                    return {"id": chat_id, "success": True, "message": "Chat already up to date"}
-
-            except:
-                # If the conversation doesn't exist, create it
-                metadata = {
-                    "system_prompt": data.get("systemPrompt", "You are a helpful assistant.")
-                }
-                print('adding new conversation ----->'+chat_id)
-                chat_id = chat_history.create_conversation(title=title, metadata=metadata,conversation_id=chat_id)
-                # chat_id = chat_history.create_conversation(title=title, metadata=metadata)
-        
-        # Add messages to the conversation
-        # for msg in messages:
-        #     # Skip adding messages that may already exist
-        #     chat_history.add_message(
-        #         conversation_id=chat_id,
-        #         role=msg.get("role", "user"),
-        #         content=msg.get("content", "")
-        #     )
-            
-        # return {"id": chat_id, "success": True}
-
-        # Add only new messages
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "").strip()
-            if (role, content) not in existing_set:
-                chat_history.add_message(
-                    conversation_id=chat_id,
-                    role=role,
-                    content=content
-                )
-
-        return {"id": chat_id, "success": True}
+        result = await chat_store.sync_messages(
+            chat_id, request.base_seq, messages, title=request.title, metadata=metadata
+        )
     except Exception as e:
-        print(f"Error saving chat: {str(e)}")
+        print(f"[ERROR] Failed to sync chat {chat_id}: {str(e)}")
         return JSONResponse(
-            status_code=500, 
-            content={"error": f"Failed to save chat: {str(e)}"}
+            status_code=500,
+            content={"error": f"Failed to sync chat: {str(e)}"}
         )
+    return {"id": chat_id, "success": True, **result}
 
 @app.delete("/db/delete-chat/{chat_id}")
 async def delete_chat(chat_id: str):
     """Delete a chat from the database"""
     try:
-        success = chat_history.delete_conversation(chat_id)
+        success = await chat_store.delete_conversation(chat_id)
         if success:
             return {"success": True, "message": "Chat deleted successfully"}
         else:
@@ -959,15 +1397,8 @@ async def delete_chat(chat_id: str):
 async def get_documents():
     """Get a list of uploaded documents"""
     try:
-        # Connect to the database
-        conn = sqlite3.connect(chat_history.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Get all unique files from the uploaded_files table
-        cursor.execute("SELECT id, filename, filehash FROM uploaded_files ORDER BY id DESC")
-        files = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        files = await chat_store.get_uploaded_files()
         
         return {"files": files}
     except Exception as e:
@@ -1008,6 +1439,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import aiofiles
 import httpx
+from utils.single_flight import SingleFlight, request_key
 
 # File processing libraries
 import PyPDF2
@@ -1153,26 +1585,33 @@ class FileProcessor:
 class OllamaClient:
     """Client for interacting with Ollama API"""
     
-    def __init__(self, base_url: str = OLLAMA_BASE_URL):
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, profile: Optional[GenerationProfile] = None):
         self.base_url = base_url
+        # The "goal_analysis" entry of appsettings.json (Ollama reads it from options)
+        self.profile = profile or GenerationProfile()
         self.client = httpx.AsyncClient(timeout=120.0)
+        # Identical concurrent analyses share one upstream generation
+        self.single_flight = SingleFlight()
     
-    async def generate_response(self, prompt: str, model: str = DEFAULT_MODEL) -> str:
+    async def generate_response(self, prompt: str, model: Optional[str] = None) -> str:
         """Generate response using Ollama"""
+        model = model or self.profile.model or DEFAULT_MODEL
+        url = f"{self.base_url}/api/generate"
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": self.profile.to_options()
+        }
+        if self.profile.keep_alive is not None:
+            payload["keep_alive"] = self.profile.keep_alive
+        async with residency.interactive(model):
+            return await self.single_flight.do(request_key(url, payload), lambda: self._post_generate(url, payload))
+
+    async def _post_generate(self, url: str, payload: Dict[str, Any]) -> str:
+        """Send a single generate request to Ollama"""
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_tokens": 2000
-                    }
-                }
-            )
+            response = await self.client.post(url, json=payload)
             response.raise_for_status()
             result = response.json()
             return result.get("response", "")
@@ -1183,8 +1622,9 @@ class OllamaClient:
             logger.error(f"Error generating response: {str(e)}")
             raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
     
-    async def check_model_availability(self, model: str = DEFAULT_MODEL) -> bool:
+    async def check_model_availability(self, model: Optional[str] = None) -> bool:
         """Check if the specified model is available"""
+        model = model or self.profile.model or DEFAULT_MODEL
         try:
             response = await self.client.get(f"{self.base_url}/api/tags")
             response.raise_for_status()
@@ -1199,7 +1639,7 @@ class GoalAnalyzer:
     
     def __init__(self):
         self.file_processor = FileProcessor()
-        self.ollama_client = OllamaClient()
+        self.ollama_client = OllamaClient(profile=generation_profiles.get("goal_analysis"))
     
     def get_file_extension(self, filename: str) -> str:
         """Get file extension"""
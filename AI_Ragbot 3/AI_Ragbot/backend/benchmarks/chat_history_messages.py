@@ -0,0 +1,138 @@
+"""
+Chat history benchmark at scale (default 1M messages).
+
+Builds a throw-away database at schema version 2 (no message indexes, no content
+hash), measures the hot queries the way they ran before migration 3, applies
+migration 3 and measures the same operations through ChatHistoryHandler:
+  - add_message: duplicate check + insert (COUNT(*) over message text vs. the
+    unique content-hash index with INSERT OR IGNORE)
+  - get_conversation: messages of one conversation ordered by timestamp
+  - get_all_conversations: first page ordered by updated_at
+
+Run from the backend directory:
+    python -m benchmarks.chat_history_messages --messages 1000000 --conversations 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from database.chat_history import ChatHistoryHandler
+from database.migrations import run_migrations
+
+
+def populate(db_path: str, messages: int, conversations: int, batch: int = 50000):
+    """Fill a version-2 database with conversations and messages"""
+    conn = sqlite3.connect(db_path)
+    run_migrations(conn, target=2)
+    start = datetime(2024, 1, 1)
+    conversation_ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id, title, created_at, updated_at, metadata) VALUES (?, ?, ?, ?, ?)",
+        [(cid, f"Chat {i}", start.isoformat(), (start + timedelta(minutes=i)).isoformat(), "{}")
+         for i, cid in enumerate(conversation_ids)]
+    )
+    rows = []
+    for i in range(messages):
+        cid = conversation_ids[i % conversations]
+        role = "user" if (i // conversations) % 2 == 0 else "assistant"
+        content = f"Message {i}: " + "lorem ipsum dolor sit amet " * random.randint(2, 20)
+        rows.append((str(uuid.uuid4()), cid, role, content, (start + timedelta(seconds=i)).isoformat()))
+        if len(rows) >= batch:
+            conn.executemany("INSERT INTO messages (message_id, conversation_id, role, content, timestamp) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+            rows = []
+    if rows:
+        conn.executemany("INSERT INTO messages (message_id, conversation_id, role, content, timestamp) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return conversation_ids
+
+
+def timed(fn: Callable[[], object], repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def legacy_add_message(conn: sqlite3.Connection, conversation_id: str, content: str):
+    now = datetime.now().isoformat()
+    count = conn.execute(
+        "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND role = ? AND content = ?",
+        (conversation_id, "user", content)
+    ).fetchone()[0]
+    if count == 0:
+        conn.execute("UPDATE conversations SET updated_at = ? WHERE conversation_id = ?", (now, conversation_id))
+        conn.execute("INSERT INTO messages (message_id, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                     (str(uuid.uuid4()), conversation_id, "user", content, now))
+    conn.commit()
+
+
+def legacy_get_messages(conn: sqlite3.Connection, conversation_id: str):
+    return conn.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
+                        (conversation_id,)).fetchall()
+
+
+def legacy_list(conn: sqlite3.Connection):
+    return conn.execute("SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ? OFFSET ?", (50, 0)).fetchall()
+
+
+def report(label: str, samples: List[float]):
+    print(f"{label:<40} median {statistics.median(samples):9.3f} ms   p95 "
+          f"{sorted(samples)[int(len(samples) * 0.95) - 1]:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--db", help="Database path (default: a temporary file)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "chat_history_bench.db")
+    print(f"Populating {args.messages:,} messages in {args.conversations:,} conversations at {db_path}")
+    started = time.perf_counter()
+    conversation_ids = populate(db_path, args.messages, args.conversations)
+    print(f"Populated in {time.perf_counter() - started:.1f}s")
+
+    pick = lambda: random.choice(conversation_ids)
+    results: Dict[str, List[float]] = {}
+
+    conn = sqlite3.connect(db_path)
+    results["before: add_message"] = timed(lambda: legacy_add_message(conn, pick(), f"new {uuid.uuid4()}"), args.repeats)
+    results["before: get_conversation messages"] = timed(lambda: legacy_get_messages(conn, pick()), args.repeats)
+    results["before: get_all_conversations"] = timed(lambda: legacy_list(conn), args.repeats)
+    conn.close()
+
+    started = time.perf_counter()
+    handler = ChatHistoryHandler(db_path)
+    print(f"Migration 3 (indexes + content hash backfill) took {time.perf_counter() - started:.1f}s")
+
+    # The handler logs every call; keep the output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["after: add_message"] = timed(lambda: handler.add_message(pick(), "user", f"new {uuid.uuid4()}"), args.repeats)
+        results["after: add_message (duplicate)"] = timed(lambda: handler.add_message(conversation_ids[0], "user", "new dup"), args.repeats)
+        results["after: get_conversation"] = timed(lambda: handler.get_conversation(pick()), args.repeats)
+        results["after: get_all_conversations"] = timed(lambda: handler.get_all_conversations(limit=50), args.repeats)
+    handler.close()
+
+    print()
+    for label, samples in results.items():
+        report(label, samples)
+
+
+if __name__ == "__main__":
+    main()
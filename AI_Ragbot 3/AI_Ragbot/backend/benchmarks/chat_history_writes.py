@@ -0,0 +1,87 @@
+"""
+Chat history write throughput under concurrent chat load.
+
+Simulates --clients concurrent chats, each writing --turns user/assistant message
+pairs through AsyncChatHistory (with a short simulated generation between the
+two), and reports message inserts/sec with direct writes and with the
+write-behind buffer at each --intervals value (ms). With --shards, the same runs are
+repeated over a hash-sharded store with that many database files.
+
+Run from the backend directory:
+    python -m benchmarks.chat_history_writes --clients 64 --turns 50
+    python -m benchmarks.chat_history_writes --synchronous FULL
+    python -m benchmarks.chat_history_writes --shards 4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Optional
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from database.sharded_chat_history import ShardedChatHistory
+
+
+async def run_load(store: AsyncChatHistory, clients: int, turns: int, think_ms: float) -> float:
+    """Run the simulated chats and return the elapsed seconds"""
+    conversation_ids = [await store.create_conversation(title=f"Bench {i}") for i in range(clients)]
+
+    async def chat(conversation_id: str):
+        for turn in range(turns):
+            await store.add_message(conversation_id, "user", f"question {turn} {random.random()}")
+            await asyncio.sleep(random.uniform(0, think_ms) / 1000)
+            await store.add_message(conversation_id, "assistant", f"answer {turn} {random.random()}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(chat(cid) for cid in conversation_ids))
+    await store.flush()
+    return time.perf_counter() - started
+
+
+async def measure(db_dir: str, label: str, args, interval_ms: Optional[float], shards: int = 0) -> Dict[str, float]:
+    pragmas = {"synchronous": args.synchronous}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if shards:
+            handler = ShardedChatHistory(os.path.join(db_dir, label), "hash", shards, pragmas=pragmas)
+        else:
+            handler = ChatHistoryHandler(os.path.join(db_dir, f"{label}.db"), pragmas=pragmas)
+    store = AsyncChatHistory(
+        handler,
+        write_behind_interval=interval_ms / 1000 if interval_ms is not None else None
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = await run_load(store, args.clients, args.turns, args.think_ms)
+    status = store.write_behind.status() if store.write_behind else {}
+    store.close()
+    inserts = args.clients * args.turns * 2
+    return {"inserts_per_sec": inserts / elapsed, "elapsed": elapsed, "avg_batch": status.get("avg_batch") or 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--think-ms", type=float, default=5.0, help="Max simulated generation time per turn")
+    parser.add_argument("--intervals", default="5,20,50", help="Write-behind flush intervals to try (ms)")
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    parser.add_argument("--shards", type=int, default=0, help="Also run against this many hash shards")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp()
+    print(f"{args.clients} concurrent chats x {args.turns} turns, synchronous={args.synchronous}, in {db_dir}\n")
+    runs = [("direct", None, 0)] + [(f"write-behind {ms}ms", float(ms), 0) for ms in args.intervals.split(",")]
+    if args.shards:
+        runs += [(f"{label}, {args.shards} shards", interval_ms, args.shards) for label, interval_ms, _ in runs]
+    for index, (label, interval_ms, shards) in enumerate(runs):
+        result = asyncio.run(measure(db_dir, f"run{index}", args, interval_ms, shards))
+        print(f"{label:<32} {result['inserts_per_sec']:10.0f} inserts/s   "
+              f"{result['elapsed']:7.2f}s   avg batch {result['avg_batch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+First-token latency benchmark for the chat model.
+
+Measures time-to-first-token (TTFT) against a running Ollama instance for:
+  1. a cold model (unloaded with keep_alive=0) vs. a model loaded by LlamaModel.warm_up()
+  2. the "legacy" prompt layout (context in the system message) vs. the
+     "prefix_stable" layout (context in the final user message) over a simulated
+     multi-turn RAG conversation, where Ollama can only reuse its prompt cache
+     for the unchanged prefix
+
+Run from the backend directory:
+    python -m benchmarks.first_token_latency --turns 8 --url http://localhost:11434
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List, Dict, Optional
+
+import httpx
+
+from models.backend_pool import OllamaBackendPool, OllamaEndpoint
+from models.llm_handler import LlamaModel, PROMPT_LAYOUTS
+
+SYSTEM_PROMPT = (
+    "You are a warm, game-like trainer helping users master concepts from the attached "
+    "document. Ask one question at a time and give short gamified feedback."
+)
+
+# Stand-ins for retrieved chunks; each turn gets a different one, as in real RAG traffic
+CONTEXTS = [
+    f"Section {i}. Leave policy clause {i}: employees accrue {i + 10} days of leave per year, "
+    f"subject to manager approval and carry-over limits described in annex {i}. " * 12
+    for i in range(32)
+]
+
+
+async def stream_ttft(client: httpx.AsyncClient, url: str, payload: Dict) -> Dict:
+    """Send a streaming chat request and return TTFT plus Ollama's own timings"""
+    payload = {**payload, "stream": True}
+    started = time.perf_counter()
+    first_token: Optional[float] = None
+    final: Dict = {}
+    async with client.stream("POST", url, json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if first_token is None and chunk.get("message", {}).get("content"):
+                first_token = time.perf_counter() - started
+            if chunk.get("done"):
+                final = chunk
+                break
+    return {
+        "ttft": first_token if first_token is not None else time.perf_counter() - started,
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "prompt_eval_ms": (final.get("prompt_eval_duration") or 0) / 1e6,
+        "load_ms": (final.get("load_duration") or 0) / 1e6,
+    }
+
+
+async def unload(client: httpx.AsyncClient, url: str, model: str):
+    await client.post(url, json={"model": model, "messages": [], "keep_alive": 0})
+
+
+async def bench_cold_vs_warm(llm: LlamaModel, client: httpx.AsyncClient, url: str, repeats: int) -> Dict:
+    """TTFT of the first request after the model was unloaded, with and without warm-up"""
+    messages = llm.build_rag_messages("Say hello in one word.", None, SYSTEM_PROMPT)
+    payload = llm._create_payload(messages, max_tokens=8)
+    results = {"cold": [], "warm": []}
+    for _ in range(repeats):
+        await unload(client, url, llm.model)
+        results["cold"].append(await stream_ttft(client, url, payload))
+        await unload(client, url, llm.model)
+        await llm.warm_up()
+        results["warm"].append(await stream_ttft(client, url, payload))
+    return results
+
+
+async def bench_layout(llm: LlamaModel, client: httpx.AsyncClient, url: str, layout: str, turns: int) -> List[Dict]:
+    """Simulate a multi-turn RAG chat in one layout and record per-turn TTFT"""
+    history: List[Dict[str, str]] = []
+    results = []
+    # Start each layout from a freshly loaded model with an empty prompt cache
+    await unload(client, url, llm.model)
+    await llm.warm_up()
+    for turn in range(turns):
+        query = f"Question {turn}: how many days of leave do I get under clause {turn}?"
+        messages = llm.build_rag_messages(query, CONTEXTS[turn % len(CONTEXTS)], SYSTEM_PROMPT,
+                                          history, layout=layout)
+        payload = llm._create_payload(messages, max_tokens=16)
+        result = await stream_ttft(client, url, payload)
+        results.append(result)
+        history += [{"role": "user", "content": query},
+                    {"role": "assistant", "content": f"Answer {turn}: {turn + 10} days."}]
+    return results
+
+
+def summarize(label: str, results: List[Dict]):
+    ttfts = [r["ttft"] * 1000 for r in results]
+    evals = [r["prompt_eval_count"] for r in results if r["prompt_eval_count"] is not None]
+    print(f"{label:<24} TTFT median {statistics.median(ttfts):8.1f} ms   "
+          f"mean {statistics.mean(ttfts):8.1f} ms   "
+          f"prompt tokens evaluated (mean) {statistics.mean(evals) if evals else float('nan'):7.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:11434", help="Ollama base URL")
+    parser.add_argument("--model", default="llama3:8b")
+    parser.add_argument("--keep-alive", default="30m")
+    parser.add_argument("--turns", type=int, default=8, help="Turns per layout run")
+    parser.add_argument("--repeats", type=int, default=3, help="Cold/warm repetitions")
+    parser.add_argument("--json", help="Write raw results to this file")
+    args = parser.parse_args()
+
+    pool = OllamaBackendPool([OllamaEndpoint(args.url)], health_interval=0)
+    llm = LlamaModel(model=args.model, pool=pool, keep_alive=args.keep_alive)
+    url = args.url.rstrip("/") + LlamaModel.CHAT_PATH
+
+    async with httpx.AsyncClient(timeout=300.0) as client:
+        cold_warm = await bench_cold_vs_warm(llm, client, url, args.repeats)
+        layouts = {layout: await bench_layout(llm, client, url, layout, args.turns) for layout in PROMPT_LAYOUTS}
+
+    print(f"\nModel {args.model} at {args.url}")
+    summarize("cold start", cold_warm["cold"])
+    summarize("after warm-up", cold_warm["warm"])
+    for layout, results in layouts.items():
+        # Skip the first turn: both layouts start with an empty prompt cache
+        summarize(f"layout={layout}", results[1:])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cold_warm": cold_warm, "layouts": layouts}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Any, Callable
+
+
+class ConversationArchiver:
+    """
+    Moves idle conversations to cold storage and keeps the database file compact.
+
+    Each app's "retention" block sets archive_after_days (idle conversations have their
+    messages compressed into the conversation_archive table) and optionally
+    delete_after_days (idle conversations are deleted). Apps without a block of their
+    own follow the "default" app's policy. After a pass that archived or deleted
+    anything, the freed pages are returned to the filesystem with an incremental
+    vacuum (databases created before incremental auto-vacuum was the default need
+    enable_incremental_vacuum() once for that).
+
+    Archived conversations are restored by AsyncChatHistory when they are opened or
+    written to. Their messages leave the full-text search index while archived.
+    """
+
+    def __init__(self, store, load_app_settings: Callable[[], Dict[str, Any]], interval_seconds: float = 3600,
+                 batch_size: int = 200, vacuum_pages: int = 2000):
+        """
+        Args:
+            store: AsyncChatHistory holding the conversations
+            load_app_settings: Returns the appsettings.json contents (re-read every pass)
+            interval_seconds: Time between passes of run_forever()
+            batch_size: Conversations archived or deleted per app and pass
+            vacuum_pages: Free pages released per pass
+        """
+        self.store = store
+        self.load_app_settings = load_app_settings
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self._lock = asyncio.Lock()
+        self.stats = {"runs": 0, "archived": 0, "deleted": 0, "failed": 0, "freed_pages": 0,
+                      "last_run": None, "last_run_ms": None}
+
+    @staticmethod
+    def get_policy(app_config: Any) -> Optional[Dict[str, float]]:
+        """Return the app's retention block if it sets archive_after_days or delete_after_days"""
+        if not isinstance(app_config, dict):
+            return None
+        retention = app_config.get("retention")
+        if not isinstance(retention, dict):
+            return None
+        policy = {key: float(retention[key]) for key in ("archive_after_days", "delete_after_days")
+                  if retention.get(key) is not None}
+        return policy or None
+
+    def _policies(self) -> Dict[Optional[str], Dict[str, float]]:
+        """Retention policy per app name; None is the default group"""
+        policies = {}
+        for app_name, app_config in self.load_app_settings().items():
+            policy = self.get_policy(app_config)
+            if policy:
+                policies[None if app_name == "default" else app_name] = policy
+        return policies
+
+    async def _apply(self, action: str, conversation_ids: List[str], cutoff: str) -> int:
+        done = 0
+        for conversation_id in conversation_ids:
+            try:
+                if action == "archived":
+                    # Re-checked in the archiving transaction: the conversation may have become active
+                    changed = await self.store.archive_conversation(conversation_id, cutoff)
+                else:
+                    changed = await self.store.delete_conversation(conversation_id)
+                if changed:
+                    done += 1
+            except Exception as e:
+                print(f"[ERROR] Failed to {action[:-1]} conversation {conversation_id}: {e}")
+                self.stats["failed"] += 1
+        self.stats[action] += done
+        return done
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Apply every app's retention policy once, then compact the database if anything changed"""
+        async with self._lock:
+            started = time.perf_counter()
+            now = datetime.now()
+            policies = self._policies()
+            apps_with_policy = [app_name for app_name in policies if app_name is not None]
+            summary = {"archived": 0, "deleted": 0}
+            for app_name, policy in policies.items():
+                exclude = apps_with_policy if app_name is None else None
+                if "delete_after_days" in policy:
+                    cutoff = (now - timedelta(days=policy["delete_after_days"])).isoformat()
+                    expired = await self.store.find_idle_conversations(
+                        cutoff, app_name, exclude, archived=None, limit=self.batch_size)
+                    summary["deleted"] += await self._apply("deleted", expired, cutoff)
+                if "archive_after_days" in policy:
+                    cutoff = (now - timedelta(days=policy["archive_after_days"])).isoformat()
+                    idle = await self.store.find_idle_conversations(
+                        cutoff, app_name, exclude, archived=False, limit=self.batch_size)
+                    summary["archived"] += await self._apply("archived", idle, cutoff)
+            compaction = None
+            if summary["archived"] or summary["deleted"]:
+                print(f"[INFO] Archived {summary['archived']} and deleted {summary['deleted']} idle conversations")
+                compaction = await self.store.compact(self.vacuum_pages)
+                self.stats["freed_pages"] += compaction["freed_pages"]
+            self.stats["runs"] += 1
+            self.stats["last_run"] = now.isoformat()
+            self.stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return {**summary, "compaction": compaction}
+
+    async def run_forever(self):
+        """Run a pass every interval_seconds until cancelled"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[ERROR] Conversation archiving failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        """Return archiving counters and the configured policies"""
+        return {
+            **self.stats,
+            "interval_seconds": self.interval_seconds,
+            "policies": {app_name or "default": policy for app_name, policy in self._policies().items()},
+        }
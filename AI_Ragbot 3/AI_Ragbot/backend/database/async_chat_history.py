@@ -0,0 +1,306 @@
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Optional, Any, Callable
+
+from database.chat_history import ChatHistoryHandler
+from database.write_behind import WriteBehindBuffer
+from database.conversation_cache import ConversationCache
+
+
+class AsyncChatHistory:
+    """
+    Async facade over ChatHistoryHandler that keeps SQLite off the event loop.
+
+    Reads run on a bounded pool of reader threads. Writes all run on one writer thread,
+    so they are serialized in submission order and never wait on each other for the
+    SQLite write lock. Every thread keeps its own pooled WAL connection, which lets
+    readers proceed while the writer commits.
+
+    With write_behind_interval set, add_message goes through a WriteBehindBuffer that
+    commits the messages of all requests together. Reads and other writes of a
+    conversation wait for its buffered messages first, so callers still see their
+    own writes.
+
+    With cache_size > 0, recently active conversations are served from a
+    ConversationCache, updated after each write to them commits.
+
+    Archived conversations are restored on the writer thread the first time they
+    are opened or written to (the handler restores them inside the write's own
+    transaction), so callers never see their messages missing.
+
+    The handler may also be a ShardedChatHistory; then each shard gets its own writer
+    thread and a conversation's writes go to its shard's writer, so shards commit in
+    parallel while each conversation's writes stay in order. Writes that span shards
+    run on the first writer.
+    """
+
+    def __init__(self, handler: ChatHistoryHandler, max_readers: int = 4,
+                 write_behind_interval: Optional[float] = None, write_behind_max_batch: int = 256,
+                 cache_size: int = 0, cache_messages: int = 100):
+        self.handler = handler
+        self._readers = ThreadPoolExecutor(max_workers=max_readers, thread_name_prefix="chat-db-read")
+        self._writers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"chat-db-write-{index}")
+            for index in range(getattr(handler, "shard_count", 1))
+        ]
+        self._writer = self._writers[0]
+        self.write_behind: Optional[WriteBehindBuffer] = None
+        if write_behind_interval is not None:
+            self.write_behind = WriteBehindBuffer(
+                self._add_messages,
+                interval=write_behind_interval,
+                max_batch=write_behind_max_batch
+            )
+        self.cache: Optional[ConversationCache] = None
+        if cache_size > 0:
+            self.cache = ConversationCache(max_conversations=cache_size, max_messages=cache_messages)
+
+    async def run_read(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking read on the reader pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._readers, partial(fn, *args, **kwargs))
+
+    async def run_write(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking write (or several, as one unit) on the writer thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._writer, partial(fn, *args, **kwargs))
+
+    async def _writer_for(self, conversation_id: str, metadata: Optional[Dict] = None) -> ThreadPoolExecutor:
+        if len(self._writers) == 1:
+            return self._writer
+        index = self.handler.cached_shard_index(conversation_id, metadata)
+        if index is None:
+            index = await self.run_read(self.handler.shard_index, conversation_id, metadata)
+        return self._writers[index]
+
+    async def run_conversation_write(self, conversation_id: str, fn: Callable[..., Any], *args) -> Any:
+        """Run a blocking write of one conversation on its shard's writer thread"""
+        writer = await self._writer_for(conversation_id)
+        return await asyncio.get_running_loop().run_in_executor(writer, partial(fn, *args))
+
+    async def _add_messages(self, messages: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Insert messages with one transaction per writer, all writers at once"""
+        if len(self._writers) == 1:
+            return await self.run_write(self.handler.add_messages, messages)
+        groups: Dict[ThreadPoolExecutor, List[int]] = {}
+        for position, message in enumerate(messages):
+            groups.setdefault(await self._writer_for(message["conversation_id"]), []).append(position)
+        loop = asyncio.get_running_loop()
+        batches = await asyncio.gather(*(
+            loop.run_in_executor(writer, self.handler.add_messages, [messages[i] for i in positions])
+            for writer, positions in groups.items()
+        ))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        for positions, records in zip(groups.values(), batches):
+            for position, record in zip(positions, records):
+                results[position] = record
+        return results
+
+    async def _settle(self, conversation_id: str):
+        if self.write_behind is not None:
+            await self.write_behind.wait_for(conversation_id)
+
+    async def _read_restoring(self, conversation_id: str, fn: Callable[..., Any], *args) -> Dict[str, Any]:
+        """Read a conversation, restoring it from the archive first if it was archived"""
+        conversation = await self.run_read(fn, *args)
+        if conversation.get("archived_at"):
+            await self.run_conversation_write(conversation_id, self.handler.restore_conversation, conversation_id)
+            conversation = await self.run_read(fn, *args)
+        return conversation
+
+    async def _load(self, conversation_id: str, fn: Callable[..., Any], *args) -> Dict[str, Any]:
+        """Read a conversation from the database and offer it to the cache"""
+        if self.cache is None:
+            return await self._read_restoring(conversation_id, fn, *args)
+        conversation = None
+        self.cache.start_load(conversation_id)
+        try:
+            conversation = await self._read_restoring(conversation_id, fn, *args)
+        finally:
+            self.cache.finish_load(conversation_id, conversation)
+        return conversation
+
+    async def flush(self):
+        """Commit any buffered messages now"""
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+    def close(self):
+        """Finish queued work, stop the threads and close the handler's connections (flush() first)"""
+        if self.write_behind is not None and self.write_behind.pending_count():
+            print(f"[WARN] Closing chat history with {self.write_behind.pending_count()} unflushed messages")
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.handler.close()
+
+    # Writes
+
+    async def create_conversation(self, conversation_id: Optional[str] = None, title: str = "New Chat",
+                                  metadata: Optional[Dict] = None) -> str:
+        conversation_id = conversation_id or str(uuid.uuid4())
+        writer = self._writers[self.handler.route_new(conversation_id, metadata)] if len(self._writers) > 1 else self._writer
+        return await asyncio.get_running_loop().run_in_executor(
+            writer, self.handler.create_conversation, conversation_id, title, metadata)
+
+    async def add_message(self, conversation_id: str, role: str, content: str,
+                          usage: Optional[Dict[str, Any]] = None, app_name: Optional[str] = None) -> Optional[str]:
+        message = {"conversation_id": conversation_id, "role": role, "content": content,
+                   "usage": usage, "app_name": app_name}
+        if self.write_behind is not None:
+            record = await self.write_behind.submit(message)
+        else:
+            record = (await self.run_conversation_write(conversation_id, self.handler.add_messages, [message]))[0]
+        if record is None:
+            return None
+        if self.cache is not None:
+            self.cache.apply_message(conversation_id, record)
+        return record["message_id"]
+
+    async def sync_messages(self, conversation_id: str, base_seq: int, messages: List[Dict[str, str]],
+                            title: Optional[str] = None, metadata: Optional[Dict] = None) -> Dict[str, Any]:
+        await self._settle(conversation_id)
+        writer = await self._writer_for(conversation_id, metadata)
+        result = await asyncio.get_running_loop().run_in_executor(
+            writer, self.handler.sync_messages, conversation_id, base_seq, messages, title, metadata)
+        if self.cache is not None:
+            self.cache.apply_sync(conversation_id, result, title)
+        return result
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        await self._settle(conversation_id)
+        try:
+            return await self.run_conversation_write(conversation_id, self.handler.delete_conversation, conversation_id)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(conversation_id)
+
+    async def update_conversation_title(self, conversation_id: str, title: str) -> bool:
+        await self._settle(conversation_id)
+        updated = await self.run_conversation_write(conversation_id, self.handler.update_conversation_title, conversation_id, title)
+        if updated and self.cache is not None:
+            self.cache.apply_title(conversation_id, title)
+        return updated
+
+    async def update_conversation_metadata(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        await self._settle(conversation_id)
+        updated = await self.run_conversation_write(conversation_id, self.handler.update_conversation_metadata, conversation_id, updates)
+        if updated and self.cache is not None:
+            self.cache.apply_metadata(conversation_id, updates)
+        return updated
+
+    async def archive_conversation(self, conversation_id: str, idle_before: Optional[str] = None) -> bool:
+        await self._settle(conversation_id)
+        try:
+            return await self.run_conversation_write(conversation_id, self.handler.archive_conversation,
+                                                     conversation_id, idle_before)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(conversation_id)
+
+    async def compact(self, max_pages: int = 2000) -> Dict[str, Any]:
+        return await self.run_write(self.handler.compact, max_pages)
+
+    async def enable_incremental_vacuum(self) -> Dict[str, Any]:
+        return await self.run_write(self.handler.enable_incremental_vacuum)
+
+    async def import_conversations(self, records: List[Dict[str, Any]]) -> Dict[str, int]:
+        conversation_ids = {record["conversation_id"] for record in records}
+        for conversation_id in conversation_ids:
+            await self._settle(conversation_id)
+        try:
+            return await self.run_write(self.handler.import_conversations, records)
+        finally:
+            if self.cache is not None:
+                for conversation_id in conversation_ids:
+                    self.cache.invalidate(conversation_id)
+
+    async def import_files(self, files: List[Dict[str, Any]]) -> int:
+        return await self.run_write(self.handler.import_files, files)
+
+    async def record_generation(self, usage: Dict[str, Any], app_name: Optional[str] = None,
+                                conversation_id: Optional[str] = None, message_id: Optional[str] = None):
+        if conversation_id:
+            return await self.run_conversation_write(conversation_id, self.handler.record_generation,
+                                                     usage, app_name, conversation_id, message_id)
+        return await self.run_write(self.handler.record_generation, usage, app_name, conversation_id, message_id)
+
+    async def log_uploaded_file(self, filename: str, filehash: str):
+        return await self.run_write(self.handler.log_uploaded_file, filename, filehash)
+
+    async def clear_uploaded_files(self) -> int:
+        return await self.run_write(self.handler.clear_uploaded_files)
+
+    # Reads
+
+    async def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
+        await self._settle(conversation_id)
+        if self.cache is not None:
+            cached = self.cache.get_full(conversation_id)
+            if cached is not None:
+                return cached
+        return await self._load(conversation_id, self.handler.get_conversation, conversation_id)
+
+    async def get_conversation_window(self, conversation_id: str, limit: int) -> Dict[str, Any]:
+        await self._settle(conversation_id)
+        if self.cache is None:
+            return await self._read_restoring(conversation_id, self.handler.get_conversation_window,
+                                              conversation_id, limit)
+        cached = self.cache.get_window(conversation_id, limit)
+        if cached is not None:
+            return cached
+        # Load as many messages as the cache holds, so later (larger) windows hit too
+        conversation = await self._load(conversation_id, self.handler.get_conversation_window,
+                                        conversation_id, max(limit, self.cache.max_messages))
+        return ConversationCache.window(conversation, limit)
+
+    async def get_messages(self, conversation_id: str, limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+        await self._settle(conversation_id)
+        if await self.run_read(self.handler.is_archived, conversation_id):
+            await self.run_conversation_write(conversation_id, self.handler.restore_conversation, conversation_id)
+        return await self.run_read(self.handler.get_messages, conversation_id, limit, before)
+
+    async def get_message_range(self, conversation_id: str, after_seq: int, through_seq: int) -> List[Dict[str, Any]]:
+        await self._settle(conversation_id)
+        if await self.run_read(self.handler.is_archived, conversation_id):
+            await self.run_conversation_write(conversation_id, self.handler.restore_conversation, conversation_id)
+        return await self.run_read(self.handler.get_message_range, conversation_id, after_seq, through_seq)
+
+    async def get_all_conversations(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        return await self.run_read(self.handler.get_all_conversations, limit, offset)
+
+    async def search_conversations(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        return await self.run_read(self.handler.search_conversations, query, limit, offset)
+
+    async def list_conversations(self, limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+        return await self.run_read(self.handler.list_conversations, limit, before)
+
+    async def find_idle_conversations(self, idle_before: str, app_name: Optional[str] = None,
+                                      exclude_apps: Optional[List[str]] = None, archived: Optional[bool] = False,
+                                      limit: int = 200) -> List[str]:
+        return await self.run_read(self.handler.find_idle_conversations, idle_before, app_name,
+                                   exclude_apps, archived, limit)
+
+    async def export_conversations(self, after_id: Optional[str] = None, after_seq: int = 0,
+                                   max_records: int = 1000) -> Dict[str, Any]:
+        return await self.run_read(self.handler.export_conversations, after_id, after_seq, max_records)
+
+    async def export_files(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        return await self.run_read(self.handler.export_files, after_id, limit)
+
+    async def get_archive_stats(self) -> Dict[str, Any]:
+        return await self.run_read(self.handler.get_archive_stats)
+
+    async def get_message_usage(self, conversation_id: str) -> List[Dict[str, Any]]:
+        await self._settle(conversation_id)
+        return await self.run_read(self.handler.get_message_usage, conversation_id)
+
+    async def get_generation_stats(self, since: Optional[str] = None, app_name: Optional[str] = None,
+                                   model: Optional[str] = None, load_stall_ms: float = 500.0) -> List[Dict[str, Any]]:
+        return await self.run_read(self.handler.get_generation_stats, since, app_name, model, load_stall_ms)
+
+    async def is_file_already_uploaded(self, filehash: str) -> bool:
+        return await self.run_read(self.handler.is_file_already_uploaded, filehash)
+
+    async def get_uploaded_files(self) -> List[Dict[str, Any]]:
+        return await self.run_read(self.handler.get_uploaded_files)
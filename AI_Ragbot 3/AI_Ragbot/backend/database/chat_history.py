@@ -4,112 +4,175 @@ from typing import List, Dict, Optional, Any
 import sqlite3
 import json
 import os
+import re
+import zlib
+from database.sqlite_pool import SQLitePool
+from database.migrations import run_migrations, content_hash
 
 class ChatHistoryHandler:
-    def __init__(self, db_path: str = "./database/chat_history.db"):
-        """Initialize the chat history handler with a SQLite database."""
+    def __init__(self, db_path: str = "./database/chat_history.db", pragmas: Optional[Dict[str, Any]] = None):
+        """Initialize the chat history handler with a SQLite database (pooled WAL connections)."""
         self.db_path = db_path
         db_dir = os.path.dirname(self.db_path)         
         if db_dir and not os.path.exists(db_dir):             
             os.makedirs(db_dir, exist_ok=True)
+        self.pool = SQLitePool(self.db_path, pragmas)
         self._init_db()
 
-    def _init_db(self):
-        """Initialize the database with required tables if they don't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create conversations table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            conversation_id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            created_at TIMESTAMP NOT NULL,
-            updated_at TIMESTAMP NOT NULL,
-            metadata TEXT
-        )
-        ''')
-
-        # Create messages table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            message_id TEXT PRIMARY KEY,
-            conversation_id TEXT NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp TIMESTAMP NOT NULL,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
-        )
-        ''')
-
-        # Create uploaded_files table for file deduplication
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS uploaded_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            filehash TEXT UNIQUE
-        )
-        ''')
+    def close(self):
+        """Close all pooled connections."""
+        self.pool.close_all()
 
-        conn.commit()
-        conn.close()
+    def _init_db(self):
+        """Create or upgrade the database schema to the latest migration."""
+        with self.pool.connection() as conn:
+            run_migrations(conn)
 
-    def create_conversation(self, conversation_id: str, title: str = "New Chat",  metadata: Optional[Dict] = None) -> str:
+    def create_conversation(self, conversation_id: Optional[str] = None, title: str = "New Chat",  metadata: Optional[Dict] = None) -> str:
         """Create a new conversation and return its ID."""
             # If conversation_id is not passed, generate a new one
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
 
         now = datetime.now().isoformat()
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO conversations (conversation_id, title, created_at, updated_at, metadata) VALUES (?, ?, ?, ?, ?)",
-            (conversation_id, title, now, now, json.dumps(metadata or {}))
-        )
-        conn.commit()
-        conn.close()
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO conversations (conversation_id, title, created_at, updated_at, metadata, app_name)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (conversation_id, title, now, now, json.dumps(metadata or {}), (metadata or {}).get("app_name"))
+            )
         return conversation_id
-    def add_message(self, conversation_id: str, role: str, content: str) -> Optional[str]:
-        """Add a message to a conversation if it doesn't already exist. Return message ID or None."""
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    usage: Optional[Dict[str, Any]] = None, app_name: Optional[str] = None) -> Optional[str]:
+        """
+        Add a message to a conversation if it doesn't already exist. Return message ID or None.
+
+        usage holds Ollama's token/timing counters for a generated message; it is stored
+        in generation_stats in the same transaction, tagged with app_name.
+        """
         print('Attempting to add message to conversation_id:', conversation_id)
 
-        now = datetime.now().isoformat()
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Check for exact duplicate
-        cursor.execute("""
-            SELECT COUNT(*) FROM messages
-            WHERE conversation_id = ? AND role = ? AND content = ?
-        """, (conversation_id, role, content.strip()))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-            print(f"[INFO] Duplicate message detected and skipped: {role} – {content[:60]}")
-            conn.close()
+        with self.pool.cursor() as cursor:
+            record = self._insert_message(cursor, conversation_id, role, content, usage, app_name)
+        if not record:
             return None
+        print('Successfully added message_id:', record["message_id"])
+        return record["message_id"]
 
-        # Proceed with insert
-        message_id = str(uuid.uuid4())
+    def add_messages(self, messages: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Add several messages (add_message keyword arguments) in one transaction.
+
+        Returns the stored record (message_id, seq, role, content, timestamp) for each,
+        or None where it was a duplicate.
+        """
+        with self.pool.cursor() as cursor:
+            return [self._insert_message(cursor, **message) for message in messages]
 
-        # Update the conversation's updated_at timestamp
+    def _insert_message(self, cursor, conversation_id: str, role: str, content: str,
+                        usage: Optional[Dict[str, Any]] = None, app_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        now = datetime.now().isoformat()
+        message_id = str(uuid.uuid4())
+        # Bring back archived messages first, so the duplicate check below sees them
+        self._restore_archived(cursor, conversation_id)
+        # The unique (conversation_id, role, content_hash) index rejects exact duplicates
         cursor.execute(
-            "UPDATE conversations SET updated_at = ? WHERE conversation_id = ?",
-            (now, conversation_id)
+            """INSERT OR IGNORE INTO messages (message_id, conversation_id, role, content, timestamp, content_hash, seq)
+               VALUES (?, ?, ?, ?, ?, ?, (SELECT last_seq + 1 FROM conversations WHERE conversation_id = ?))""",
+            (message_id, conversation_id, role, content.strip(), now, content_hash(content), conversation_id)
         )
+        if cursor.rowcount == 0:
+            if self._is_duplicate(cursor, conversation_id, role, content):
+                print(f"[INFO] Duplicate message detected and skipped: {role} – {content[:60]}")
+                return None
+            # Not a duplicate: last_seq fell behind the stored messages (e.g. after an import)
+            self._resync_sequence(cursor, conversation_id)
+            cursor.execute(
+                """INSERT INTO messages (message_id, conversation_id, role, content, timestamp, content_hash, seq)
+                   VALUES (?, ?, ?, ?, ?, ?, (SELECT last_seq + 1 FROM conversations WHERE conversation_id = ?))""",
+                (message_id, conversation_id, role, content.strip(), now, content_hash(content), conversation_id)
+            )
 
-        # Insert the new message
+        # Update the conversation's updated_at timestamp, message count and sequence
         cursor.execute(
-            "INSERT INTO messages (message_id, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
-            (message_id, conversation_id, role, content.strip(), now)
+            """UPDATE conversations SET updated_at = ?, message_count = message_count + 1, last_seq = last_seq + 1
+               WHERE conversation_id = ?""",
+            (now, conversation_id)
         )
+        if usage:
+            self._insert_generation_stats(cursor, usage, app_name, conversation_id, message_id, now)
+        cursor.execute("SELECT last_seq FROM conversations WHERE conversation_id = ?", (conversation_id,))
+        row = cursor.fetchone()
+        return {"message_id": message_id, "seq": row[0] if row else None, "role": role,
+                "content": content.strip(), "timestamp": now}
 
-        conn.commit()
-        conn.close()
+    def sync_messages(self, conversation_id: str, base_seq: int, messages: List[Dict[str, str]],
+                      title: Optional[str] = None, metadata: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Apply a client's new messages to a conversation in one transaction.
+
+        messages are the ones the client added after base_seq, the last sequence number
+        it acknowledged. The conversation is created (with title and metadata) if it
+        doesn't exist, otherwise title replaces the current one when given. Messages the
+        conversation already holds are skipped, so a retried sync is harmless.
+
+        Returns last_seq, how many messages were applied and every message with a
+        sequence number above base_seq (the client's own and any written elsewhere).
+        """
+        now = datetime.now().isoformat()
+        with self.pool.cursor() as cursor:
+            # Write first so the transaction holds the write lock before reading last_seq
+            cursor.execute(
+                """INSERT OR IGNORE INTO conversations (conversation_id, title, created_at, updated_at, metadata, app_name)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (conversation_id, title or "New Chat", now, now, json.dumps(metadata or {}),
+                 (metadata or {}).get("app_name"))
+            )
+            if cursor.rowcount == 0:
+                if title:
+                    cursor.execute("UPDATE conversations SET title = ? WHERE conversation_id = ?", (title, conversation_id))
+                self._restore_archived(cursor, conversation_id)
+            cursor.execute("SELECT last_seq FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            last_seq = cursor.fetchone()[0]
 
-        print('Successfully added message_id:', message_id)
-        return message_id
+            applied = uncounted = 0
+            for message in messages:
+                content = message["content"].strip()
+                cursor.execute(
+                    """INSERT OR IGNORE INTO messages (message_id, conversation_id, role, content, timestamp, content_hash, seq)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (str(uuid.uuid4()), conversation_id, message["role"], content, now, content_hash(content),
+                     last_seq + 1)
+                )
+                inserted = cursor.rowcount
+                if not inserted and not self._is_duplicate(cursor, conversation_id, message["role"], content):
+                    # Not a duplicate: last_seq fell behind the stored messages (e.g. after an import)
+                    last_seq, uncounted = self._resync_sequence(cursor, conversation_id), 0
+                    cursor.execute(
+                        """INSERT INTO messages (message_id, conversation_id, role, content, timestamp, content_hash, seq)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (str(uuid.uuid4()), conversation_id, message["role"], content, now, content_hash(content),
+                         last_seq + 1)
+                    )
+                    inserted = cursor.rowcount
+                if inserted:
+                    last_seq += 1
+                    applied += 1
+                    uncounted += 1
+            if applied:
+                cursor.execute(
+                    """UPDATE conversations SET updated_at = ?, message_count = message_count + ?, last_seq = ?
+                       WHERE conversation_id = ?""",
+                    (now, uncounted, last_seq, conversation_id)
+                )
+
+            cursor.execute(
+                """SELECT message_id, seq, role, content, timestamp FROM messages
+                   WHERE conversation_id = ? AND seq > ? ORDER BY seq""",
+                (conversation_id, base_seq)
+            )
+            newer = [dict(row) for row in cursor.fetchall()]
+        return {"conversation_id": conversation_id, "last_seq": last_seq, "applied": applied, "messages": newer}
 
     # def add_message(self, conversation_id: str, role: str, content: str) -> str:
     #     """Add a message to a conversation and return the message ID."""
@@ -168,100 +231,649 @@ class ChatHistoryHandler:
     #     return message_id
 
 
-    def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
-        """Get a conversation by its ID, including all messages."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        # Get conversation details
-        print('reading message to conversation_id   '+conversation_id)
-        cursor.execute("SELECT * FROM conversations WHERE conversation_id = ?", (conversation_id,))
-        conversation_row = cursor.fetchone()
-        if not conversation_row:
-            conn.close()
-            raise ValueError(f"Conversation with ID {conversation_id} not found")
-        conversation = dict(conversation_row)
-        conversation['metadata'] = json.loads(conversation['metadata'])
-        # Get messages for this conversation
+    @staticmethod
+    def _is_duplicate(cursor, conversation_id: str, role: str, content: str) -> bool:
+        """Whether the conversation already holds this exact message (the dedup index's key)"""
         cursor.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC", 
-            (conversation_id,)
+            "SELECT 1 FROM messages WHERE conversation_id = ? AND role = ? AND content_hash = ?",
+            (conversation_id, role, content_hash(content))
         )
-        messages = [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchone() is not None
+
+    def _resync_sequence(self, cursor, conversation_id: str) -> int:
+        """Bring last_seq and message_count up to the stored messages and return last_seq"""
+        print(f"[WARN] Sequence of conversation {conversation_id} was behind its messages; resyncing")
+        self._reconcile_counts(cursor, [conversation_id])
+        cursor.execute("SELECT last_seq FROM conversations WHERE conversation_id = ?", (conversation_id,))
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def _reconcile_counts(cursor, conversation_ids: List[str]):
+        """Recompute last_seq and message_count of conversations from their messages (and archive)"""
+        cursor.executemany(
+            """UPDATE conversations SET
+                   last_seq = MAX(last_seq, COALESCE((SELECT MAX(seq) FROM messages
+                                                      WHERE messages.conversation_id = conversations.conversation_id), 0)),
+                   message_count = (SELECT COUNT(*) FROM messages
+                                    WHERE messages.conversation_id = conversations.conversation_id)
+                                 + COALESCE((SELECT message_count FROM conversation_archive
+                                             WHERE conversation_archive.conversation_id = conversations.conversation_id), 0)
+               WHERE conversation_id = ?""",
+            [(conversation_id,) for conversation_id in conversation_ids]
+        )
+
+    def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
+        """Get a conversation by its ID, including all messages."""
+        with self.pool.cursor() as cursor:
+            # Get conversation details
+            print('reading message to conversation_id   '+conversation_id)
+            cursor.execute("SELECT * FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            conversation_row = cursor.fetchone()
+            if not conversation_row:
+                raise ValueError(f"Conversation with ID {conversation_id} not found")
+            conversation = dict(conversation_row)
+            conversation['metadata'] = json.loads(conversation['metadata'])
+            # Get messages for this conversation, in write order (messages synced together share a timestamp)
+            cursor.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY seq, rowid", 
+                (conversation_id,)
+            )
+            messages = [dict(row) for row in cursor.fetchall()]
         conversation['messages'] = messages
-        conn.close()
         # print(conversation['messages'])
         return conversation
 
+    def _fetch_messages(self, cursor, conversation_id: str, limit: int,
+                        before: Optional[str] = None) -> Dict[str, Any]:
+        """Up to limit messages older than the before cursor (newest first in SQL, returned oldest first)."""
+        if before:
+            cursor.execute(
+                "SELECT timestamp, rowid FROM messages WHERE message_id = ? AND conversation_id = ?",
+                (before, conversation_id)
+            )
+            anchor = cursor.fetchone()
+            if not anchor:
+                raise ValueError(f"Unknown message cursor {before}")
+            cursor.execute(
+                """SELECT message_id, conversation_id, seq, role, content, timestamp FROM messages
+                   WHERE conversation_id = ? AND (timestamp, rowid) < (?, ?)
+                   ORDER BY timestamp DESC, rowid DESC LIMIT ?""",
+                (conversation_id, anchor[0], anchor[1], limit + 1)
+            )
+        else:
+            cursor.execute(
+                """SELECT message_id, conversation_id, seq, role, content, timestamp FROM messages
+                   WHERE conversation_id = ?
+                   ORDER BY timestamp DESC, rowid DESC LIMIT ?""",
+                (conversation_id, limit + 1)
+            )
+        rows = [dict(row) for row in cursor.fetchall()]
+        has_more = len(rows) > limit
+        messages = rows[:limit][::-1]
+        return {
+            "messages": messages,
+            "has_more": has_more,
+            "next_cursor": messages[0]["message_id"] if has_more else None,
+        }
+
+    def get_messages(self, conversation_id: str, limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a conversation's messages, newest page first.
+
+        Returns the messages in chronological order, has_more and next_cursor; pass
+        next_cursor as before to get the page of older messages.
+        """
+        with self.pool.cursor() as cursor:
+            return self._fetch_messages(cursor, conversation_id, limit, before)
+
+    def get_conversation_window(self, conversation_id: str, limit: int) -> Dict[str, Any]:
+        """Get a conversation with only its last limit messages (plus message_count and the paging cursor)."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT * FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            conversation_row = cursor.fetchone()
+            if not conversation_row:
+                raise ValueError(f"Conversation with ID {conversation_id} not found")
+            conversation = dict(conversation_row)
+            conversation['metadata'] = json.loads(conversation['metadata'])
+            conversation.update(self._fetch_messages(cursor, conversation_id, limit))
+        return conversation
+
+    def get_message_range(self, conversation_id: str, after_seq: int, through_seq: int) -> List[Dict[str, Any]]:
+        """Messages with after_seq < seq <= through_seq, oldest first (seq runs 1, 2, ... per conversation)."""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """SELECT message_id, conversation_id, seq, role, content, timestamp FROM messages
+                   WHERE conversation_id = ? AND seq > ? AND seq <= ? ORDER BY seq""",
+                (conversation_id, after_seq, through_seq)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """Turn free text into an FTS5 query matching all its words (no FTS syntax from users)"""
+        return " ".join(f'"{term}"' for term in re.findall(r"\w+", query))
+
+    def search_conversations(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Full-text search over message content, ranked by conversation.
+
+        Each result is a conversation with its best BM25 score, how many of its messages
+        matched and a highlighted snippet of the best matching message. Only the index
+        and the matched rows are read, never the whole messages table. Archived
+        conversations have no indexed messages, so they don't match until restored.
+        """
+        match = self._fts_query(query)
+        if not match:
+            return {"results": [], "has_more": False}
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """WITH hits AS (
+                       SELECT rowid AS id, rank AS score FROM messages_fts WHERE messages_fts MATCH ?
+                   )
+                   SELECT m.conversation_id, c.title, c.updated_at, MIN(h.score) AS score, COUNT(*) AS matches,
+                          h.id AS best_id, m.message_id, m.role, m.timestamp
+                   FROM hits h
+                   JOIN messages m ON m.rowid = h.id
+                   JOIN conversations c ON c.conversation_id = m.conversation_id
+                   GROUP BY m.conversation_id
+                   ORDER BY score, m.conversation_id
+                   LIMIT ? OFFSET ?""",
+                (match, limit + 1, offset)
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            # Snippets only for the page's best messages
+            snippets = {}
+            if rows:
+                ids = [row["best_id"] for row in rows]
+                cursor.execute(
+                    f"""SELECT rowid, snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) FROM messages_fts
+                        WHERE messages_fts MATCH ? AND rowid IN ({", ".join("?" * len(ids))})""",
+                    [match] + ids
+                )
+                snippets = dict(cursor.fetchall())
+        for row in rows:
+            row["snippet"] = snippets.get(row.pop("best_id"), "")
+            row["score"] = round(-row["score"], 6)
+        return {"results": rows, "has_more": has_more}
+
+    def rebuild_search_index(self):
+        """Re-index every message for full-text search (needed after VACUUM renumbers rowids)."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
     def get_all_conversations(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """Get a list of all conversations with their basic info (not including messages)."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ? OFFSET ?", 
-            (limit, offset)
-        )
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ? OFFSET ?", 
+                (limit, offset)
+            )
+            rows = cursor.fetchall()
         conversations = []
-        for row in cursor.fetchall():
+        for row in rows:
             conversation = dict(row)
             conversation['metadata'] = json.loads(conversation['metadata'])
             conversations.append(conversation)
-            print(conversations)
-        conn.close()
         return conversations
 
+    def list_conversations(self, limit: int = 50, before: Optional[str] = None,
+                           preview_chars: int = 120) -> Dict[str, Any]:
+        """
+        Get one page of the conversation list, most recently updated first.
+
+        Each row has only conversation_id, title, updated_at, message_count and the role
+        and first preview_chars characters of the last message; metadata is left out
+        (get_conversation has it). Pass next_cursor as before for the next page.
+        """
+        if before:
+            updated_at, sep, conversation_id = before.partition("|")
+            if not sep:
+                raise ValueError(f"Invalid conversation cursor {before}")
+            where, params = "WHERE (c.updated_at, c.conversation_id) < (?, ?)", [updated_at, conversation_id]
+        else:
+            where, params = "", []
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                f"""SELECT c.conversation_id, c.title, c.updated_at, c.message_count, c.archived_at,
+                           m.role AS last_role, substr(m.content, 1, ?) AS preview
+                    FROM conversations c
+                    LEFT JOIN messages m ON m.conversation_id = c.conversation_id AND m.seq = c.last_seq
+                    {where}
+                    ORDER BY c.updated_at DESC, c.conversation_id DESC
+                    LIMIT ?""",
+                [preview_chars] + params + [limit + 1]
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['updated_at']}|{rows[-1]['conversation_id']}" if has_more else None
+        return {"conversations": rows, "has_more": has_more, "next_cursor": next_cursor}
+
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation and all its messages."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        try:
+        with self.pool.cursor() as cursor:
             # Delete messages first due to foreign key constraint
             cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            cursor.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
             cursor.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
             affected = cursor.rowcount
-            conn.commit()
-            conn.close()
-            return affected > 0
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+        return affected > 0
+
+    def find_idle_conversations(self, idle_before: str, app_name: Optional[str] = None,
+                                exclude_apps: Optional[List[str]] = None, archived: Optional[bool] = False,
+                                limit: int = 200) -> List[str]:
+        """
+        IDs of conversations last updated before idle_before (ISO timestamp).
+
+        app_name selects one app's conversations; without it, conversations of any app
+        not in exclude_apps (or without an app) are selected. archived=False/True limits
+        the result to live/archived conversations, None returns both.
+        """
+        conditions, params = ["updated_at < ?"], [idle_before]
+        if app_name:
+            conditions.append("app_name = ?")
+            params.append(app_name)
+        elif exclude_apps:
+            conditions.append(f"(app_name IS NULL OR app_name NOT IN ({', '.join('?' * len(exclude_apps))}))")
+            params.extend(exclude_apps)
+        if archived is not None:
+            conditions.append("archived_at IS NOT NULL" if archived else "archived_at IS NULL")
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                f"SELECT conversation_id FROM conversations WHERE {' AND '.join(conditions)} "
+                f"ORDER BY updated_at LIMIT ?",
+                params + [limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def archive_conversation(self, conversation_id: str, idle_before: Optional[str] = None) -> bool:
+        """
+        Move a conversation's messages into one zlib-compressed blob in conversation_archive.
+
+        With idle_before (ISO timestamp) the conversation is only archived if it is still
+        idle, checked in the same transaction, so one that just became active is left alone.
+        The conversation row stays (with archived_at set) so it still appears in the list;
+        restore_conversation() brings the messages back unchanged. Archived messages are
+        not in the full-text index, so search doesn't find them until they are restored.
+        """
+        now = datetime.now().isoformat()
+        idle_condition = " AND updated_at < ?" if idle_before else ""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                "UPDATE conversations SET archived_at = ? WHERE conversation_id = ? AND archived_at IS NULL"
+                + idle_condition,
+                (now, conversation_id) + ((idle_before,) if idle_before else ())
+            )
+            if cursor.rowcount == 0:
+                return False
+            cursor.execute(
+                """SELECT message_id, seq, role, content, timestamp, content_hash FROM messages
+                   WHERE conversation_id = ? ORDER BY seq, rowid""",
+                (conversation_id,)
+            )
+            messages = [list(row) for row in cursor.fetchall()]
+            raw = json.dumps({"messages": messages}).encode("utf-8")
+            cursor.execute(
+                """INSERT OR REPLACE INTO conversation_archive
+                   (conversation_id, archived_at, message_count, raw_bytes, payload) VALUES (?, ?, ?, ?, ?)""",
+                (conversation_id, now, len(messages), len(raw), zlib.compress(raw, 6))
+            )
+            cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        return True
+
+    def is_archived(self, conversation_id: str) -> bool:
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT archived_at FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            row = cursor.fetchone()
+        return bool(row and row[0])
+
+    def restore_conversation(self, conversation_id: str) -> bool:
+        """Put an archived conversation's messages back; returns False if it wasn't archived."""
+        with self.pool.cursor() as cursor:
+            return self._restore_archived(cursor, conversation_id)
+
+    def _restore_archived(self, cursor, conversation_id: str) -> bool:
+        """Restore an archived conversation inside the caller's transaction (no-op if it isn't archived)"""
+        cursor.execute("SELECT payload FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        messages = json.loads(zlib.decompress(row[0]).decode("utf-8"))["messages"]
+        cursor.executemany(
+            """INSERT OR IGNORE INTO messages (message_id, seq, role, content, timestamp, content_hash, conversation_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [message + [conversation_id] for message in messages]
+        )
+        if cursor.rowcount != len(messages):
+            print(f"[WARN] {len(messages) - cursor.rowcount} archived messages of {conversation_id} "
+                  f"duplicated existing ones and were not restored")
+        cursor.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute("UPDATE conversations SET archived_at = NULL WHERE conversation_id = ?", (conversation_id,))
+        print(f"[INFO] Restored archived conversation {conversation_id} ({len(messages)} messages)")
+        return True
+
+    def compact(self, max_pages: int = 2000) -> Dict[str, Any]:
+        """
+        Return up to max_pages free pages to the filesystem with PRAGMA incremental_vacuum
+        and checkpoint the WAL.
+
+        Only databases in incremental auto-vacuum mode can release pages this way; others
+        are left untouched (mode "none") until enable_incremental_vacuum() is run.
+        """
+        conn = self.pool.get()
+        conn.commit()
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        mode = "none"
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            mode = "incremental"
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {
+            "mode": mode,
+            "freed_pages": free_before - free_after,
+            "free_pages": free_after,
+            "size_bytes": page_size * page_count,
+        }
+
+    def enable_incremental_vacuum(self) -> Dict[str, Any]:
+        """
+        Switch the database to incremental auto-vacuum so compact() can release pages.
+
+        This is a one-time maintenance step: it runs a full VACUUM (and a search index
+        rebuild, as VACUUM may renumber rowids), which rewrites the whole file and blocks
+        every other write while it runs.
+        """
+        conn = self.pool.get()
+        conn.commit()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return {"changed": False, "size_bytes": self._size_bytes(conn)}
+        before = self._size_bytes(conn)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        self.rebuild_search_index()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return {"changed": True, "size_bytes_before": before, "size_bytes": self._size_bytes(conn)}
+
+    @staticmethod
+    def _size_bytes(conn) -> int:
+        return conn.execute("PRAGMA page_size").fetchone()[0] * conn.execute("PRAGMA page_count").fetchone()[0]
+
+    def get_archive_stats(self) -> Dict[str, Any]:
+        """Count archived conversations and their raw vs. compressed size."""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(raw_bytes), 0),
+                          COALESCE(SUM(LENGTH(payload)), 0) FROM conversation_archive"""
+            )
+            conversations, messages, raw_bytes, stored_bytes = cursor.fetchone()
+        return {"conversations": conversations, "messages": messages,
+                "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}
+
+    def export_conversations(self, after_id: Optional[str] = None, after_seq: int = 0,
+                             max_records: int = 1000) -> Dict[str, Any]:
+        """
+        Read the next max_records export records after the (after_id, after_seq) position.
+
+        Records are conversations (in conversation_id order, each with its archive blob if
+        archived) followed by their messages (in seq order). Returns the records, the
+        position to continue from and whether the export is done.
+        """
+        records: List[Dict[str, Any]] = []
+        with self.pool.cursor() as cursor:
+            while True:
+                if after_id is not None:
+                    cursor.execute(
+                        """SELECT message_id, conversation_id, seq, role, content, timestamp, content_hash
+                           FROM messages WHERE conversation_id = ? AND seq > ? ORDER BY seq LIMIT ?""",
+                        (after_id, after_seq, max_records - len(records))
+                    )
+                    messages = [{"type": "message", **dict(row)} for row in cursor.fetchall()]
+                    records.extend(messages)
+                    if messages:
+                        after_seq = messages[-1]["seq"]
+                    if len(records) >= max_records:
+                        return {"records": records, "after_id": after_id, "after_seq": after_seq, "done": False}
+                cursor.execute(
+                    "SELECT * FROM conversations WHERE conversation_id > ? ORDER BY conversation_id LIMIT 1",
+                    (after_id or "",)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return {"records": records, "after_id": after_id, "after_seq": after_seq, "done": True}
+                conversation = {"type": "conversation", **dict(row)}
+                conversation["metadata"] = json.loads(conversation["metadata"])
+                if conversation.get("archived_at"):
+                    cursor.execute(
+                        "SELECT archived_at, message_count, raw_bytes, payload FROM conversation_archive WHERE conversation_id = ?",
+                        (conversation["conversation_id"],)
+                    )
+                    archive = cursor.fetchone()
+                    conversation["archive"] = dict(archive) if archive else None
+                records.append(conversation)
+                after_id, after_seq = conversation["conversation_id"], 0
+
+    def import_conversations(self, records: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Insert exported conversation and message records in one transaction.
+
+        Existing conversations and messages (by id) are left as they are, so an
+        interrupted import can simply be run again. The conversation record holds
+        last_seq and message_count as of when it was exported; messages written to the
+        source after that arrive later in the export, so the counts of every conversation
+        that received messages are recomputed from its rows at the end of the batch.
+        """
+        imported = {"conversations": 0, "messages": 0}
+        checked, inserted = set(), set()
+        with self.pool.cursor() as cursor:
+            for record in records:
+                if record["type"] == "conversation":
+                    metadata = record.get("metadata") or {}
+                    cursor.execute(
+                        """INSERT OR IGNORE INTO conversations (conversation_id, title, created_at, updated_at, metadata,
+                               message_count, last_seq, archived_at, app_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (record["conversation_id"], record.get("title") or "New Chat", record["created_at"],
+                         record["updated_at"], json.dumps(metadata), record.get("message_count") or 0,
+                         record.get("last_seq") or 0, record.get("archived_at"),
+                         record.get("app_name") or metadata.get("app_name"))
+                    )
+                    if cursor.rowcount == 0:
+                        continue
+                    imported["conversations"] += 1
+                    archive = record.get("archive")
+                    if archive:
+                        cursor.execute(
+                            """INSERT OR IGNORE INTO conversation_archive
+                               (conversation_id, archived_at, message_count, raw_bytes, payload) VALUES (?, ?, ?, ?, ?)""",
+                            (record["conversation_id"], archive["archived_at"], archive["message_count"],
+                             archive["raw_bytes"], archive["payload"])
+                        )
+                else:
+                    if record["conversation_id"] not in checked:
+                        # Like any write, messages go into a restored conversation, not next to its archive
+                        self._restore_archived(cursor, record["conversation_id"])
+                        checked.add(record["conversation_id"])
+                    cursor.execute(
+                        """INSERT OR IGNORE INTO messages (message_id, conversation_id, seq, role, content, timestamp, content_hash)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (record["message_id"], record["conversation_id"], record["seq"], record["role"],
+                         record["content"], record["timestamp"], record.get("content_hash") or content_hash(record["content"]))
+                    )
+                    imported["messages"] += cursor.rowcount
+                    if cursor.rowcount:
+                        inserted.add(record["conversation_id"])
+            self._reconcile_counts(cursor, sorted(inserted))
+        return imported
+
+    def export_files(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Logged uploaded files with id > after_id, oldest first."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT id, filename, filehash FROM uploaded_files WHERE id > ? ORDER BY id LIMIT ?",
+                           (after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def import_files(self, files: List[Dict[str, Any]]) -> int:
+        """Log exported uploaded files (skipping known hashes) and return how many were added."""
+        with self.pool.cursor() as cursor:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO uploaded_files (filename, filehash) VALUES (?, ?)",
+                [(file["filename"], file["filehash"]) for file in files]
+            )
+            return cursor.rowcount
 
     def update_conversation_title(self, conversation_id: str, title: str) -> bool:
         """Update the title of a conversation."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                "UPDATE conversations SET title = ? WHERE conversation_id = ?",
+                (title, conversation_id)
+            )
+            affected = cursor.rowcount
+        return affected > 0
+
+    def update_conversation_metadata(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        """Merge the given keys into a conversation's metadata in a single transaction."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT metadata FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            metadata = json.loads(row[0] or "{}")
+            metadata.update(updates)
+            cursor.execute(
+                "UPDATE conversations SET metadata = ? WHERE conversation_id = ?",
+                (json.dumps(metadata), conversation_id)
+            )
+        return True
+
+    def _insert_generation_stats(self, cursor, usage: Dict[str, Any], app_name: Optional[str],
+                                 conversation_id: Optional[str], message_id: Optional[str], now: str):
         cursor.execute(
-            "UPDATE conversations SET title = ? WHERE conversation_id = ?",
-            (title, conversation_id)
+            """INSERT INTO generation_stats (message_id, conversation_id, app_name, model, prompt_eval_count,
+                   eval_count, prompt_eval_duration, eval_duration, load_duration, total_duration, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (message_id, conversation_id, app_name or "default", usage.get("model") or "unknown",
+             usage.get("prompt_eval_count"), usage.get("eval_count"), usage.get("prompt_eval_duration"),
+             usage.get("eval_duration"), usage.get("load_duration"), usage.get("total_duration"), now)
         )
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return affected > 0
+
+    def record_generation(self, usage: Dict[str, Any], app_name: Optional[str] = None,
+                          conversation_id: Optional[str] = None, message_id: Optional[str] = None):
+        """Store token/timing counters for a generation that isn't saved as a message"""
+        if not usage:
+            return
+        with self.pool.cursor() as cursor:
+            self._insert_generation_stats(cursor, usage, app_name, conversation_id, message_id,
+                                          datetime.now().isoformat())
+
+    def get_message_usage(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get the token/timing counters stored with a conversation's generated messages."""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM generation_stats WHERE conversation_id = ? ORDER BY created_at ASC",
+                (conversation_id,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_generation_stats(self, since: Optional[str] = None, app_name: Optional[str] = None,
+                             model: Optional[str] = None, load_stall_ms: float = 500.0) -> List[Dict[str, Any]]:
+        """
+        Aggregate generation counters by app and model.
+
+        Returns per group the number of generations, prompt and completion tokens,
+        prefill (prompt eval), decode and model-load time in ms, tokens/sec for
+        prefill and decode, and how many generations waited longer than
+        load_stall_ms for the model to load.
+        """
+        return self.format_generation_stats(self.get_generation_totals(since, app_name, model, load_stall_ms))
+
+    def get_generation_totals(self, since: Optional[str] = None, app_name: Optional[str] = None,
+                              model: Optional[str] = None, load_stall_ms: float = 500.0) -> List[Dict[str, Any]]:
+        """Summed generation counters (ns) by app and model, before formatting"""
+        conditions, params = [], []
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if app_name:
+            conditions.append("app_name = ?")
+            params.append(app_name)
+        if model:
+            conditions.append("model = ?")
+            params.append(model)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.pool.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT app_name, model,
+                       COUNT(*) AS generations,
+                       COALESCE(SUM(prompt_eval_count), 0) AS prompt_tokens,
+                       COALESCE(SUM(eval_count), 0) AS completion_tokens,
+                       COALESCE(SUM(prompt_eval_duration), 0) AS prompt_eval_ns,
+                       COALESCE(SUM(eval_duration), 0) AS eval_ns,
+                       COALESCE(SUM(load_duration), 0) AS load_ns,
+                       COALESCE(SUM(total_duration), 0) AS total_ns,
+                       SUM(CASE WHEN load_duration > ? THEN 1 ELSE 0 END) AS load_stalls,
+                       COALESCE(MAX(load_duration), 0) AS max_load_ns
+                FROM generation_stats {where}
+                GROUP BY app_name, model
+                ORDER BY total_ns DESC
+            """, [load_stall_ms * 1e6] + params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def format_generation_stats(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Turn summed generation counters into ms and tokens/sec per app and model"""
+        stats = []
+        for row in rows:
+            prompt_eval_s = row["prompt_eval_ns"] / 1e9
+            eval_s = row["eval_ns"] / 1e9
+            stats.append({
+                "app_name": row["app_name"],
+                "model": row["model"],
+                "generations": row["generations"],
+                "prompt_tokens": row["prompt_tokens"],
+                "completion_tokens": row["completion_tokens"],
+                "prefill_ms": round(row["prompt_eval_ns"] / 1e6, 1),
+                "decode_ms": round(row["eval_ns"] / 1e6, 1),
+                "load_ms": round(row["load_ns"] / 1e6, 1),
+                "total_ms": round(row["total_ns"] / 1e6, 1),
+                "prefill_tokens_per_sec": round(row["prompt_tokens"] / prompt_eval_s, 1) if prompt_eval_s else None,
+                "decode_tokens_per_sec": round(row["completion_tokens"] / eval_s, 1) if eval_s else None,
+                "load_stalls": row["load_stalls"],
+                "max_load_ms": round(row["max_load_ns"] / 1e6, 1),
+            })
+        return stats
 
     def is_file_already_uploaded(self, filehash: str) -> bool:
         """Check if a file with the given hash already exists in the database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM uploaded_files WHERE filehash = ?", (filehash,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM uploaded_files WHERE filehash = ?", (filehash,))
+            result = cursor.fetchone()
         return result is not None
 
     def log_uploaded_file(self, filename: str, filehash: str):
         """Log a new uploaded file in the database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         try:
-            cursor.execute(
-                "INSERT INTO uploaded_files (filename, filehash) VALUES (?, ?)",
-                (filename, filehash)
-            )
-            conn.commit()
+            with self.pool.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO uploaded_files (filename, filehash) VALUES (?, ?)",
+                    (filename, filehash)
+                )
         except sqlite3.IntegrityError:
             # File already exists, skip
             pass
-        finally:
-            conn.close()
\ No newline at end of file
+
+    def get_uploaded_files(self) -> List[Dict[str, Any]]:
+        """Get all logged uploaded files, newest first."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT id, filename, filehash FROM uploaded_files ORDER BY id DESC")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def clear_uploaded_files(self) -> int:
+        """Remove every logged uploaded file and return how many were removed."""
+        with self.pool.cursor() as cursor:
+            cursor.execute("DELETE FROM uploaded_files")
+            return cursor.rowcount
\ No newline at end of file
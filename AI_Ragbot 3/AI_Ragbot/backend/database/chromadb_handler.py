@@ -45,6 +45,8 @@ class ChromaDBHandler:
         # Normalize path
         self.persist_directory = os.path.abspath(os.path.expanduser(persist_directory))
         self.db: Dict[str, Dict] = {}
+        # Bumped on every change to the collection so caches keyed on it go stale
+        self.collection_version = 0
 
         print(f"Using persistence directory: {self.persist_directory}")
 
@@ -122,6 +124,7 @@ class ChromaDBHandler:
         )
 
         # No manual persist needed: auto-persistence enabled.
+        self.collection_version += 1
 
         # Update in-memory store
         for doc_id, text, emb, meta in zip(ids, documents, embeddings, metadatas):
@@ -135,6 +138,14 @@ class ChromaDBHandler:
         top_k: int = 5
     ) -> List[dict]:
         query_embedding = self.embedder.embed_query(query)
+        return self.similarity_search_by_embedding(query_embedding, top_k)
+
+    def similarity_search_by_embedding(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5
+    ) -> List[dict]:
+        """Search with an already computed query embedding (avoids embedding the query twice)"""
         try:
             results = self.collection.query(
                 query_embeddings=[query_embedding],
@@ -152,15 +163,71 @@ class ChromaDBHandler:
         )
         return [{"id": i, "content": t, "metadata": m} for i, t, m in zip(ids, texts, metas)]
 
+    def similarity_search_by_embeddings(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5
+    ) -> List[List[dict]]:
+        """Search for several query embeddings in one query, returning one result list per query"""
+        if not query_embeddings:
+            return []
+        try:
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k
+            )
+        except Exception as e:
+            print(f"ChromaDB query error: {e}")
+            return [[] for _ in query_embeddings]
+
+        all_ids = results.get("ids") or [[] for _ in query_embeddings]
+        all_texts = results.get("documents") or [[] for _ in query_embeddings]
+        all_metas = results.get("metadatas") or [[{}] * len(ids) for ids in all_ids]
+        return [
+            [{"id": i, "content": t, "metadata": m} for i, t, m in zip(ids, texts, metas)]
+            for ids, texts, metas in zip(all_ids, all_texts, all_metas)
+        ]
+
     def delete_document(self, doc_id: str) -> bool:
         try:
             self.collection.delete(ids=[doc_id])
             self.db.pop(doc_id, None)
+            self.collection_version += 1
             return True
         except Exception as e:
             print(f"Error deleting {doc_id}: {e}")
             return False
 
+    def export_chunks(self, offset: int = 0, limit: int = 500) -> List[dict]:
+        """Return a page of stored chunks with their text, metadata and embedding."""
+        result = self.collection.get(
+            limit=limit,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        embeddings = result.get("embeddings")
+        return [
+            {"id": doc_id, "content": text, "metadata": meta or {},
+             "embedding": [float(v) for v in embeddings[i]] if embeddings is not None else None}
+            for i, (doc_id, text, meta) in enumerate(zip(result["ids"], result["documents"], result["metadatas"]))
+        ]
+
+    def import_chunks(self, chunks: List[dict]) -> int:
+        """Store exported chunks under their original ids (re-imports overwrite)."""
+        if not chunks:
+            return 0
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["content"] for chunk in chunks]
+        metadatas = [chunk.get("metadata") or {} for chunk in chunks]
+        embeddings = [chunk["embedding"] for chunk in chunks]
+        if any(embedding is None for embedding in embeddings):
+            embeddings = self.embedder.embed_documents(documents)
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        self.collection_version += 1
+        for doc_id, text, emb, meta in zip(ids, documents, embeddings, metadatas):
+            self.db[doc_id] = {"chunk": text, "embedding": emb, "metadata": meta}
+        return len(chunks)
+
     def get_document(self, doc_id: str) -> Optional[dict]:
         try:
             result = self.collection.get(ids=[doc_id])
@@ -200,6 +267,7 @@ class ChromaDBHandler:
         
             # Also clear the in-memory database
             self.db = {}
+            self.collection_version += 1
         
             # Verify the collection is empty
             remaining = self.collection.count()
@@ -0,0 +1,193 @@
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional, Any, Deque, Tuple
+
+# Compact message record: (message_id, seq, role, content, timestamp)
+MessageRecord = Tuple[str, Optional[int], str, str, str]
+
+HEADER_FIELDS = ("conversation_id", "title", "created_at", "updated_at", "message_count", "last_seq")
+
+
+class _CachedConversation:
+    __slots__ = ("header", "metadata", "messages", "complete")
+
+    def __init__(self, header: Dict[str, Any], metadata: Dict[str, Any],
+                 messages: Deque[MessageRecord], complete: bool):
+        self.header = header
+        self.metadata = metadata
+        # The newest messages only; complete means they are all of the conversation's messages
+        self.messages = messages
+        self.complete = complete
+
+
+class ConversationCache:
+    """
+    Bounded LRU cache of recently active conversations.
+
+    Each entry holds the conversation row, its parsed metadata (including the system
+    prompt) and the newest max_messages messages as compact tuples; dicts are only
+    built for the messages a read returns. The cache is kept coherent by the
+    apply_*() write-through calls, which AsyncChatHistory makes after each write
+    commits. A message whose seq doesn't follow the cached one evicts the entry
+    instead of leaving a gap.
+
+    Reads that miss go to the database between start_load() and finish_load(); if the
+    conversation is written meanwhile the result may predate the write and isn't cached.
+    """
+
+    def __init__(self, max_conversations: int = 256, max_messages: int = 100):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self._entries: "OrderedDict[str, _CachedConversation]" = OrderedDict()
+        # conversation_id -> [loads in flight, written during a load]
+        self._loads: Dict[str, List] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "stale_loads": 0}
+
+    @staticmethod
+    def _record(message: Dict[str, Any]) -> MessageRecord:
+        return (message["message_id"], message.get("seq"), message["role"], message["content"], message["timestamp"])
+
+    def _lookup(self, conversation_id: str) -> Optional[_CachedConversation]:
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            self._entries.move_to_end(conversation_id)
+        return entry
+
+    def _materialize(self, entry: _CachedConversation, limit: Optional[int] = None) -> Dict[str, Any]:
+        records = list(entry.messages)
+        if limit is not None:
+            records = records[-limit:] if limit > 0 else []
+        conversation_id = entry.header["conversation_id"]
+        conversation = dict(entry.header)
+        conversation["metadata"] = dict(entry.metadata)
+        conversation["messages"] = [
+            {"message_id": message_id, "conversation_id": conversation_id, "seq": seq,
+             "role": role, "content": content, "timestamp": timestamp}
+            for message_id, seq, role, content, timestamp in records
+        ]
+        return conversation
+
+    @staticmethod
+    def window(conversation: Dict[str, Any], limit: int) -> Dict[str, Any]:
+        """Cut a loaded conversation down to its last limit messages (like get_conversation_window)"""
+        messages = conversation["messages"][-limit:] if limit > 0 else []
+        has_more = conversation.get("message_count", len(conversation["messages"])) > len(messages)
+        return {
+            **conversation,
+            "messages": messages,
+            "has_more": has_more,
+            "next_cursor": messages[0]["message_id"] if has_more and messages else None,
+        }
+
+    def get_window(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        """The conversation with its last limit messages, or None if they aren't all cached"""
+        entry = self._lookup(conversation_id)
+        if entry is None or (limit > len(entry.messages) and not entry.complete):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return self.window(self._materialize(entry, limit), limit)
+
+    def get_full(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """The conversation with all its messages, or None unless they are all cached"""
+        entry = self._lookup(conversation_id)
+        if entry is None or not entry.complete:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return self._materialize(entry)
+
+    def start_load(self, conversation_id: str):
+        state = self._loads.setdefault(conversation_id, [0, False])
+        state[0] += 1
+
+    def finish_load(self, conversation_id: str, conversation: Optional[Dict[str, Any]]):
+        """Cache a conversation read from the database, unless it was written during the read"""
+        state = self._loads[conversation_id]
+        state[0] -= 1
+        stale = state[1]
+        if state[0] == 0:
+            del self._loads[conversation_id]
+        if conversation is None:
+            return
+        if stale:
+            self.stats["stale_loads"] += 1
+            return
+        messages = conversation.get("messages", [])
+        complete = not conversation.get("has_more", False)
+        if len(messages) > self.max_messages:
+            messages = messages[-self.max_messages:]
+            complete = False
+        self._entries[conversation_id] = _CachedConversation(
+            header={field: conversation.get(field) for field in HEADER_FIELDS},
+            metadata=dict(conversation.get("metadata") or {}),
+            messages=deque((self._record(m) for m in messages), maxlen=self.max_messages),
+            complete=complete
+        )
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _written(self, conversation_id: str) -> Optional[_CachedConversation]:
+        state = self._loads.get(conversation_id)
+        if state is not None:
+            state[1] = True
+        return self._lookup(conversation_id)
+
+    def _append(self, entry: _CachedConversation, message: Dict[str, Any]) -> bool:
+        header = entry.header
+        if message.get("seq") is None or header["last_seq"] is None or message["seq"] != header["last_seq"] + 1:
+            return False
+        if len(entry.messages) == self.max_messages:
+            entry.complete = False
+        entry.messages.append(self._record(message))
+        header["last_seq"] = message["seq"]
+        header["message_count"] = (header["message_count"] or 0) + 1
+        header["updated_at"] = message["timestamp"]
+        return True
+
+    def apply_message(self, conversation_id: str, message: Dict[str, Any]):
+        """Write-through for a stored message record"""
+        entry = self._written(conversation_id)
+        if entry is not None and not self._append(entry, message):
+            self.invalidate(conversation_id)
+
+    def apply_sync(self, conversation_id: str, result: Dict[str, Any], title: Optional[str] = None):
+        """Write-through for a sync_messages() result"""
+        entry = self._written(conversation_id)
+        if entry is None:
+            return
+        for message in result["messages"]:
+            if message["seq"] > (entry.header["last_seq"] or 0) and not self._append(entry, message):
+                self.invalidate(conversation_id)
+                return
+        if title:
+            entry.header["title"] = title
+
+    def apply_title(self, conversation_id: str, title: str):
+        entry = self._written(conversation_id)
+        if entry is not None:
+            entry.header["title"] = title
+
+    def apply_metadata(self, conversation_id: str, updates: Dict[str, Any]):
+        entry = self._written(conversation_id)
+        if entry is not None:
+            entry.metadata.update(updates)
+
+    def invalidate(self, conversation_id: str):
+        """Drop a conversation (deleted, or changed in a way the cache can't follow)"""
+        self._written(conversation_id)
+        if self._entries.pop(conversation_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def status(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the cache's size"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "conversations": len(self._entries),
+            "messages": sum(len(entry.messages) for entry in self._entries.values()),
+            "max_conversations": self.max_conversations,
+            "max_messages": self.max_messages,
+        }
@@ -0,0 +1,230 @@
+"""
+Versioned schema migrations for the chat history database.
+
+The schema version is kept in SQLite's PRAGMA user_version. Each migration runs
+in its own IMMEDIATE transaction together with the version bump, so a failed
+migration leaves the database at the previous version and concurrent processes
+starting up at the same time apply each migration once.
+
+To change the schema, append a new migration to MIGRATIONS; never edit one that
+has already shipped.
+"""
+import hashlib
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+
+def content_hash(content: str) -> str:
+    """Hash used to detect duplicate messages (content is stripped like add_message stores it)"""
+    return hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+
+
+def _initial_schema(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversations (
+        conversation_id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        metadata TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages (
+        message_id TEXT PRIMARY KEY,
+        conversation_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS uploaded_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        filehash TEXT UNIQUE
+    )
+    ''')
+
+
+def _generation_stats(conn: sqlite3.Connection):
+    # Ollama token counts and timings (ns) per generation
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS generation_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id TEXT,
+        conversation_id TEXT,
+        app_name TEXT NOT NULL,
+        model TEXT NOT NULL,
+        prompt_eval_count INTEGER,
+        eval_count INTEGER,
+        prompt_eval_duration INTEGER,
+        eval_duration INTEGER,
+        load_duration INTEGER,
+        total_duration INTEGER,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_stats_created ON generation_stats (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_stats_message ON generation_stats (message_id)")
+
+
+def _message_indexes_and_hash(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp ON messages (conversation_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)")
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN content_hash TEXT")
+    conn.create_function("content_hash", 1, content_hash, deterministic=True)
+    conn.execute("UPDATE messages SET content_hash = content_hash(content) WHERE content_hash IS NULL")
+    # Rows that already duplicate an earlier one keep their content but lose the hash,
+    # so the unique index can be built without deleting history
+    conn.execute('''
+    UPDATE messages SET content_hash = NULL
+    WHERE rowid NOT IN (
+        SELECT MIN(rowid) FROM messages GROUP BY conversation_id, role, content_hash
+    )
+    ''')
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_dedup ON messages (conversation_id, role, content_hash)"
+    )
+
+
+def _conversation_message_count(conn: sqlite3.Connection):
+    # Kept by add_message so windowed reads don't have to count the transcript
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    if "message_count" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+    UPDATE conversations SET message_count = (
+        SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.conversation_id
+    )
+    ''')
+
+
+def _message_sequence(conn: sqlite3.Connection):
+    # Per-conversation monotonic sequence numbers for delta sync
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "seq" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    if "last_seq" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN last_seq INTEGER NOT NULL DEFAULT 0")
+    # Number existing messages in timestamp order through a keyed temp table (one pass each way)
+    conn.execute("CREATE TEMP TABLE message_seq (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL)")
+    conn.execute('''
+    INSERT INTO temp.message_seq (id, seq)
+    SELECT rowid, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY timestamp, rowid) FROM messages
+    ''')
+    conn.execute("UPDATE messages SET seq = (SELECT seq FROM temp.message_seq WHERE id = messages.rowid)")
+    conn.execute("DROP TABLE temp.message_seq")
+    conn.execute('''
+    UPDATE conversations SET last_seq = COALESCE(
+        (SELECT MAX(seq) FROM messages WHERE messages.conversation_id = conversations.conversation_id), 0
+    )
+    ''')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_seq ON messages (conversation_id, seq)")
+
+
+def _message_search_index(conn: sqlite3.Connection):
+    # External-content FTS5 index over message text, kept in step by triggers. It is keyed
+    # by messages.rowid, which VACUUM may renumber: rebuild the index after a VACUUM.
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='rowid', tokenize='porter unicode61 remove_diacritics 2'
+    )
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+    END
+    ''')
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def _conversation_list_index(conn: sqlite3.Connection):
+    # Keyset pagination of the conversation list orders by (updated_at, conversation_id)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_updated_id ON conversations (updated_at, conversation_id)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_conversations_updated_at")
+
+
+def _conversation_archive(conn: sqlite3.Connection):
+    # Idle conversations keep their row (archived_at set) while their messages move into
+    # one compressed blob; app_name lets retention policies differ per app
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    if "archived_at" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN archived_at TIMESTAMP")
+    if "app_name" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN app_name TEXT")
+    conn.execute('''
+    UPDATE conversations SET app_name = json_extract(metadata, '$.app_name')
+    WHERE app_name IS NULL AND json_valid(metadata)
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversation_archive (
+        conversation_id TEXT PRIMARY KEY,
+        archived_at TIMESTAMP NOT NULL,
+        message_count INTEGER NOT NULL,
+        raw_bytes INTEGER NOT NULL,
+        payload BLOB NOT NULL
+    )
+    ''')
+
+
+# (version, description, migration)
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "initial schema", _initial_schema),
+    (2, "generation_stats table", _generation_stats),
+    (3, "message/conversation indexes and content-hash dedup", _message_indexes_and_hash),
+    (4, "conversation message_count", _conversation_message_count),
+    (5, "per-conversation message sequence numbers", _message_sequence),
+    (6, "full-text search index over messages", _message_search_index),
+    (7, "conversation list keyset index", _conversation_list_index),
+    (8, "conversation archive and app_name", _conversation_archive),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to target (default: latest) and return the versions applied"""
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    conn.commit()
+    for version, description, migrate in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another process may have just applied it
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[INFO] Applied chat history migration {version}: {description}")
+        applied.append(version)
+    return applied
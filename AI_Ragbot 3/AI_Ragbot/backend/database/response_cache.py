@@ -0,0 +1,156 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    """
+    In-memory cache of LLM answers matched by query-embedding similarity.
+
+    Entries are scoped by app, system prompt and document collection version, so a
+    cached answer is only reused for the same instructions over the same documents.
+    Entries expire after a TTL and the cache is bounded with LRU eviction.
+
+    Normalized embeddings live in one float32 matrix with a row per slot, so a lookup
+    is a single matrix-vector product over every entry rather than a Python loop.
+    Lookups are still CPU work under a lock: call them off the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1000, default_threshold: float = 0.92,
+                 default_ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.default_threshold = default_threshold
+        self.default_ttl_seconds = default_ttl_seconds
+        # entry_id -> {"slot", "scope", "query", "response"}, in LRU order
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        # Per slot: normalized embedding, scope number (-1 = free), expiry time and entry id
+        self._vectors: Optional[np.ndarray] = None
+        self._slot_scope = np.full(max_entries, -1, dtype=np.int64)
+        self._slot_expires = np.zeros(max_entries, dtype=np.float64)
+        self._slot_entry = np.zeros(max_entries, dtype=np.int64)
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        # scope key -> [scope number, live entries]
+        self._scopes: Dict[str, List[int]] = {}
+        self._next_scope = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+        self._app_stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def get_config(app_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the app's response_cache block if caching is enabled for it"""
+        cache_config = app_config.get("response_cache")
+        if isinstance(cache_config, dict) and cache_config.get("enabled", False):
+            return cache_config
+        return None
+
+    @staticmethod
+    def scope_key(app_name: Optional[str], system_prompt: str, collection_version: Optional[int]) -> str:
+        """Build the scope an entry belongs to"""
+        raw = f"{app_name or 'default'}\x00{system_prompt}\x00{collection_version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalized(vector: List[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm > 0 else None
+
+    def _count(self, app_name: Optional[str], key: str):
+        self._stats[key] += 1
+        app_stats = self._app_stats.setdefault(app_name or "default", {"hits": 0, "misses": 0})
+        if key in app_stats:
+            app_stats[key] += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._slot_scope[entry["slot"]] = -1
+        self._free_slots.append(entry["slot"])
+        scope = self._scopes[entry["scope"]]
+        scope[1] -= 1
+        if scope[1] == 0:
+            del self._scopes[entry["scope"]]
+
+    def _expire(self, now: float):
+        expired = np.flatnonzero((self._slot_scope >= 0) & (self._slot_expires < now))
+        for slot in expired:
+            self._remove(int(self._slot_entry[slot]))
+        self._stats["expirations"] += len(expired)
+
+    def lookup(self, scope: str, embedding: List[float], app_name: Optional[str] = None,
+               threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the most similar live entry in scope above the threshold, or None"""
+        threshold = self.default_threshold if threshold is None else threshold
+        query = self._normalized(embedding)
+        with self._lock:
+            self._expire(time.time())
+            best_id, best_score = None, threshold
+            scope_entry = self._scopes.get(scope)
+            if query is not None and scope_entry is not None and len(query) == self._vectors.shape[1]:
+                scores = self._vectors @ query
+                scores[self._slot_scope != scope_entry[0]] = -np.inf
+                slot = int(np.argmax(scores))
+                if scores[slot] >= best_score:
+                    best_id, best_score = int(self._slot_entry[slot]), float(scores[slot])
+            if best_id is None:
+                self._count(app_name, "misses")
+                return None
+            self._entries.move_to_end(best_id)
+            self._count(app_name, "hits")
+            entry = self._entries[best_id]
+            return {"query": entry["query"], "response": entry["response"], "similarity": round(best_score, 4)}
+
+    def store(self, scope: str, query: str, embedding: List[float], response: str,
+              ttl_seconds: Optional[int] = None):
+        """Add an answer to the cache, evicting the least recently used entries if full"""
+        vector = self._normalized(embedding)
+        if vector is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                if self._vectors is not None:
+                    print(f"[WARN] Embedding size changed to {len(vector)}; clearing the response cache")
+                    self._clear()
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            scope_entry = self._scopes.get(scope)
+            if scope_entry is None:
+                scope_entry = self._scopes[scope] = [self._next_scope, 0]
+                self._next_scope += 1
+            scope_entry[1] += 1
+            slot = self._free_slots.pop()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._vectors[slot] = vector
+            self._slot_scope[slot] = scope_entry[0]
+            self._slot_expires[slot] = time.time() + (self.default_ttl_seconds if ttl_seconds is None else ttl_seconds)
+            self._slot_entry[slot] = entry_id
+            self._entries[entry_id] = {"slot": slot, "scope": scope, "query": query, "response": response}
+            self._stats["stores"] += 1
+
+    def _clear(self):
+        for entry_id in list(self._entries):
+            self._remove(entry_id)
+
+    def clear(self):
+        """Drop every cached entry (stats are kept)"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters overall and per app"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "by_app": {app: dict(counts) for app, counts in self._app_stats.items()},
+            }
@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+
+from database.chat_history import ChatHistoryHandler
+from models.generation_profile import TASK_PROFILES
+
+
+class ShardedChatHistory:
+    """
+    ChatHistoryHandler API over several SQLite files, so writes to different shards
+    don't wait on one database-wide write lock.
+
+    mode="hash" spreads conversations over shard_count files by a hash of their id.
+    mode="app" keeps one file per app in apps (plus "default" for conversations of
+    other or no apps); a conversation's shard is found from its metadata's app_name
+    when it is created and by looking it up in each shard afterwards (remembered in
+    a bounded routing cache).
+
+    Conversation calls go to the conversation's shard. Listing, search and export
+    query every shard and merge the results in the same order the single-file
+    handler returns. The uploaded-files catalog lives in the first shard;
+    generation stats live with their conversation.
+    """
+
+    def __init__(self, db_dir: str = "./database/shards", mode: str = "hash", shard_count: int = 4,
+                 apps: Iterable[str] = (), pragmas: Optional[Dict[str, Any]] = None, route_cache_size: int = 100000):
+        if mode == "hash":
+            names = [f"{index:02d}" for index in range(shard_count)]
+        elif mode == "app":
+            names = ["default"] + sorted({app for app in apps if app and app != "default"})
+        else:
+            raise ValueError(f"Unknown shard mode {mode!r} (use 'hash' or 'app')")
+        for name in names:
+            if not re.fullmatch(r"[\w.-]+", name):
+                raise ValueError(f"Shard name {name!r} can't be used as a file name")
+        self.mode = mode
+        self.db_dir = db_dir
+        self.shard_names = names
+        self.shards = [ChatHistoryHandler(os.path.join(db_dir, f"chat_history.{name}.db"), pragmas) for name in names]
+        self.shard_count = len(self.shards)
+        self._app_shards = {name: index for index, name in enumerate(names)}
+        self._routes: "OrderedDict[str, int]" = OrderedDict()
+        self._routes_lock = threading.Lock()
+        self.route_cache_size = route_cache_size
+        print(f"[INFO] Chat history sharded by {mode} over {self.shard_count} databases in {db_dir}")
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    # Routing
+
+    def _remember(self, conversation_id: str, index: int) -> int:
+        if self.mode == "app":
+            with self._routes_lock:
+                self._routes[conversation_id] = index
+                self._routes.move_to_end(conversation_id)
+                if len(self._routes) > self.route_cache_size:
+                    self._routes.popitem(last=False)
+        return index
+
+    def route_new(self, conversation_id: str, metadata: Optional[Dict] = None) -> int:
+        """Shard a new conversation belongs in"""
+        if self.mode == "hash":
+            return zlib.crc32(conversation_id.encode("utf-8")) % self.shard_count
+        app_name = (metadata or {}).get("app_name")
+        return self._app_shards.get(app_name, 0)
+
+    def cached_shard_index(self, conversation_id: str, metadata: Optional[Dict] = None) -> Optional[int]:
+        """A conversation's shard if it's known without touching the databases"""
+        if self.mode == "hash":
+            return self.route_new(conversation_id)
+        return self._routes.get(conversation_id)
+
+    def shard_index(self, conversation_id: str, metadata: Optional[Dict] = None) -> int:
+        """A conversation's shard (where it would be created, if it doesn't exist)"""
+        index = self.cached_shard_index(conversation_id)
+        if index is not None:
+            return index
+        for index, shard in enumerate(self.shards):
+            with shard.pool.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM conversations WHERE conversation_id = ?", (conversation_id,))
+                if cursor.fetchone():
+                    return self._remember(conversation_id, index)
+        return self.route_new(conversation_id, metadata)
+
+    def shard_for(self, conversation_id: str, metadata: Optional[Dict] = None) -> ChatHistoryHandler:
+        return self.shards[self.shard_index(conversation_id, metadata)]
+
+    def _grouped(self, items: List[Any], conversation_id_of) -> Dict[int, List[Tuple[int, Any]]]:
+        """Split items by shard, keeping each one's position"""
+        groups: Dict[int, List[Tuple[int, Any]]] = {}
+        for position, item in enumerate(items):
+            groups.setdefault(self.shard_index(conversation_id_of(item)), []).append((position, item))
+        return groups
+
+    # Conversations and messages
+
+    def create_conversation(self, conversation_id: Optional[str] = None, title: str = "New Chat",
+                            metadata: Optional[Dict] = None) -> str:
+        conversation_id = conversation_id or str(uuid.uuid4())
+        index = self._remember(conversation_id, self.route_new(conversation_id, metadata))
+        return self.shards[index].create_conversation(conversation_id, title, metadata)
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    usage: Optional[Dict[str, Any]] = None, app_name: Optional[str] = None) -> Optional[str]:
+        return self.shard_for(conversation_id).add_message(conversation_id, role, content, usage, app_name)
+
+    def add_messages(self, messages: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Add messages with one transaction per shard"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        for index, group in self._grouped(messages, lambda message: message["conversation_id"]).items():
+            records = self.shards[index].add_messages([message for _, message in group])
+            for (position, _), record in zip(group, records):
+                results[position] = record
+        return results
+
+    def sync_messages(self, conversation_id: str, base_seq: int, messages: List[Dict[str, str]],
+                      title: Optional[str] = None, metadata: Optional[Dict] = None) -> Dict[str, Any]:
+        index = self._remember(conversation_id, self.shard_index(conversation_id, metadata))
+        return self.shards[index].sync_messages(conversation_id, base_seq, messages, title, metadata)
+
+    def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
+        return self.shard_for(conversation_id).get_conversation(conversation_id)
+
+    def get_messages(self, conversation_id: str, limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+        return self.shard_for(conversation_id).get_messages(conversation_id, limit, before)
+
+    def get_conversation_window(self, conversation_id: str, limit: int) -> Dict[str, Any]:
+        return self.shard_for(conversation_id).get_conversation_window(conversation_id, limit)
+
+    def get_message_range(self, conversation_id: str, after_seq: int, through_seq: int) -> List[Dict[str, Any]]:
+        return self.shard_for(conversation_id).get_message_range(conversation_id, after_seq, through_seq)
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        deleted = self.shard_for(conversation_id).delete_conversation(conversation_id)
+        with self._routes_lock:
+            self._routes.pop(conversation_id, None)
+        return deleted
+
+    def update_conversation_title(self, conversation_id: str, title: str) -> bool:
+        return self.shard_for(conversation_id).update_conversation_title(conversation_id, title)
+
+    def update_conversation_metadata(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        return self.shard_for(conversation_id).update_conversation_metadata(conversation_id, updates)
+
+    def archive_conversation(self, conversation_id: str, idle_before: Optional[str] = None) -> bool:
+        return self.shard_for(conversation_id).archive_conversation(conversation_id, idle_before)
+
+    def is_archived(self, conversation_id: str) -> bool:
+        return self.shard_for(conversation_id).is_archived(conversation_id)
+
+    def restore_conversation(self, conversation_id: str) -> bool:
+        return self.shard_for(conversation_id).restore_conversation(conversation_id)
+
+    def get_message_usage(self, conversation_id: str) -> List[Dict[str, Any]]:
+        return self.shard_for(conversation_id).get_message_usage(conversation_id)
+
+    def record_generation(self, usage: Dict[str, Any], app_name: Optional[str] = None,
+                          conversation_id: Optional[str] = None, message_id: Optional[str] = None):
+        shard = self.shard_for(conversation_id) if conversation_id else self.shards[0]
+        return shard.record_generation(usage, app_name, conversation_id, message_id)
+
+    # Cross-shard reads
+
+    def list_conversations(self, limit: int = 50, before: Optional[str] = None,
+                           preview_chars: int = 120) -> Dict[str, Any]:
+        """One page of the merged conversation list (same cursor format as the handler)"""
+        pages = [shard.list_conversations(limit, before, preview_chars) for shard in self.shards]
+        merged = list(islice(heapq.merge(*(page["conversations"] for page in pages),
+                                         key=lambda row: (row["updated_at"], row["conversation_id"]), reverse=True),
+                             limit + 1))
+        has_more = len(merged) > limit or any(page["has_more"] for page in pages)
+        rows = merged[:limit]
+        next_cursor = f"{rows[-1]['updated_at']}|{rows[-1]['conversation_id']}" if has_more and rows else None
+        return {"conversations": rows, "has_more": has_more, "next_cursor": next_cursor}
+
+    def get_all_conversations(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        pages = [shard.get_all_conversations(limit + offset, 0) for shard in self.shards]
+        merged = heapq.merge(*pages, key=lambda row: row["updated_at"], reverse=True)
+        return list(islice(merged, offset, offset + limit))
+
+    def search_conversations(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Search every shard and merge by score.
+
+        BM25 scores use each shard's own term statistics, so rankings across shards
+        are close to, but not exactly, those of a single index.
+        """
+        pages = [shard.search_conversations(query, limit + offset, 0) for shard in self.shards]
+        merged = sorted((row for page in pages for row in page["results"]),
+                        key=lambda row: (-row["score"], row["conversation_id"]))
+        has_more = len(merged) > offset + limit or any(page["has_more"] for page in pages)
+        return {"results": merged[offset:offset + limit], "has_more": has_more}
+
+    def find_idle_conversations(self, idle_before: str, app_name: Optional[str] = None,
+                                exclude_apps: Optional[List[str]] = None, archived: Optional[bool] = False,
+                                limit: int = 200) -> List[str]:
+        found = []
+        for shard in self.shards:
+            found.extend(shard.find_idle_conversations(idle_before, app_name, exclude_apps, archived,
+                                                       limit - len(found)))
+            if len(found) >= limit:
+                break
+        return found
+
+    def export_conversations(self, after_id: Optional[str] = None, after_seq: int = 0,
+                             max_records: int = 1000) -> Dict[str, Any]:
+        """
+        The next export records of all shards, merged in conversation_id order.
+
+        Every shard reads from the same position; as each conversation lives in one
+        shard, the first max_records merged records are exactly the next ones.
+        """
+        batches = [shard.export_conversations(after_id, after_seq, max_records) for shard in self.shards]
+        merged = list(islice(heapq.merge(*(batch["records"] for batch in batches),
+                                         key=lambda record: record["conversation_id"]),
+                             max_records + 1))
+        records = merged[:max_records]
+        done = len(merged) <= max_records and all(batch["done"] for batch in batches)
+        if records:
+            last = records[-1]
+            after_id, after_seq = last["conversation_id"], last["seq"] if last["type"] == "message" else 0
+        return {"records": records, "after_id": after_id, "after_seq": after_seq, "done": done}
+
+    def import_conversations(self, records: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Import records with one transaction per shard"""
+        for record in records:
+            if record["type"] == "conversation":
+                self._remember(record["conversation_id"],
+                               self.shard_index(record["conversation_id"], record.get("metadata")))
+        imported = {"conversations": 0, "messages": 0}
+        for index, group in self._grouped(records, lambda record: record["conversation_id"]).items():
+            counts = self.shards[index].import_conversations([record for _, record in group])
+            for key in imported:
+                imported[key] += counts[key]
+        return imported
+
+    def get_generation_stats(self, since: Optional[str] = None, app_name: Optional[str] = None,
+                             model: Optional[str] = None, load_stall_ms: float = 500.0) -> List[Dict[str, Any]]:
+        return ChatHistoryHandler.format_generation_stats(
+            self.get_generation_totals(since, app_name, model, load_stall_ms))
+
+    def get_generation_totals(self, since: Optional[str] = None, app_name: Optional[str] = None,
+                              model: Optional[str] = None, load_stall_ms: float = 500.0) -> List[Dict[str, Any]]:
+        totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for shard in self.shards:
+            for row in shard.get_generation_totals(since, app_name, model, load_stall_ms):
+                key = (row["app_name"], row["model"])
+                if key not in totals:
+                    totals[key] = row
+                    continue
+                total = totals[key]
+                for field, value in row.items():
+                    if field == "max_load_ns":
+                        total[field] = max(total[field], value)
+                    elif field not in ("app_name", "model"):
+                        total[field] += value
+        return sorted(totals.values(), key=lambda row: row["total_ns"], reverse=True)
+
+    # Whole-store maintenance
+
+    def rebuild_search_index(self):
+        for shard in self.shards:
+            shard.rebuild_search_index()
+
+    def compact(self, max_pages: int = 2000) -> Dict[str, Any]:
+        results = [shard.compact(max_pages) for shard in self.shards]
+        return {
+            "mode": ",".join(sorted({result["mode"] for result in results})),
+            "freed_pages": sum(result["freed_pages"] for result in results),
+            "free_pages": sum(result["free_pages"] for result in results),
+            "size_bytes": sum(result["size_bytes"] for result in results),
+            "shards": dict(zip(self.shard_names, results)),
+        }
+
+    def enable_incremental_vacuum(self) -> Dict[str, Any]:
+        results = [shard.enable_incremental_vacuum() for shard in self.shards]
+        return {
+            "changed": any(result["changed"] for result in results),
+            "size_bytes": sum(result["size_bytes"] for result in results),
+            "shards": dict(zip(self.shard_names, results)),
+        }
+
+    def get_archive_stats(self) -> Dict[str, Any]:
+        stats = [shard.get_archive_stats() for shard in self.shards]
+        return {key: sum(stat[key] for stat in stats) for key in stats[0]}
+
+    # Uploaded-files catalog (first shard)
+
+    def is_file_already_uploaded(self, filehash: str) -> bool:
+        return self.shards[0].is_file_already_uploaded(filehash)
+
+    def log_uploaded_file(self, filename: str, filehash: str):
+        return self.shards[0].log_uploaded_file(filename, filehash)
+
+    def get_uploaded_files(self) -> List[Dict[str, Any]]:
+        return self.shards[0].get_uploaded_files()
+
+    def clear_uploaded_files(self) -> int:
+        return self.shards[0].clear_uploaded_files()
+
+    def export_files(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        return self.shards[0].export_files(after_id, limit)
+
+    def import_files(self, files: List[Dict[str, Any]]) -> int:
+        return self.shards[0].import_files(files)
+
+    def status(self) -> Dict[str, Any]:
+        """Per-shard database sizes and conversation counts"""
+        shards = []
+        for name, shard in zip(self.shard_names, self.shards):
+            with shard.pool.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM conversations")
+                conversations = cursor.fetchone()[0]
+            shards.append({"name": name, "path": shard.db_path, "conversations": conversations,
+                           "size_bytes": os.path.getsize(shard.db_path)})
+        return {"mode": self.mode, "shards": shards, "routes_cached": len(self._routes)}
+
+
+def _copy_generation_stats(source_path: str, target: ShardedChatHistory, batch_size: int) -> int:
+    """Copy generation_stats rows next to their conversations (rows have no natural key to dedupe on)"""
+    for shard in target.shards:
+        with shard.pool.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM generation_stats LIMIT 1")
+            if cursor.fetchone():
+                print("[WARN] Target already has generation stats; not copying them again")
+                return 0
+    source = sqlite3.connect(source_path)
+    source.row_factory = sqlite3.Row
+    copied, after_id = 0, 0
+    try:
+        while True:
+            rows = [dict(row) for row in source.execute(
+                "SELECT * FROM generation_stats WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size))]
+            if not rows:
+                return copied
+            after_id = rows[-1]["id"]
+            columns = [column for column in rows[0] if column != "id"]
+            groups: Dict[int, List[Dict[str, Any]]] = {}
+            for row in rows:
+                index = target.shard_index(row["conversation_id"]) if row["conversation_id"] else 0
+                groups.setdefault(index, []).append(row)
+            for index, group in groups.items():
+                with target.shards[index].pool.cursor() as cursor:
+                    cursor.executemany(
+                        f"INSERT INTO generation_stats ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                        [[row[column] for column in columns] for row in group]
+                    )
+            copied += len(rows)
+    finally:
+        source.close()
+
+
+async def migrate(source_path: str, target: ShardedChatHistory, batch_size: int = 2000) -> Dict[str, Any]:
+    """
+    Copy a single-file chat history into shards.
+
+    Uses the NDJSON export/import path in-process, so memory stays flat and a rerun
+    after an interruption skips what was already copied. The source may stay in use:
+    messages written during the copy come through with consistent sequence numbers,
+    and a final rerun once writes have stopped picks up any that landed in
+    conversations already copied.
+    """
+    from database.async_chat_history import AsyncChatHistory
+    from database.transfer import export_records, NDJSONImporter
+
+    source = AsyncChatHistory(ChatHistoryHandler(source_path))
+    store = AsyncChatHistory(target)
+    try:
+        importer = NDJSONImporter(store, batch_size=batch_size)
+        async for record in export_records(source, after=None, batch_size=batch_size,
+                                           sections=("files", "conversations")):
+            if record["type"] not in ("header", "checkpoint", "end"):
+                await importer.feed_record(record)
+        stats = await importer.finish()
+        stats["generation_stats"] = await asyncio.to_thread(_copy_generation_stats, source_path, target, batch_size)
+        stats["shards"] = target.status()["shards"]
+        return stats
+    finally:
+        source.close()
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split ./database/chat_history.db into sharded databases (run from the backend directory)")
+    parser.add_argument("--source", default="./database/chat_history.db")
+    parser.add_argument("--dir", default="./database/shards", help="Directory for the shard databases")
+    parser.add_argument("--mode", choices=["hash", "app"], default="hash")
+    parser.add_argument("--shards", type=int, default=4, help="Number of shards in hash mode")
+    parser.add_argument("--apps", default="", help="Comma-separated apps with their own shard in app mode "
+                                                     "(default: the apps in appsettings.json)")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    apps = [app for app in args.apps.split(",") if app]
+    if args.mode == "app" and not apps:
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "appsettings.json")) as f:
+            apps = [name for name, config in json.load(f).items()
+                    if isinstance(config, (dict, str)) and name not in TASK_PROFILES]
+    started = time.perf_counter()
+    target = ShardedChatHistory(args.dir, args.mode, args.shards, apps)
+    stats = asyncio.run(migrate(args.source, target, args.batch_size))
+    print(f"[INFO] Migrated {stats} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
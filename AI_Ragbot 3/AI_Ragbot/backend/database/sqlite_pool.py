@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Iterator
+
+
+class SQLitePool:
+    """
+    Persistent per-thread SQLite connections in WAL mode.
+
+    Each thread opens its connection once and keeps it, so the pragmas and the
+    connection's compiled-statement cache (cached_statements) are reused across
+    calls instead of being rebuilt by every sqlite3.connect(). WAL lets readers run
+    alongside the single writer, and busy_timeout makes writers wait for the lock
+    instead of failing with "database is locked".
+    """
+
+    DEFAULT_PRAGMAS = {
+        # Takes effect in databases created by this pool; existing ones need
+        # ChatHistoryHandler.enable_incremental_vacuum() once
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,   # 256 MB
+        "cache_size": -65536,     # 64 MB (negative values are KiB)
+        "busy_timeout": 30000,    # ms
+    }
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None,
+                 cached_statements: int = 256):
+        self.db_path = db_path
+        self.pragmas = {**self.DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas["busy_timeout"] / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection; commits on success and rolls back on error"""
+        conn = self.get()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def cursor(self) -> Iterator[sqlite3.Cursor]:
+        """A cursor on this thread's connection inside connection()"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def close_all(self):
+        """Close every connection opened by the pool (threads reopen on next use)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,287 @@
+"""
+Streaming NDJSON export and import of a deployment's data.
+
+An export is one JSON record per line: a header, then the uploaded-files catalog,
+the document chunks (with their embeddings) and the conversations with their
+messages, in that order. Records are read in bounded batches, so memory use doesn't
+depend on the size of the database. After each batch a checkpoint record carries a
+cursor; an export started with that cursor continues right after the batch.
+
+Importing inserts the records in one transaction per batch and skips records that
+already exist, so an interrupted import can be re-run from the start or fed the
+resumed export.
+
+Run from the backend directory:
+    python -m database.transfer export --out backup.ndjson
+    python -m database.transfer export --out backup.ndjson --resume
+    python -m database.transfer import --in backup.ndjson --db ./database/other.db
+"""
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+from typing import List, Dict, Optional, Any, AsyncIterator, Iterable, Tuple
+
+from database.migrations import LATEST_VERSION
+
+EXPORT_FORMAT = "ragbot-export"
+EXPORT_VERSION = 1
+SECTIONS = ("files", "documents", "conversations")
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[int, List[str]]:
+    """Split "section:position" into the section's index and its position fields"""
+    if not cursor:
+        return 0, []
+    section, _, position = cursor.partition(":")
+    # Conversation ids may contain ":"; the seq after the last one never does
+    fields = position.rsplit(":", 1) if section == "conversations" else [position]
+    if section not in SECTIONS or len(fields) != (2 if section == "conversations" else 1) \
+            or not fields[-1].isdigit():
+        raise ValueError(f"Invalid export cursor {cursor!r}")
+    return SECTIONS.index(section), fields
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """One NDJSON line (archive blobs are base64-encoded)"""
+    archive = record.get("archive")
+    if archive and isinstance(archive.get("payload"), bytes):
+        record = {**record, "archive": {**archive, "payload": base64.b64encode(archive["payload"]).decode("ascii")}}
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def decode_record(line: bytes) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return None
+    record = json.loads(line)
+    archive = record.get("archive")
+    if archive and isinstance(archive.get("payload"), str):
+        archive["payload"] = base64.b64decode(archive["payload"])
+    return record
+
+
+async def export_records(store, chroma=None, after: Optional[str] = None, batch_size: int = 1000,
+                         sections: Iterable[str] = SECTIONS) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield the export records of an AsyncChatHistory (and ChromaDBHandler, if given).
+
+    Starts after the given checkpoint cursor; sections limits what is exported.
+    """
+    start, position = parse_cursor(after)
+    sections = set(sections)
+    counts = {"files": 0, "documents": 0, "conversations": 0, "messages": 0}
+    yield {"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+           "schema_version": LATEST_VERSION, "after": after}
+
+    if start <= 0 and "files" in sections:
+        after_id = int(position[0]) if start == 0 and position else 0
+        while True:
+            files = await store.export_files(after_id, batch_size)
+            for file in files:
+                yield {"type": "file", **file}
+            counts["files"] += len(files)
+            if len(files) < batch_size:
+                break
+            after_id = files[-1]["id"]
+            yield {"type": "checkpoint", "cursor": f"files:{after_id}"}
+
+    if start <= 1 and "documents" in sections and chroma is not None:
+        offset = int(position[0]) if start == 1 and position else 0
+        while True:
+            chunks = await asyncio.to_thread(chroma.export_chunks, offset, batch_size)
+            for chunk in chunks:
+                yield {"type": "document", **chunk}
+            counts["documents"] += len(chunks)
+            if len(chunks) < batch_size:
+                break
+            offset += len(chunks)
+            yield {"type": "checkpoint", "cursor": f"documents:{offset}"}
+
+    if "conversations" in sections:
+        after_id, after_seq = None, 0
+        if start == 2 and position:
+            after_id, after_seq = position[0], int(position[1])
+        while True:
+            batch = await store.export_conversations(after_id, after_seq, batch_size)
+            for record in batch["records"]:
+                counts["conversations" if record["type"] == "conversation" else "messages"] += 1
+                yield record
+            if batch["done"]:
+                break
+            after_id, after_seq = batch["after_id"], batch["after_seq"]
+            yield {"type": "checkpoint", "cursor": f"conversations:{after_id}:{after_seq}"}
+
+    yield {"type": "end", "counts": counts}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of byte chunks into lines"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+class NDJSONImporter:
+    """
+    Imports export records into an AsyncChatHistory (and ChromaDBHandler, if given).
+
+    Records are buffered per kind and written batch_size at a time, each batch in a
+    single transaction. Call finish() after the last line.
+    """
+
+    def __init__(self, store, chroma=None, batch_size: int = 2000):
+        self.store = store
+        self.chroma = chroma
+        self.batch_size = batch_size
+        self._files: List[Dict[str, Any]] = []
+        self._documents: List[Dict[str, Any]] = []
+        self._conversations: List[Dict[str, Any]] = []
+        self.stats = {"lines": 0, "files": 0, "documents": 0, "conversations": 0, "messages": 0,
+                      "skipped_documents": 0, "batches": 0, "cursor": None}
+
+    async def feed(self, line: bytes):
+        """Handle one NDJSON line"""
+        record = decode_record(line)
+        if record is not None:
+            await self.feed_record(record)
+
+    async def feed_record(self, record: Dict[str, Any]):
+        """Handle one decoded record"""
+        self.stats["lines"] += 1
+        record = dict(record)
+        kind = record.pop("type", None)
+        if kind == "header":
+            if record.get("format") != EXPORT_FORMAT or record.get("version", 0) > EXPORT_VERSION:
+                raise ValueError(f"Unsupported export format {record.get('format')} v{record.get('version')}")
+        elif kind == "file":
+            self._files.append(record)
+            if len(self._files) >= self.batch_size:
+                await self._flush_files()
+        elif kind == "document":
+            self._documents.append(record)
+            if len(self._documents) >= self.batch_size:
+                await self._flush_documents()
+        elif kind in ("conversation", "message"):
+            self._conversations.append({"type": kind, **record})
+            if len(self._conversations) >= self.batch_size:
+                await self._flush_conversations()
+        elif kind == "checkpoint":
+            self.stats["cursor"] = record["cursor"]
+        elif kind != "end":
+            raise ValueError(f"Unknown record type {kind!r} on line {self.stats['lines']}")
+
+    async def _flush_files(self):
+        files, self._files = self._files, []
+        if files:
+            self.stats["files"] += await self.store.import_files(files)
+            self.stats["batches"] += 1
+
+    async def _flush_documents(self):
+        documents, self._documents = self._documents, []
+        if not documents:
+            return
+        if self.chroma is None:
+            self.stats["skipped_documents"] += len(documents)
+            return
+        self.stats["documents"] += await asyncio.to_thread(self.chroma.import_chunks, documents)
+        self.stats["batches"] += 1
+
+    async def _flush_conversations(self):
+        records, self._conversations = self._conversations, []
+        if records:
+            imported = await self.store.import_conversations(records)
+            self.stats["conversations"] += imported["conversations"]
+            self.stats["messages"] += imported["messages"]
+            self.stats["batches"] += 1
+
+    async def finish(self) -> Dict[str, Any]:
+        """Write what is still buffered and return the import counters"""
+        await self._flush_files()
+        await self._flush_documents()
+        await self._flush_conversations()
+        return self.stats
+
+
+def last_checkpoint(path: str) -> Tuple[Optional[str], int]:
+    """Cursor of an export file's last checkpoint and the byte offset just after it"""
+    cursor, offset, position = None, 0, 0
+    with open(path, "rb") as f:
+        for line in f:
+            position += len(line)
+            if line.startswith(b'{"type":"checkpoint"') and line.endswith(b"\n"):
+                cursor, offset = json.loads(line)["cursor"], position
+    return cursor, offset
+
+
+async def _run_cli(args):
+    from database.chat_history import ChatHistoryHandler
+    from database.async_chat_history import AsyncChatHistory
+
+    store = AsyncChatHistory(ChatHistoryHandler(args.db))
+    chroma = None
+    if args.chroma:
+        # Imported lazily: conversations can be moved without chromadb installed
+        from database.chromadb_handler import ChromaDBHandler
+        chroma = ChromaDBHandler(None, persist_directory=args.chroma)
+    started = time.perf_counter()
+    try:
+        if args.command == "export":
+            if args.resume and args.out != "-":
+                # Drop whatever was written after the last checkpoint and carry on from there
+                args.after, offset = last_checkpoint(args.out)
+                with open(args.out, "r+b") as f:
+                    f.truncate(offset)
+                print(f"[INFO] Resuming export at {args.after or 'the start'}", file=sys.stderr)
+            out = open(args.out, "ab" if args.after else "wb") if args.out != "-" else sys.stdout.buffer
+            sections = args.sections.split(",")
+            try:
+                async for record in export_records(store, chroma, args.after, args.batch_size, sections):
+                    if record["type"] == "checkpoint":
+                        out.flush()
+                    elif record["type"] == "end":
+                        print(f"[INFO] Exported {record['counts']} in {time.perf_counter() - started:.1f}s",
+                              file=sys.stderr)
+                    out.write(encode_record(record))
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+        else:
+            importer = NDJSONImporter(store, chroma, args.batch_size)
+            source = open(args.input, "rb") if args.input != "-" else sys.stdin.buffer
+            try:
+                for line in source:
+                    await importer.feed(line)
+            finally:
+                if source is not sys.stdin.buffer:
+                    source.close()
+            stats = await importer.finish()
+            print(f"[INFO] Imported {stats} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--db", default="./database/chat_history.db", help="Chat history database")
+    parser.add_argument("--chroma", help="ChromaDB directory (documents are skipped without it)")
+    parser.add_argument("--out", default="-", help="Export file (- for stdout; appended to when resuming)")
+    parser.add_argument("--in", dest="input", default="-", help="Import file (- for stdin)")
+    parser.add_argument("--after", help="Checkpoint cursor to resume an export from")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted export into --out")
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="Sections to export")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(_run_cli(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import List, Dict, Optional, Any, Callable, Awaitable, Tuple
+
+
+class WriteBehindBuffer:
+    """
+    Collects message inserts from concurrent requests and commits them in shared transactions.
+
+    A batch is flushed interval seconds after its first message, or as soon as it holds
+    max_batch messages. Each submit() returns a future that resolves with the insert's
+    result once its batch has committed (or fails with the batch's error).
+
+    wait_for() lets callers that touch a conversation see its buffered messages first:
+    it flushes them and waits until they are committed.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]],
+                 interval: float = 0.02, max_batch: int = 256):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        # Uncommitted futures per conversation, including batches being flushed
+        self._unsettled: Dict[str, List[asyncio.Future]] = defaultdict(list)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"messages": 0, "batches": 0, "largest_batch": 0, "failed_batches": 0,
+                      "forced_flushes": 0, "flush_ms": 0.0}
+
+    def submit(self, message: Dict[str, Any]) -> asyncio.Future:
+        """Queue one add_message call (as keyword arguments) and return its future"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+        conversation_id = message["conversation_id"]
+        self._unsettled[conversation_id].append(future)
+        future.add_done_callback(lambda f: self._settle(conversation_id, f))
+        if len(self._pending) >= self.max_batch:
+            asyncio.ensure_future(self.flush())
+        elif self._timer is None:
+            self._timer = loop.call_later(self.interval, lambda: asyncio.ensure_future(self.flush()))
+        return future
+
+    def _settle(self, conversation_id: str, future: asyncio.Future):
+        futures = self._unsettled.get(conversation_id)
+        if futures is None:
+            return
+        futures.remove(future)
+        if not futures:
+            del self._unsettled[conversation_id]
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self):
+        """Commit everything buffered so far as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            results = await self.flush_fn([message for message, _ in batch])
+        except Exception as e:
+            print(f"[ERROR] Write-behind flush of {len(batch)} messages failed: {e}")
+            self.stats["failed_batches"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+        self.stats["messages"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        self.stats["flush_ms"] += (time.perf_counter() - started) * 1000
+
+    async def wait_for(self, conversation_id: str):
+        """Make a conversation's buffered messages visible before it is read or changed"""
+        futures = list(self._unsettled.get(conversation_id, ()))
+        if not futures:
+            return
+        if any(message["conversation_id"] == conversation_id for message, _ in self._pending):
+            self.stats["forced_flushes"] += 1
+            await self.flush()
+        # Failures are reported to the writers; the reader only needs them settled
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        """Return batching counters and the current backlog"""
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "flush_ms": round(self.stats["flush_ms"], 1),
+            "avg_batch": round(self.stats["messages"] / batches, 1) if batches else None,
+            "pending": len(self._pending),
+            "interval_ms": self.interval * 1000,
+            "max_batch": self.max_batch,
+        }
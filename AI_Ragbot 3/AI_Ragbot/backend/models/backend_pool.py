@@ -0,0 +1,228 @@
+import asyncio
+import itertools
+import threading
+import time
+from typing import List, Dict, Optional, Any, AsyncGenerator, Awaitable, Callable, Set
+
+import httpx
+
+# Errors that mean the endpoint itself is unreachable, so the request can safely go elsewhere
+FAILOVER_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+def base_url_from(api_url: str) -> str:
+    """Strip an Ollama API path (e.g. /api/chat) from a URL, leaving the host base URL"""
+    return api_url.split("/api/", 1)[0].rstrip("/")
+
+
+class OllamaEndpoint:
+    """One Ollama host and the models it serves"""
+
+    def __init__(self, url: str, models: Optional[List[str]] = None):
+        self.url = base_url_from(url)
+        # None means the endpoint is assumed to serve any model
+        self.models: Optional[Set[str]] = set(models) if models else None
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        self.total_requests = 0
+        self.available_models: List[str] = []
+        self.last_probe: Optional[float] = None
+
+    def serves(self, model: str) -> bool:
+        if self.models is None:
+            return True
+        return model in self.models or f"{model}:latest" in self.models
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "models": sorted(self.models) if self.models is not None else None,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "total_requests": self.total_requests,
+            "available_models": self.available_models,
+            "last_probe": self.last_probe,
+        }
+
+
+class OllamaBackendPool:
+    """
+    Routes Ollama requests across several hosts.
+
+    Requests go to the healthy endpoint serving the model with the fewest
+    outstanding requests. A sticky key (e.g. the conversation id) keeps a
+    conversation on the same host while it stays healthy, so Ollama can reuse
+    its KV cache. Connection failures mark the endpoint unhealthy and the
+    request fails over to the next candidate; background probes of /api/tags
+    bring endpoints back.
+    """
+
+    def __init__(self, endpoints: List[OllamaEndpoint], health_interval: float = 15.0,
+                 probe_timeout: float = 2.0, max_sticky_keys: int = 10000):
+        if not endpoints:
+            raise ValueError("OllamaBackendPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self.max_sticky_keys = max_sticky_keys
+        self._sticky: Dict[str, OllamaEndpoint] = {}
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_spec(cls, spec: str, fallback_url: str, **kwargs) -> "OllamaBackendPool":
+        """
+        Build a pool from a spec string like
+        "http://gpu1:11434|llama3:8b|nomic-embed-text,http://gpu2:11434".
+
+        Entries are comma separated; each is a URL optionally followed by
+        "|"-separated model names. An empty spec uses fallback_url alone.
+        """
+        endpoints = []
+        for entry in (spec or "").split(","):
+            parts = [part.strip() for part in entry.split("|") if part.strip()]
+            if parts:
+                endpoints.append(OllamaEndpoint(parts[0], parts[1:]))
+        if not endpoints:
+            endpoints.append(OllamaEndpoint(fallback_url))
+        return cls(endpoints, **kwargs)
+
+    def candidates(self, model: str, exclude: Optional[Set[str]] = None) -> List[OllamaEndpoint]:
+        """Endpoints that can serve the model, healthy ones first"""
+        exclude = exclude or set()
+        serving = [ep for ep in self.endpoints if ep.serves(model) and ep.url not in exclude]
+        healthy = [ep for ep in serving if ep.healthy]
+        # If every endpoint is marked down, still try them rather than failing outright
+        return healthy or serving
+
+    def select(self, model: str, sticky_key: Optional[str] = None,
+               exclude: Optional[Set[str]] = None) -> OllamaEndpoint:
+        """Pick the endpoint for a request and reserve a slot on it"""
+        with self._lock:
+            candidates = self.candidates(model, exclude)
+            if not candidates:
+                raise ValueError(f"No Ollama endpoint serves model '{model}'")
+
+            endpoint = self._sticky.get(sticky_key) if sticky_key else None
+            if endpoint is None or endpoint not in candidates or not endpoint.healthy:
+                least = min(ep.outstanding for ep in candidates)
+                tied = [ep for ep in candidates if ep.outstanding == least]
+                endpoint = tied[next(self._round_robin) % len(tied)]
+                if sticky_key:
+                    if len(self._sticky) >= self.max_sticky_keys:
+                        self._sticky.pop(next(iter(self._sticky)))
+                    self._sticky[sticky_key] = endpoint
+
+            endpoint.outstanding += 1
+            endpoint.total_requests += 1
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def mark_failed(self, endpoint: OllamaEndpoint):
+        """Take an endpoint out of rotation until a probe succeeds"""
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failures += 1
+            for key in [k for k, ep in self._sticky.items() if ep is endpoint]:
+                del self._sticky[key]
+        print(f"[WARN] Ollama endpoint {endpoint.url} marked unhealthy")
+
+    async def request(self, model: str, send: Callable[[str], Awaitable[Any]],
+                      sticky_key: Optional[str] = None) -> Any:
+        """Run send(base_url) on a selected endpoint, failing over on connection errors"""
+        self.ensure_health_checks()
+        tried: Set[str] = set()
+        while True:
+            endpoint = self.select(model, sticky_key, exclude=tried)
+            try:
+                return await send(endpoint.url)
+            except FAILOVER_ERRORS:
+                self.mark_failed(endpoint)
+                tried.add(endpoint.url)
+                if not self.candidates(model, tried):
+                    raise
+            finally:
+                self.release(endpoint)
+
+    async def stream(self, model: str, open_stream: Callable[[str], AsyncGenerator[Any, None]],
+                     sticky_key: Optional[str] = None) -> AsyncGenerator[Any, None]:
+        """Yield from open_stream(base_url), failing over only if nothing has been yielded yet"""
+        self.ensure_health_checks()
+        tried: Set[str] = set()
+        while True:
+            endpoint = self.select(model, sticky_key, exclude=tried)
+            started = False
+            try:
+                async for chunk in open_stream(endpoint.url):
+                    started = True
+                    yield chunk
+                return
+            except FAILOVER_ERRORS:
+                self.mark_failed(endpoint)
+                tried.add(endpoint.url)
+                if started or not self.candidates(model, tried):
+                    raise
+            finally:
+                self.release(endpoint)
+
+    def request_sync(self, model: str, send: Callable[[str], Any],
+                     sticky_key: Optional[str] = None) -> Any:
+        """Synchronous counterpart of request()"""
+        tried: Set[str] = set()
+        while True:
+            endpoint = self.select(model, sticky_key, exclude=tried)
+            try:
+                return send(endpoint.url)
+            except FAILOVER_ERRORS:
+                self.mark_failed(endpoint)
+                tried.add(endpoint.url)
+                if not self.candidates(model, tried):
+                    raise
+            finally:
+                self.release(endpoint)
+
+    async def probe(self):
+        """Check every endpoint's /api/tags and update its health and model list"""
+        async with httpx.AsyncClient(timeout=self.probe_timeout) as client:
+            async def check(endpoint: OllamaEndpoint):
+                try:
+                    response = await client.get(f"{endpoint.url}/api/tags")
+                    response.raise_for_status()
+                    endpoint.available_models = [m["name"] for m in response.json().get("models", [])]
+                    if not endpoint.healthy:
+                        print(f"[INFO] Ollama endpoint {endpoint.url} is healthy again")
+                    endpoint.healthy = True
+                except Exception:
+                    endpoint.healthy = False
+                endpoint.last_probe = time.time()
+
+            await asyncio.gather(*(check(ep) for ep in self.endpoints))
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                print(f"[ERROR] Ollama health probe failed: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    def ensure_health_checks(self):
+        """Start the periodic health probe on the running event loop if it isn't running yet"""
+        if self.health_interval <= 0:
+            return
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [ep.to_dict() for ep in self.endpoints]
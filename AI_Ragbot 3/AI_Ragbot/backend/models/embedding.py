@@ -1,9 +1,11 @@
 import ollama
-from typing import List, Union
+from typing import List, Union, Optional
 
 class LocalEmbedder:
-    def __init__(self, model_name="nomic-embed-text"):
+    def __init__(self, model_name="nomic-embed-text", keep_alive: Optional[str] = None):
         self.model_name = model_name
+        # How long Ollama keeps the embedding model loaded; None uses Ollama's default
+        self.keep_alive = keep_alive
 
     def _get_embedding(self, text: Union[str, List[str]]) -> List[float]:
         if isinstance(text, list):
@@ -13,7 +15,10 @@ class LocalEmbedder:
             raise ValueError(f"Expected text to be a string or list of strings, but got {type(text)}")
         
         try:
-            response = ollama.embeddings(model=self.model_name, prompt=text)
+            if self.keep_alive is not None:
+                response = ollama.embeddings(model=self.model_name, prompt=text, keep_alive=self.keep_alive)
+            else:
+                response = ollama.embeddings(model=self.model_name, prompt=text)
         except Exception as e:
             raise Exception(f"Error while making API request: {str(e)}")
 
@@ -31,3 +36,28 @@ class LocalEmbedder:
     
     def embed_query(self, text: str) -> List[float]:
         return self._get_embedding(text)
+
+    def embed_batch(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+        """Embed many texts with one /api/embed call per batch_size texts"""
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = [str(text) for text in texts[start:start + batch_size]]
+            kwargs = {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+            try:
+                response = ollama.embed(model=self.model_name, input=batch, **kwargs)
+            except Exception as e:
+                raise Exception(f"Error while making API request: {str(e)}")
+            try:
+                embeddings.extend(response["embeddings"])
+            except KeyError:
+                raise Exception(f"Invalid response from API. Response: {response}")
+        return embeddings
+
+    def warm_up(self) -> bool:
+        """Load the embedding model ahead of the first real request"""
+        try:
+            self._get_embedding("warm up")
+            return True
+        except Exception as e:
+            print(f"[WARN] Warm-up of {self.model_name} failed: {e}")
+            return False
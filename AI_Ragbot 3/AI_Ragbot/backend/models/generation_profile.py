@@ -0,0 +1,54 @@
+from typing import List, Dict, Optional, Any
+
+from pydantic import BaseModel, Field, ValidationError
+
+# appsettings.json entries that hold the profile of a generation path instead of a chat app
+TASK_PROFILES = ("code", "goal_analysis", "summarizer")
+
+
+class GenerationProfile(BaseModel):
+    """
+    Generation settings for one app, mapped onto the options Ollama actually reads.
+
+    Ollama ignores top-level temperature/max_tokens in /api/chat and /api/generate;
+    sampling and length limits must go in "options" (num_predict caps the answer
+    length, num_ctx the context window) and keep_alive at the top level.
+    """
+    model: Optional[str] = None
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    top_p: Optional[float] = Field(default=None, gt=0.0, le=1.0)
+    num_predict: Optional[int] = Field(default=None, ge=-2)
+    num_ctx: Optional[int] = Field(default=None, ge=256)
+    stop: Optional[List[str]] = None
+    keep_alive: Optional[str] = None
+
+    model_config = {"extra": "forbid"}
+
+    def merged(self, other: Optional["GenerationProfile"]) -> "GenerationProfile":
+        """Return a copy where the fields set in other override this profile's"""
+        if other is None:
+            return self
+        return self.model_copy(update=other.model_dump(exclude_none=True))
+
+    def to_options(self) -> Dict[str, Any]:
+        """Ollama "options" for this profile (only the fields that are set)"""
+        return self.model_dump(exclude_none=True, include={"temperature", "top_p", "num_predict", "num_ctx", "stop"})
+
+
+def load_generation_profiles(app_settings: Dict[str, Any]) -> Dict[str, GenerationProfile]:
+    """
+    Validate the "generation" block of every app in appsettings.json.
+
+    The TASK_PROFILES entries (code generation, goal analysis, conversation
+    summaries) are validated the same way. Raises ValueError naming the app if a profile is invalid, so a bad config
+    fails at startup instead of being silently ignored by Ollama.
+    """
+    profiles = {}
+    for app_name, app_config in app_settings.items():
+        if not isinstance(app_config, dict) or "generation" not in app_config:
+            continue
+        try:
+            profiles[app_name] = GenerationProfile.model_validate(app_config["generation"])
+        except ValidationError as e:
+            raise ValueError(f"Invalid generation profile for app '{app_name}': {e}")
+    return profiles
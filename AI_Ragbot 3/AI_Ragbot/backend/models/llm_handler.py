@@ -1,36 +1,102 @@
 import httpx
 import json
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import List, Dict, Optional, AsyncGenerator, Tuple
 import os
 import asyncio
+from utils.single_flight import SingleFlight, request_key
+from models.backend_pool import OllamaBackendPool, OllamaEndpoint
+from models.generation_profile import GenerationProfile
+
+# Prefixes _make_api_request uses when it reports a failure as the response text
+ERROR_RESPONSE_PREFIXES = ("Error generating response:", "Unexpected error:")
+
+# Prompt layouts for generate_response:
+#   "legacy"        - retrieved context is appended to the system message (prefix changes every turn)
+#   "prefix_stable" - system prompt and history come first byte-for-byte, context goes in the final
+#                     user message so Ollama can reuse its prompt cache for the shared prefix
+PROMPT_LAYOUTS = ("legacy", "prefix_stable")
+
+# Token counts and timings (durations in nanoseconds) Ollama reports on the final response
+USAGE_FIELDS = ("prompt_eval_count", "eval_count", "prompt_eval_duration",
+                "eval_duration", "load_duration", "total_duration")
+
+def usage_from_response(result: Dict) -> Dict:
+    """Pick the token and timing counters out of a final /api/chat response"""
+    usage = {field: result[field] for field in USAGE_FIELDS if result.get(field) is not None}
+    if usage and result.get("model"):
+        usage["model"] = result["model"]
+    return usage
 
 class LlamaModel:
-    def __init__(self, api_url="http://localhost:11434/api/chat", model="llama3:8b"):
-        """Initialize the Llama model handler"""
+    CHAT_PATH = "/api/chat"
+
+    def __init__(self, api_url="http://localhost:11434/api/chat", model="llama3:8b",
+                 pool: Optional[OllamaBackendPool] = None, keep_alive: Optional[str] = None,
+                 prompt_layout: str = "prefix_stable",
+                 task_profiles: Optional[Dict[str, GenerationProfile]] = None):
+        """Initialize the Llama model handler (task_profiles holds the "code" generation profile)"""
+        if prompt_layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Unknown prompt layout '{prompt_layout}', expected one of {PROMPT_LAYOUTS}")
         self.api_url = api_url
         self.model = model
+        # How long Ollama keeps the model loaded after a request (e.g. "30m"); None uses Ollama's default
+        self.keep_alive = keep_alive
+        self.prompt_layout = prompt_layout
+        self.task_profiles = task_profiles or {}
+        # Without an explicit pool, route everything to api_url (no health probing needed)
+        self.pool = pool or OllamaBackendPool([OllamaEndpoint(api_url)], health_interval=0)
         self.default_timeout = 120.0
         self.max_context_chars = 6000
         self.max_history_messages = 3
+        # Identical concurrent requests share one upstream generation
+        self.single_flight = SingleFlight()
 
     def _create_payload(self, messages: List[Dict], temperature: float = 0.7, 
-                       max_tokens: int = 2048, **kwargs) -> Dict:
-        """Create a standardized payload for Ollama API requests"""
+                       max_tokens: int = 2048, profile: Optional[GenerationProfile] = None,
+                       **kwargs) -> Dict:
+        """
+        Create a standardized payload for Ollama API requests.
+
+        Ollama only reads sampling settings from "options": max_tokens is sent as
+        num_predict, extra keyword arguments (e.g. top_p) become options too, and
+        any field set in profile overrides these defaults.
+        """
+        options = {"temperature": temperature, "num_predict": max_tokens}
+        options.update(kwargs)
+        model = self.model
+        keep_alive = self.keep_alive
+        if profile is not None:
+            options.update(profile.to_options())
+            model = profile.model or model
+            keep_alive = profile.keep_alive or keep_alive
+
         payload = {
-            "model": self.model,
+            "model": model,
             "messages": messages,
             "stream": False,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
+            "options": options,
         }
-        # Add any additional parameters
-        payload.update(kwargs)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
         return payload
 
+    def _summary_message(self, conversation_summary: Optional[str]) -> List[Dict]:
+        """Wrap the running conversation summary as a system message (empty if there is none)"""
+        if not conversation_summary:
+            return []
+        return [{"role": "system",
+                 "content": f"Summary of the conversation so far:\n{conversation_summary}"}]
+
+    def is_error_response(self, text: str) -> bool:
+        """Check whether a response string is an error reported by the API helpers"""
+        return not text or text.startswith(ERROR_RESPONSE_PREFIXES)
+
     def _prepare_messages(self, prompt: str, system_prompt: str = "You are a helpful assistant.", 
-                         chat_history: Optional[List[Dict]] = None) -> List[Dict]:
+                         chat_history: Optional[List[Dict]] = None,
+                         conversation_summary: Optional[str] = None) -> List[Dict]:
         """Prepare messages in the correct format for the API"""
         messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(self._summary_message(conversation_summary))
         
         # Add chat history if provided
         if chat_history:
@@ -47,57 +113,158 @@ class LlamaModel:
         
         return messages
 
-    async def _make_api_request(self, payload: Dict) -> str:
-        """Make API request to Ollama and return response content"""
-        try:
+    async def _make_api_request(self, payload: Dict, sticky_key: Optional[str] = None,
+                                usage: Optional[Dict] = None) -> str:
+        """
+        Make API request to Ollama and return response content.
+
+        Token/timing counters go into usage only for the caller whose request went
+        upstream; coalesced callers share the content but leave usage empty, so one
+        generation is recorded once.
+        """
+        key = request_key(self.CHAT_PATH, payload)
+        return await self.single_flight.do(key, lambda: self._post_chat(payload, sticky_key, usage))
+
+    async def _post_chat(self, payload: Dict, sticky_key: Optional[str] = None,
+                         usage: Optional[Dict] = None) -> str:
+        """Send a single non-streaming chat request to an Ollama endpoint from the pool"""
+        async def send(base_url: str) -> Tuple[str, Dict]:
             async with httpx.AsyncClient(timeout=self.default_timeout) as client:
-                response = await client.post(self.api_url, json=payload)
+                response = await client.post(base_url + self.CHAT_PATH, json=payload)
                 response.raise_for_status()
                 result = response.json()
-                return result.get("message", {}).get("content", "")
+                return result.get("message", {}).get("content", ""), usage_from_response(result)
+
+        try:
+            content, result_usage = await self.pool.request(payload["model"], send, sticky_key)
         except httpx.HTTPError as e:
             print(f"HTTP error: {e}")
             return f"Error generating response: {str(e)}"
         except Exception as e:
             print(f"Unexpected error: {e}")
             return f"Unexpected error: {str(e)}"
+        if usage is not None:
+            usage.update(result_usage)
+        return content
 
-    def _make_sync_api_request(self, payload: Dict) -> str:
-        """Make synchronous API request to Ollama and return response content"""
-        try:
+    def _make_sync_api_request(self, payload: Dict, sticky_key: Optional[str] = None,
+                               usage: Optional[Dict] = None) -> str:
+        """Make synchronous API request to Ollama and return response content (usage as in _make_api_request)"""
+        key = request_key(self.CHAT_PATH, payload)
+        return self.single_flight.do_sync(key, lambda: self._post_chat_sync(payload, sticky_key, usage))
+
+    def _post_chat_sync(self, payload: Dict, sticky_key: Optional[str] = None,
+                        usage: Optional[Dict] = None) -> str:
+        """Send a single non-streaming chat request to an Ollama endpoint from the pool synchronously"""
+        def send(base_url: str) -> Tuple[str, Dict]:
             with httpx.Client(timeout=self.default_timeout) as client:
-                response = client.post(self.api_url, json=payload)
+                response = client.post(base_url + self.CHAT_PATH, json=payload)
                 response.raise_for_status()
                 result = response.json()
-                return result.get("message", {}).get("content", "")
+                return result.get("message", {}).get("content", ""), usage_from_response(result)
+
+        try:
+            content, result_usage = self.pool.request_sync(payload["model"], send, sticky_key)
         except httpx.HTTPError as e:
             print(f"HTTP error: {e}")
             return f"Error generating response: {str(e)}"
         except Exception as e:
             print(f"Unexpected error: {e}")
             return f"Unexpected error: {str(e)}"
+        if usage is not None:
+            usage.update(result_usage)
+        return content
+
+    async def _stream_api_request(self, payload: Dict, sticky_key: Optional[str] = None,
+                                  usage: Optional[Dict] = None) -> AsyncGenerator[str, None]:
+        """
+        Stream response tokens from Ollama, sharing one upstream stream between identical requests.
+
+        usage is only filled for the caller that started the upstream stream.
+        """
+        payload = {**payload, "stream": True}
+        key = request_key(self.CHAT_PATH, payload)
+        async for token in self.single_flight.stream(key, lambda: self._post_chat_stream(payload, sticky_key, usage)):
+            yield token
+
+    async def _post_chat_stream(self, payload: Dict, sticky_key: Optional[str] = None,
+                                usage: Optional[Dict] = None) -> AsyncGenerator[str, None]:
+        """Send a single streaming chat request to an Ollama endpoint from the pool and yield content tokens"""
+        async def open_stream(base_url: str) -> AsyncGenerator[str, None]:
+            async with httpx.AsyncClient(timeout=self.default_timeout) as client:
+                async with client.stream("POST", base_url + self.CHAT_PATH, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        token = chunk.get("message", {}).get("content", "")
+                        if token:
+                            yield token
+                        if chunk.get("done"):
+                            if usage is not None:
+                                usage.update(usage_from_response(chunk))
+                            break
+
+        async for token in self.pool.stream(payload["model"], open_stream, sticky_key):
+            yield token
+
+    async def generate_stream(self, prompt: str, chat_history: Optional[List[Dict]] = None,
+                              system_prompt: str = "You are a helpful assistant.",
+                              conversation_summary: Optional[str] = None,
+                              sticky_key: Optional[str] = None,
+                              profile: Optional[GenerationProfile] = None,
+                              usage: Optional[Dict] = None) -> AsyncGenerator[str, None]:
+        """Generate a response as a stream of tokens"""
+        messages = self._prepare_messages(prompt, system_prompt, chat_history, conversation_summary)
+        payload = self._create_payload(messages, temperature=0.7, max_tokens=2048, profile=profile)
+        async for token in self._stream_api_request(payload, sticky_key, usage):
+            yield token
 
     def generate(self, prompt: str, chat_history: Optional[List[Dict]] = None, 
-                system_prompt: str = "You are a helpful assistant.") -> str:
+                system_prompt: str = "You are a helpful assistant.",
+                conversation_summary: Optional[str] = None,
+                sticky_key: Optional[str] = None,
+                profile: Optional[GenerationProfile] = None,
+                usage: Optional[Dict] = None) -> str:
         """Generate a response using Llama model synchronously"""
-        messages = self._prepare_messages(prompt, system_prompt, chat_history)
-        payload = self._create_payload(messages, temperature=0.7, max_tokens=2048)
-        return self._make_sync_api_request(payload)
+        messages = self._prepare_messages(prompt, system_prompt, chat_history, conversation_summary)
+        payload = self._create_payload(messages, temperature=0.7, max_tokens=2048, profile=profile)
+        return self._make_sync_api_request(payload, sticky_key, usage)
+
+    async def generate_async(self, prompt: str, chat_history: Optional[List[Dict]] = None,
+                             system_prompt: str = "You are a helpful assistant.",
+                             conversation_summary: Optional[str] = None,
+                             sticky_key: Optional[str] = None,
+                             profile: Optional[GenerationProfile] = None,
+                             usage: Optional[Dict] = None) -> str:
+        """
+        Generate a response using Llama model without blocking the event loop.
 
-    def generate_code(self, prompt: str, system_prompt: str = None) -> str:
-        """Generate Python code based on the prompt"""
+        If usage is given it is filled with Ollama's token and timing counters.
+        """
+        messages = self._prepare_messages(prompt, system_prompt, chat_history, conversation_summary)
+        payload = self._create_payload(messages, temperature=0.7, max_tokens=2048, profile=profile)
+        return await self._make_api_request(payload, sticky_key, usage)
+
+    def generate_code(self, prompt: str, system_prompt: str = None,
+                      profile: Optional[GenerationProfile] = None) -> str:
+        """Generate Python code based on the prompt (with the "code" profile unless one is given)"""
         if system_prompt is None:
             system_prompt = ("You are a Python programming assistant. Generate concise, "
                            "working Python code that addresses the user's request. Include "
                            "only code without explanation or markdown formatting.")
         
         messages = self._prepare_messages(prompt, system_prompt)
-        payload = self._create_payload(messages, temperature=0.1, max_tokens=2048, top_p=0.95)
+        payload = self._create_payload(messages, profile=profile or self.task_profiles.get("code"))
         return self._make_sync_api_request(payload)
 
     async def generate_response(self, query: str, context: str = None, 
                               system_prompt: Optional[str] = "You are a helpful assistant.",
-                              conversation_history: List[Dict[str, str]] = None) -> AsyncGenerator[Dict[str, str], None]:
+                              conversation_history: List[Dict[str, str]] = None,
+                              conversation_summary: Optional[str] = None,
+                              sticky_key: Optional[str] = None,
+                              profile: Optional[GenerationProfile] = None) -> AsyncGenerator[Dict[str, str], None]:
         """
         Generate a response from the LLM using the query, context, and conversation history.
         
@@ -106,9 +273,13 @@ class LlamaModel:
             context: Optional retrieved context from vector store
             system_prompt: System prompt for the model
             conversation_history: List of previous messages
+            conversation_summary: Optional running summary of messages older than the history window
+            sticky_key: Optional routing key (e.g. conversation id) to keep a chat on one Ollama host
+            profile: Optional generation profile (model, options, keep_alive) for this app
             
         Yields:
-            Dict with status updates and final response
+            Dict with status updates and final response (the final one also carries
+            Ollama's token and timing counters under "usage")
         """
         print("[DEBUG] Entered generate_response")
         
@@ -119,21 +290,8 @@ class LlamaModel:
             if context and len(context) > self.max_context_chars:
                 context = context[:self.max_context_chars]
             
-            # Prepare system message with context
-            enhanced_system_prompt = system_prompt or "You are a helpful assistant."
-            if context:
-                enhanced_system_prompt += f"\n\nUse the following context to answer the question:\n{context}"
-            
-            # Prepare messages
-            messages = [{"role": "system", "content": enhanced_system_prompt}]
-            
-            # Add conversation history
-            if conversation_history:
-                for message in conversation_history[-self.max_history_messages:]:
-                    messages.append({"role": message["role"], "content": message["content"]})
-            
-            # Add current query
-            messages.append({"role": "user", "content": query})
+            messages = self.build_rag_messages(query, context, system_prompt,
+                                               conversation_history, conversation_summary)
             
             # Additional status update for context analysis
             if context:
@@ -146,20 +304,76 @@ class LlamaModel:
             print(f"[DEBUG] Payload tokens approx: {sum(len(m['content']) for m in messages)}")
             
             # Generate response
-            payload = self._create_payload(messages, temperature=0.7, max_tokens=2048)
-            response = await self._make_api_request(payload)
+            payload = self._create_payload(messages, temperature=0.7, max_tokens=2048, profile=profile)
+            usage = {}
+            response = await self._make_api_request(payload, sticky_key, usage)
             
-            yield {"status": "complete", "message": response}
+            yield {"status": "complete", "message": response, "usage": usage}
             
         except Exception as e:
             print(f"[ERROR] generate_response crashed: {e}")
             yield {"status": "error", "message": "I'm sorry, I encountered an error processing your request."}
 
+    def build_rag_messages(self, query: str, context: Optional[str] = None,
+                           system_prompt: Optional[str] = "You are a helpful assistant.",
+                           conversation_history: Optional[List[Dict[str, str]]] = None,
+                           conversation_summary: Optional[str] = None,
+                           layout: Optional[str] = None) -> List[Dict[str, str]]:
+        """Build the chat messages for a (possibly context-augmented) query in the given prompt layout"""
+        layout = layout or self.prompt_layout
+        system_prompt = system_prompt or "You are a helpful assistant."
+
+        # The current query is sent separately, so drop it if the history already ends with it
+        history = list(conversation_history or [])
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == query:
+            history = history[:-1]
+
+        if layout == "legacy":
+            # Prepare system message with context
+            if context:
+                system_prompt += f"\n\nUse the following context to answer the question:\n{context}"
+            user_content = query
+        else:
+            # Keep the prefix byte-stable; everything that changes per turn goes last
+            user_content = query
+            if context:
+                user_content = f"Use the following context to answer the question:\n{context}\n\nQuestion: {query}"
+
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(self._summary_message(conversation_summary))
+        for message in history[-self.max_history_messages:]:
+            messages.append({"role": message["role"], "content": message["content"]})
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+    async def warm_up(self) -> List[Dict]:
+        """Load the model on every pool endpoint that serves it, so the first real request doesn't pay for it"""
+        payload = {"model": self.model, "messages": []}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        async def load(endpoint) -> Dict:
+            started = asyncio.get_running_loop().time()
+            try:
+                async with httpx.AsyncClient(timeout=self.default_timeout) as client:
+                    response = await client.post(endpoint.url + self.CHAT_PATH, json=payload)
+                    response.raise_for_status()
+                elapsed = round(asyncio.get_running_loop().time() - started, 3)
+                print(f"[INFO] Warmed up {self.model} on {endpoint.url} in {elapsed}s")
+                return {"endpoint": endpoint.url, "success": True, "seconds": elapsed}
+            except Exception as e:
+                print(f"[WARN] Warm-up of {self.model} on {endpoint.url} failed: {e}")
+                return {"endpoint": endpoint.url, "success": False, "error": str(e)}
+
+        return await asyncio.gather(*(load(ep) for ep in self.pool.candidates(self.model)))
+
     # Keep this for backward compatibility if needed
-    async def _generate_from_llm(self, messages: List[Dict[str, str]]) -> str:
+    async def _generate_from_llm(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                                 max_tokens: int = 2048, profile: Optional[GenerationProfile] = None,
+                                 usage: Optional[Dict] = None) -> str:
         """Generate response from LLM - now just a wrapper around _make_api_request"""
-        payload = self._create_payload(messages, temperature=0.7, max_tokens=2048)
-        return await self._make_api_request(payload)
+        payload = self._create_payload(messages, temperature=temperature, max_tokens=max_tokens, profile=profile)
+        return await self._make_api_request(payload, usage=usage)
 
     def _format_messages_for_llm(self, messages: List[Dict[str, str]]) -> str:
         """Format messages for specific LLM format if needed"""
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional, Any, Set
+
+import ollama
+
+
+class ModelResidencyScheduler:
+    """
+    Keeps bulk embedding work from thrashing the models loaded in a shared Ollama instance.
+
+    Interactive requests (chat generation, query embedding) run immediately inside
+    interactive(). Bulk ingestion goes through bulk_embed(), which sends the texts in
+    bursts of one batched embedding call each and holds every burst back until no
+    interactive request has been active for quiet_seconds (at most max_defer_seconds,
+    so ingestion can't starve).
+
+    Resident models are read from Ollama's /api/ps. A "swap" is a request for a model
+    that wasn't resident. A held-back burst counts as two avoided swaps (embedding
+    model in, chat model back) once, when the first interactive request for another
+    model that isn't co-resident with the embedding model starts during the deferral.
+    Nothing is counted while residency is unknown (/api/ps hasn't answered yet).
+    """
+
+    def __init__(self, embedder, burst_size: int = 64, quiet_seconds: float = 2.0,
+                 max_defer_seconds: float = 30.0, ps_interval: float = 5.0):
+        self.embedder = embedder
+        self.burst_size = burst_size
+        self.quiet_seconds = quiet_seconds
+        self.max_defer_seconds = max_defer_seconds
+        self.ps_interval = ps_interval
+        self._interactive = 0
+        self._last_interactive = 0.0
+        self._deferred_bursts = 0
+        # Whether the current deferral has counted its avoided swaps (bursts run one at a time)
+        self._deferral_counted = False
+        self._burst_lock = asyncio.Lock()
+        self._last_model: Optional[str] = None
+        # None until /api/ps has answered once
+        self._resident: Optional[Set[str]] = None
+        self._resident_checked = 0.0
+        self._refreshing = False
+        self.stats = {
+            "interactive_requests": 0, "bursts": 0, "texts_embedded": 0,
+            "deferrals": 0, "forced_bursts": 0, "defer_seconds": 0.0,
+            "model_switches": 0, "swaps": 0, "avoided_swaps": 0,
+        }
+
+    async def refresh_resident(self, force: bool = False) -> Optional[Set[str]]:
+        """Re-read the loaded models from /api/ps (at most every ps_interval seconds)"""
+        now = time.monotonic()
+        if self._refreshing or (not force and now - self._resident_checked < self.ps_interval):
+            return self._resident
+        self._refreshing = True
+        try:
+            response = await asyncio.to_thread(ollama.ps)
+            self._resident = {m.get("model") or m.get("name") for m in response.get("models", [])}
+        except Exception as e:
+            print(f"[WARN] Could not read loaded models from Ollama: {e}")
+        finally:
+            self._resident_checked = time.monotonic()
+            self._refreshing = False
+        return self._resident
+
+    @staticmethod
+    def _matches(model: str, resident: Set[str]) -> bool:
+        return model in resident or f"{model}:latest" in resident
+
+    def _co_resident(self, model: str) -> bool:
+        if self._resident is None:
+            return False
+        return self._matches(model, self._resident) and self._matches(self.embedder.model_name, self._resident)
+
+    def _use(self, model: str):
+        """Record that a request for model is about to hit the instance"""
+        if self._last_model is not None and model != self._last_model:
+            self.stats["model_switches"] += 1
+            if self._resident is not None and not self._matches(model, self._resident):
+                self.stats["swaps"] += 1
+        self._last_model = model
+        if self._resident is not None:
+            self._resident.add(model)
+
+    @asynccontextmanager
+    async def interactive(self, model: Optional[str]):
+        """
+        Mark an interactive request for model; bulk embedding bursts wait while any is active.
+
+        model=None marks user activity that doesn't reach Ollama (e.g. a cache hit).
+        """
+        self._interactive += 1
+        self.stats["interactive_requests"] += 1
+        if model is not None:
+            if (self._deferred_bursts and not self._deferral_counted and self._resident is not None
+                    and model != self.embedder.model_name and not self._co_resident(model)):
+                self._deferral_counted = True
+                self.stats["avoided_swaps"] += 2
+            self._use(model)
+            # Refresh residency in the background; never delay the interactive request for it
+            asyncio.ensure_future(self.refresh_resident())
+        try:
+            yield
+        finally:
+            self._interactive -= 1
+            self._last_interactive = time.monotonic()
+
+    async def _wait_for_quiet(self):
+        started = time.monotonic()
+        deadline = started + self.max_defer_seconds
+        deferred = False
+        try:
+            while True:
+                now = time.monotonic()
+                if self._interactive == 0 and now - self._last_interactive >= self.quiet_seconds:
+                    break
+                if now >= deadline:
+                    self.stats["forced_bursts"] += 1
+                    break
+                if not deferred:
+                    deferred = True
+                    self._deferral_counted = False
+                    self._deferred_bursts += 1
+                    self.stats["deferrals"] += 1
+                await asyncio.sleep(min(0.25, deadline - now))
+        finally:
+            if deferred:
+                self._deferred_bursts -= 1
+                self.stats["defer_seconds"] += time.monotonic() - started
+
+    async def bulk_embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts for ingestion in deferred bursts; returns one embedding per text"""
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), self.burst_size):
+            burst = texts[start:start + self.burst_size]
+            # One burst at a time across uploads, so concurrent ingestions don't interleave either
+            async with self._burst_lock:
+                await self._wait_for_quiet()
+                await self.refresh_resident()
+                self._use(self.embedder.model_name)
+                embeddings.extend(await asyncio.to_thread(self.embedder.embed_batch, burst, len(burst)))
+            self.stats["bursts"] += 1
+            self.stats["texts_embedded"] += len(burst)
+        return embeddings
+
+    def status(self) -> Dict[str, Any]:
+        """Return counters, the resident models and current interactive load"""
+        return {
+            **self.stats,
+            "defer_seconds": round(self.stats["defer_seconds"], 3),
+            "resident_models": sorted(self._resident) if self._resident is not None else None,
+            "last_model": self._last_model,
+            "interactive_in_flight": self._interactive,
+            "bursts_waiting": self._deferred_bursts,
+        }
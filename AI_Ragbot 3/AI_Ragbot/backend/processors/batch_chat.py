@@ -0,0 +1,143 @@
+import asyncio
+import time
+from typing import List, Dict, Optional, Any, AsyncGenerator
+
+
+class BatchChatRunner:
+    """
+    Answers many independent queries that share app and system prompt settings.
+
+    Queries are processed in chunks: each chunk is embedded with one batched call
+    and retrieved with one multi-query vector search, and its answers are generated
+    concurrently up to max_concurrency while the next chunk is being retrieved.
+    Results are yielded as they complete, each tagged with the query's index.
+    """
+
+    def __init__(self, llm, embedder, chroma_db, chat_history=None,
+                 max_concurrency: int = 4, chunk_size: int = 64):
+        """
+        Args:
+            llm: LlamaModel used for generation
+            embedder: LocalEmbedder with embed_batch()
+            chroma_db: ChromaDBHandler with similarity_search_by_embeddings()
+            chat_history: AsyncChatHistory used when results are persisted
+            max_concurrency: Default number of generations in flight at once
+            chunk_size: Queries embedded and retrieved together
+        """
+        self.llm = llm
+        self.embedder = embedder
+        self.chroma_db = chroma_db
+        self.chat_history = chat_history
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+
+    async def _retrieve(self, queries: List[str], top_k: List[int]) -> List[str]:
+        """Context for each query (empty where top_k is 0) from one embed call and one search"""
+        wanted = [i for i, k in enumerate(top_k) if k > 0]
+        contexts = [""] * len(queries)
+        if not wanted:
+            return contexts
+        embeddings = await asyncio.to_thread(self.embedder.embed_batch, [queries[i] for i in wanted])
+        results = await asyncio.to_thread(
+            self.chroma_db.similarity_search_by_embeddings, embeddings, max(top_k[i] for i in wanted)
+        )
+        for i, docs in zip(wanted, results):
+            contexts[i] = "\n\n".join(doc["content"] for doc in docs[:top_k[i]])
+        return contexts
+
+    async def _answer(self, query: str, context: str, system_prompt: str, profile, usage: Dict) -> str:
+        if context:
+            async for update in self.llm.generate_response(
+                query=query, context=context, system_prompt=system_prompt, profile=profile
+            ):
+                if update["status"] == "complete":
+                    usage.update(update.get("usage", {}))
+                    return update["message"]
+                if update["status"] == "error":
+                    raise RuntimeError(update["message"])
+            return ""
+        return await self.llm.generate_async(query, system_prompt=system_prompt, profile=profile, usage=usage)
+
+    async def _persist(self, query: str, response: str, system_prompt: str, app_name: Optional[str],
+                 usage: Dict) -> str:
+        metadata = {"system_prompt": system_prompt, "batch": True}
+        if app_name:
+            metadata["app_name"] = app_name
+        chat_id = await self.chat_history.create_conversation(title=query[:30] + "...", metadata=metadata)
+        await self.chat_history.add_message(chat_id, "user", query)
+        await self.chat_history.add_message(chat_id, "assistant", response, usage=usage, app_name=app_name)
+        return chat_id
+
+    async def run(self, queries: List[str], system_prompt: str = "You are a helpful assistant.",
+                  use_docs: bool = False, top_k: int = 5, profile=None,
+                  retrieval_gate=None, gate_config: Optional[Dict[str, Any]] = None,
+                  app_name: Optional[str] = None, persist: bool = False,
+                  max_concurrency: Optional[int] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Answer every query and yield one result dict per query in completion order.
+
+        Each result has index, query, response, usage (Ollama token/timing counters)
+        and elapsed_ms, plus chat_id when persisted or error if the query failed; a
+        failed query doesn't stop the batch.
+        """
+        if persist and self.chat_history is None:
+            raise ValueError("persist=True needs a chat_history handler")
+        limit = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+
+        async def answer(index: int, query: str, context: str, retrieved: bool):
+            started = time.perf_counter()
+            result = {"index": index, "query": query, "retrieved": retrieved}
+            usage = {}
+            try:
+                response = await self._answer(query, context, system_prompt, profile, usage)
+                if self.llm.is_error_response(response):
+                    raise RuntimeError(response)
+                result["response"] = response
+                result["usage"] = usage
+                if persist:
+                    result["chat_id"] = await self._persist(query, response, system_prompt, app_name, usage)
+                elif self.chat_history is not None:
+                    await self.chat_history.record_generation(usage, app_name)
+            except Exception as e:
+                print(f"[ERROR] Batch query {index} failed: {e}")
+                result["response"] = None
+                result["error"] = str(e)
+            finally:
+                limit.release()
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            await results.put(result)
+
+        async def schedule():
+            for start in range(0, len(queries), self.chunk_size):
+                chunk = queries[start:start + self.chunk_size]
+                chunk_top_k = [top_k if use_docs else 0] * len(chunk)
+                if use_docs and retrieval_gate is not None and gate_config:
+                    for i, query in enumerate(chunk):
+                        decision = retrieval_gate.decide(query, [], gate_config)
+                        chunk_top_k[i] = decision["top_k"] if decision["retrieve"] else 0
+                try:
+                    contexts = await self._retrieve(chunk, chunk_top_k)
+                except Exception as e:
+                    print(f"[ERROR] Batch retrieval failed for queries {start}-{start + len(chunk) - 1}: {e}")
+                    for offset, query in enumerate(chunk):
+                        await results.put({"index": start + offset, "query": query, "response": None,
+                                           "error": f"Retrieval failed: {e}", "elapsed_ms": 0.0})
+                    continue
+                for offset, (query, context) in enumerate(zip(chunk, contexts)):
+                    await limit.acquire()
+                    tasks.append(asyncio.create_task(
+                        answer(start + offset, query, context, chunk_top_k[offset] > 0)
+                    ))
+
+        scheduler = asyncio.create_task(schedule())
+        try:
+            for _ in range(len(queries)):
+                yield await results.get()
+            await scheduler
+        finally:
+            # Stop outstanding work if the consumer goes away early
+            scheduler.cancel()
+            for task in tasks:
+                task.cancel()
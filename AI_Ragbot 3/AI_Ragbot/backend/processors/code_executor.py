@@ -4,27 +4,46 @@ import uuid
 import json
 import tempfile
 import time
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
+from processors.code_worker_pool import CodeWorkerPool
  
 class CodeExecutor:
-    def __init__(self, timeout: int = 5, max_output_size: int = 10000):
+    def __init__(self, timeout: int = 5, max_output_size: int = 10000, pool_size: int = 0,
+                 max_runs_per_worker: int = 50, worker_memory_mb: int = 512, preload: str = ""):
         """
         Initialize the code executor with safety parameters
         Args:
             timeout: Maximum execution time in seconds
             max_output_size: Maximum size of output in characters
+            pool_size: Warm worker interpreters to keep (0 starts a new interpreter per snippet)
+            max_runs_per_worker: Snippets a worker runs before it is replaced
+            worker_memory_mb: Address-space limit of each snippet (POSIX only, 0 for none)
+            preload: Comma-separated modules workers import before taking snippets
         """
         self.timeout = timeout
         self.max_output_size = max_output_size
         self.temp_dir = tempfile.gettempdir()
+        self.pool: Optional[CodeWorkerPool] = None
+        if pool_size > 0:
+            self.pool = CodeWorkerPool(
+                size=pool_size,
+                timeout=timeout,
+                max_output_size=max_output_size,
+                max_runs=max_runs_per_worker,
+                memory_mb=worker_memory_mb,
+                preload=preload
+            )
     def execute_python_code(self, code: str) -> Dict[str, Any]:
         """
         Execute Python code safely and return the result
         Args:
             code: Python code string to execute
         Returns:
-            Dictionary containing execution status, output, and error if any
+            Dictionary containing execution status, output, error if any, execution_time
+            and queue_wait (seconds spent waiting for a free worker)
         """
+        if self.pool is not None:
+            return self.pool.execute(code)
         # Create a unique file name
         file_id = str(uuid.uuid4())
         file_path = os.path.join(self.temp_dir, f"{file_id}.py")
@@ -50,7 +69,8 @@ class CodeExecutor:
                     "success": False,
                     "output": "",
                     "error": f"Execution timed out after {self.timeout} seconds",
-                    "execution_time": self.timeout
+                    "execution_time": self.timeout,
+                    "queue_wait": 0
                 }
             execution_time = time.time() - start_time
             # Truncate output if too large
@@ -62,14 +82,16 @@ class CodeExecutor:
                 "success": process.returncode == 0,
                 "output": stdout,
                 "error": stderr,
-                "execution_time": round(execution_time, 3)
+                "execution_time": round(execution_time, 3),
+                "queue_wait": 0
             }
         except Exception as e:
             return {
                 "success": False,
                 "output": "",
                 "error": f"Error executing code: {str(e)}",
-                "execution_time": 0
+                "execution_time": 0,
+                "queue_wait": 0
             }
         finally:
             # Clean up the temporary file
@@ -78,6 +100,11 @@ class CodeExecutor:
                     os.remove(file_path)
                 except:
                     pass
+
+    def close(self):
+        """Stop the warm workers, if any"""
+        if self.pool is not None:
+            self.pool.close()
  
 # Optional: Enhanced security with resource limits using module like 'resource'
 # Consider adding more security measures based on your requirements
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Code execution worker, started by CodeWorkerPool as a separate interpreter:
+    python -I code_worker.py <memory limit MB> <timeout seconds> <preload modules>
+
+Reads one JSON request per line from the original stdin ({"id", "code",
+"max_output"}) and writes one JSON response per line to the original stdout.
+The snippet's own prints are captured per run; file descriptors 0-2 point at
+/dev/null so nothing the snippet does can read or corrupt the protocol streams.
+
+Where os.fork exists, the worker itself never runs a snippet: each one runs in a
+child forked from the warm interpreter, in a fresh temporary directory, so it gets
+a copy-on-write clean state and nothing it changes outlives it. The worker enforces
+the timeout by killing the child's process group. Without fork (Windows) snippets
+run in the worker itself and the pool replaces the worker after every run.
+"""
+import importlib
+import io
+import json
+import os
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+
+class _CappedBuffer(io.StringIO):
+    """StringIO that stops growing once it holds limit characters"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, text: str) -> int:
+        room = self.limit - self.tell()
+        if room <= 0:
+            self.truncated = True
+            return len(text)
+        if len(text) > room:
+            self.truncated = True
+        return super().write(text[:room])
+
+
+def _limit_resources(memory_mb: int):
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows; the parent's timeout still applies
+        return
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run(code: str, max_output: int) -> dict:
+    stdout, stderr = _CappedBuffer(max_output), _CappedBuffer(max_output)
+    sys.stdout, sys.stderr = stdout, stderr
+    success = True
+    started = time.perf_counter()
+    try:
+        exec(compile(code, "<snippet>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        success = e.code in (None, 0)
+        if not success and not isinstance(e.code, int):
+            stderr.write(f"{e.code}\n")
+    except BaseException:
+        success = False
+        # Drop the worker's own frame so the traceback starts at the snippet
+        exc_type, exc, tb = sys.exc_info()
+        stderr.write("".join(traceback.format_exception(exc_type, exc, tb.tb_next)))
+    finally:
+        execution_time = time.perf_counter() - started
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    output, error = stdout.getvalue(), stderr.getvalue()
+    if stdout.truncated:
+        output += "\n... (output truncated)"
+    if stderr.truncated:
+        error += "\n... (error output truncated)"
+    return {"success": success, "output": output, "error": error, "execution_time": execution_time}
+
+
+def _enter_workdir(workdir: str):
+    """Make workdir the snippet's working directory and TMPDIR"""
+    os.chdir(workdir)
+    os.environ["TMPDIR"] = tempfile.tempdir = workdir
+
+
+def _run_in_workdir(code: str, max_output: int) -> dict:
+    """Run a snippet in the worker itself, in a temporary directory of its own"""
+    workdir, previous = tempfile.mkdtemp(prefix="code-run-"), os.getcwd()
+    _enter_workdir(workdir)
+    try:
+        return _run(code, max_output)
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_forked(code: str, max_output: int, memory_mb: int, timeout: float, closing) -> dict:
+    """Run a snippet in a forked child and return its result (or a timeout/crash error)"""
+    workdir = tempfile.mkdtemp(prefix="code-run-")
+    read_fd, write_fd = os.pipe()
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        # Child: own process group (so stray subprocesses are killed with it), no protocol fds
+        status = 1
+        try:
+            os.close(read_fd)
+            os.setpgid(0, 0)
+            for f in closing:
+                os.close(f.fileno())
+            _enter_workdir(workdir)
+            _limit_resources(memory_mb)
+            data = json.dumps(_run(code, max_output)).encode("utf-8")
+            while data:
+                data = data[os.write(write_fd, data):]
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = started + timeout
+    timed_out = False
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select([read_fd], [], [], remaining)
+        if ready:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    os.close(read_fd)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    _, status = os.waitpid(pid, 0)
+    execution_time = time.perf_counter() - started
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if timed_out:
+        return {"success": False, "output": "", "error": f"Execution timed out after {timeout:g} seconds",
+                "execution_time": execution_time}
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError:
+        # Nothing (or half a result) written: the snippet killed its process (os._exit, memory limit, ...)
+        reason = f"signal {os.WTERMSIG(status)}" if os.WIFSIGNALED(status) else f"status {os.WEXITSTATUS(status)}"
+        return {"success": False, "output": "", "error": f"Code execution process exited unexpectedly ({reason})",
+                "execution_time": execution_time}
+
+
+def main():
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    preload = [name for name in (sys.argv[3] if len(sys.argv) > 3 else "").split(",") if name]
+    forking = hasattr(os, "fork")
+
+    # Keep the real stdin/stdout for the protocol; snippets get /dev/null on fds 0-2
+    requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    sys.stdin = sys.__stdin__ = open(os.devnull, "r")
+    sys.stdout = sys.__stdout__ = open(os.devnull, "w")
+    sys.stderr = sys.__stderr__ = open(os.devnull, "w")
+
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    if not forking:
+        _limit_resources(memory_mb)
+    protocol.write(json.dumps({"ready": True, "pid": os.getpid(), "fork": forking}) + "\n")
+    protocol.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        max_output = request.get("max_output", 10000)
+        if forking:
+            response = _run_forked(request["code"], max_output, memory_mb, timeout, (requests, protocol))
+        else:
+            response = _run_in_workdir(request["code"], max_output)
+        response["id"] = request["id"]
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Optional
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_worker.py")
+
+
+class _Worker:
+    """One warm interpreter running code_worker.py, with a thread reading its responses"""
+
+    def __init__(self, memory_mb: int, timeout: float, preload: str):
+        self.workdir = tempfile.mkdtemp(prefix="code-worker-")
+        self.process = subprocess.Popen(
+            # -I: isolated mode (no user site-packages, PYTHON* variables or cwd on sys.path)
+            [sys.executable, "-I", WORKER_SCRIPT, str(memory_mb), str(timeout), preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.workdir,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        self.responses: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.runs = 0
+        self.forks = False
+        threading.Thread(target=self._read, name=f"code-worker-{self.process.pid}", daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.responses.put(json.loads(line))
+        # EOF: the worker exited
+        self.responses.put(None)
+
+    def wait_ready(self, timeout: float) -> bool:
+        try:
+            message = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        if not (message and message.get("ready")):
+            return False
+        self.forks = bool(message.get("fork"))
+        return True
+
+    def send(self, request: Dict[str, Any]):
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class CodeWorkerPool:
+    """
+    Pre-started Python interpreters that run code snippets sent over a pipe.
+
+    Starting an interpreter (plus the imports snippets commonly use) happens once per
+    worker instead of once per snippet. Snippets never share state: each runs in a
+    child forked from the worker, in a temporary directory of its own, and the worker
+    kills it when it exceeds the timeout. Where fork is unavailable (Windows) the
+    snippet runs in the worker, which is then replaced after that single run.
+
+    Workers are also retired after max_runs snippets and whenever they stop
+    responding; a replacement is started in the background (retried with backoff
+    if it fails to start) so the pool stays warm. Each result reports how long it
+    waited for a free worker (queue_wait) apart from how long the snippet ran
+    (execution_time).
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 5, max_output_size: int = 10000, max_runs: int = 50,
+                 memory_mb: int = 512, preload: str = "", start_timeout: float = 30,
+                 retry_delay: float = 1, max_retry_delay: float = 60):
+        self.size = size
+        self.timeout = timeout
+        self.max_output_size = max_output_size
+        self.max_runs = max_runs
+        self.memory_mb = memory_mb
+        self.preload = preload
+        self.start_timeout = start_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"runs": 0, "started": 0, "start_failures": 0, "recycled_max_runs": 0,
+                      "recycled_single_run": 0, "recycled_timeout": 0, "recycled_crash": 0, "queue_wait_ms": 0.0, "execution_ms": 0.0}
+        for _ in range(size):
+            self._spawn_async()
+
+    def _start_worker(self) -> Optional[_Worker]:
+        try:
+            worker = _Worker(self.memory_mb, self.timeout, self.preload)
+        except OSError as e:
+            print(f"[ERROR] Could not start a code worker: {e}")
+            return None
+        if not worker.wait_ready(self.start_timeout):
+            print(f"[ERROR] Code worker {worker.process.pid} failed to start")
+            worker.kill()
+            return None
+        return worker
+
+    def _spawn(self):
+        """Start a worker, retrying with exponential backoff until one starts or the pool closes"""
+        delay = self.retry_delay
+        while not self._closed:
+            worker = self._start_worker()
+            if worker is not None:
+                with self._lock:
+                    self.stats["started"] += 1
+                if self._closed:
+                    worker.kill()
+                else:
+                    self._idle.put(worker)
+                return
+            with self._lock:
+                self.stats["start_failures"] += 1
+            print(f"[WARN] Retrying code worker start in {delay:g}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _spawn_async(self):
+        threading.Thread(target=self._spawn, name="code-worker-spawn", daemon=True).start()
+
+    def _retire(self, worker: _Worker, reason: str):
+        worker.kill()
+        with self._lock:
+            self.stats[f"recycled_{reason}"] += 1
+        if not self._closed:
+            self._spawn_async()
+
+    def execute(self, code: str) -> Dict[str, Any]:
+        """Run a snippet on the next free worker (blocks until one is free)"""
+        queued = time.perf_counter()
+        try:
+            worker = self._idle.get(timeout=self.start_timeout)
+        except queue.Empty:
+            return {"success": False, "output": "", "error": "No code worker available",
+                    "execution_time": 0, "queue_wait": round(time.perf_counter() - queued, 3)}
+        queue_wait = time.perf_counter() - queued
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+        started = time.perf_counter()
+        try:
+            worker.send({"id": request_id, "code": code, "max_output": self.max_output_size})
+            # The worker enforces the timeout itself; this only catches a worker that hangs
+            response = worker.responses.get(timeout=self.timeout + (5 if worker.forks else 0))
+        except queue.Empty:
+            self._retire(worker, "timeout")
+            response = {"success": False, "output": "",
+                        "error": f"Execution timed out after {self.timeout} seconds",
+                        "execution_time": self.timeout}
+        except OSError:
+            response = None
+        if response is None:
+            # EOF or broken pipe: the worker died (or, without fork, the snippet killed it)
+            self._retire(worker, "crash")
+            response = {"success": False, "output": "", "error": "Code worker exited unexpectedly",
+                        "execution_time": time.perf_counter() - started}
+        else:
+            worker.runs += 1
+            if not worker.forks:
+                # The snippet ran in the worker's own interpreter
+                self._retire(worker, "single_run")
+            elif worker.runs >= self.max_runs:
+                self._retire(worker, "max_runs")
+            elif self._closed:
+                worker.kill()
+            else:
+                self._idle.put(worker)
+        with self._lock:
+            self.stats["runs"] += 1
+            self.stats["queue_wait_ms"] += queue_wait * 1000
+            self.stats["execution_ms"] += response["execution_time"] * 1000
+        return {
+            "success": response["success"],
+            "output": response["output"],
+            "error": response["error"],
+            "execution_time": round(response["execution_time"], 3),
+            "queue_wait": round(queue_wait, 3),
+        }
+
+    def close(self):
+        """Stop every idle worker (busy ones are stopped as they finish)"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+    def status(self) -> Dict[str, Any]:
+        """Return run and recycle counters with average queue wait and execution time"""
+        runs = self.stats["runs"]
+        return {
+            **self.stats,
+            "queue_wait_ms": round(self.stats["queue_wait_ms"], 1),
+            "execution_ms": round(self.stats["execution_ms"], 1),
+            "avg_queue_wait_ms": round(self.stats["queue_wait_ms"] / runs, 2) if runs else None,
+            "avg_execution_ms": round(self.stats["execution_ms"] / runs, 2) if runs else None,
+            "idle": self._idle.qsize(),
+            "size": self.size,
+            "max_runs": self.max_runs,
+        }
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import List, Dict, Optional, Any, Set
+
+from models.generation_profile import GenerationProfile
+
+
+class ConversationSummarizer:
+    """
+    Maintains a compact running summary of a conversation in its metadata.
+
+    Messages that have fallen out of the LLM's recent-history window are folded
+    into the summary incrementally: each refresh only reads and sends the previous
+    summary plus the messages added since the last refresh, so the cost of a
+    refresh does not grow with the length of the session. summary_message_count in
+    the metadata is the seq of the last summarized message.
+    """
+
+    SUMMARY_SYSTEM_PROMPT = (
+        "You maintain a running summary of a conversation between a user and an assistant. "
+        "Merge the new messages into the existing summary. Keep facts the user stated, "
+        "their goals and preferences, decisions made, questions already asked and how the "
+        "user performed on them. Write plain prose without preamble."
+    )
+
+    def __init__(self, llm, chat_history, refresh_every_turns: int = 6,
+                 max_summary_chars: int = 1500, recent_window: Optional[int] = None,
+                 profile: Optional[GenerationProfile] = None):
+        """
+        Args:
+            llm: LlamaModel used to produce the summaries
+            chat_history: AsyncChatHistory holding the conversations
+            refresh_every_turns: Number of user/assistant turns to accumulate before refreshing
+            max_summary_chars: Upper bound on the stored summary length
+            recent_window: Messages sent verbatim to the model (defaults to llm.max_history_messages)
+            profile: Generation settings for summaries (the "summarizer" entry of appsettings.json)
+        """
+        self.llm = llm
+        self.chat_history = chat_history
+        self.refresh_every_turns = refresh_every_turns
+        self.max_summary_chars = max_summary_chars
+        self.recent_window = recent_window if recent_window is not None else llm.max_history_messages
+        self.profile = profile
+        self._in_progress: Set[str] = set()
+
+    @staticmethod
+    def get_summary(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Return the stored summary from conversation metadata, if any"""
+        if not metadata:
+            return None
+        return metadata.get("summary") or None
+
+    def needs_refresh(self, conversation: Dict[str, Any], refresh_every_turns: Optional[int] = None) -> bool:
+        """Check whether enough turns have left the recent window to refresh the summary"""
+        every = refresh_every_turns or self.refresh_every_turns
+        if every <= 0 or conversation.get("conversation_id") in self._in_progress:
+            return False
+        # Windowed conversations carry the total in message_count; only the count matters here
+        count = conversation.get("message_count", len(conversation.get("messages", [])))
+        covered = (conversation.get("metadata") or {}).get("summary_message_count", 0)
+        pending = max(count - self.recent_window, 0) - covered
+        return pending >= every * 2
+
+    def _build_messages(self, previous_summary: Optional[str], new_messages: List[Dict]) -> List[Dict]:
+        """Build the summarization request from the previous summary and the new messages"""
+        transcript = "\n".join(
+            f"{m['role'].upper()}: {m['content']}"
+            for m in new_messages if m["role"] in ["user", "assistant"]
+        )
+        prompt = (
+            f"Existing summary:\n{previous_summary or '(none yet)'}\n\n"
+            f"New messages:\n{transcript}\n\n"
+            f"Return the updated summary in at most {self.max_summary_chars} characters."
+        )
+        return [
+            {"role": "system", "content": self.SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+
+    async def refresh(self, conversation_id: str) -> Optional[str]:
+        """Fold the pending messages of a conversation into its running summary"""
+        if conversation_id in self._in_progress:
+            return None
+        self._in_progress.add(conversation_id)
+        try:
+            # The conversation row (with the newest message) for the metadata and last_seq
+            conversation = await self.chat_history.get_conversation_window(conversation_id, 1)
+            metadata = conversation.get("metadata") or {}
+            # Messages older than the recent window and not yet in the summary, read by seq
+            summarized = metadata.get("summary_message_count", 0)
+            covered = (conversation.get("last_seq") or 0) - self.recent_window
+            if covered <= summarized:
+                return self.get_summary(metadata)
+            pending = await self.chat_history.get_message_range(conversation_id, summarized, covered)
+            if not pending:
+                return self.get_summary(metadata)
+
+            usage = {}
+            summary = await self.llm._generate_from_llm(
+                self._build_messages(self.get_summary(metadata), pending),
+                profile=self.profile,
+                usage=usage
+            )
+            # Summaries are accounted separately from the app that owns the conversation
+            await self.chat_history.record_generation(usage, app_name="summarizer", conversation_id=conversation_id)
+            if self.llm.is_error_response(summary):
+                print(f"[WARN] Summary refresh failed for {conversation_id}: {summary[:100]}")
+                return None
+
+            summary = summary.strip()[:self.max_summary_chars]
+            await self.chat_history.update_conversation_metadata(conversation_id, {
+                "summary": summary,
+                "summary_message_count": covered,
+                "summary_updated_at": datetime.now().isoformat()
+            })
+            print(f"[DEBUG] Summary refreshed for {conversation_id}: {covered} messages covered")
+            return summary
+        except Exception as e:
+            print(f"[ERROR] Summary refresh crashed for {conversation_id}: {e}")
+            return None
+        finally:
+            self._in_progress.discard(conversation_id)
@@ -0,0 +1,151 @@
+import math
+import re
+from typing import List, Dict, Optional, Any
+
+
+class RetrievalGate:
+    """
+    Decides per turn whether a RAG query needs document retrieval, and how many chunks.
+
+    Clear-cut queries are settled by rules on the query alone (chit-chat is skipped,
+    explicit document questions always retrieve). The built-in rules only know generic
+    document words; an app adds its own domain vocabulary with "doc_terms" in its
+    retrieval_gate block (plain words, a trailing * matches any ending, e.g.
+    "entitle*"). Everything else goes through a tiny
+    hand-weighted logistic classifier over the query and the last assistant message;
+    its score picks between skipping retrieval and fetching 1..max_chunks chunks.
+    """
+
+    CHITCHAT = re.compile(
+        r"^(hi|hello|hey|thanks?|thank you|thx|ok(ay)?|cool|great|nice|got it|sure|yes|no|yep|nope|"
+        r"bye|goodbye|good (morning|afternoon|evening|night)|lol|haha|next( question)?|"
+        r"next question please|continue|go on|another( one)?|sounds good|awesome|perfect)"
+        r"( (please|thanks|thank you|!+))*[.!?]*$"
+    )
+    DOC_REFERENCE = re.compile(
+        r"\b(documents?|docs?|pdfs?|files?|attachment|attached|uploaded|sections?|clauses?|"
+        r"pages?|paragraph|according to|as per)\b"
+    )
+    QUESTION_START = re.compile(
+        r"^(what|when|where|which|who|whom|whose|why|how|can|could|do|does|did|is|are|"
+        r"should|would|will|may|explain|describe|list|tell)\b"
+    )
+    ACK_WORDS = {"ok", "okay", "thanks", "thank", "you", "cool", "great", "nice", "sure", "yes",
+                 "no", "please", "next", "lol", "haha", "got", "it", "hi", "hello", "hey"}
+
+    # Logistic classifier weights over the features built in _features()
+    WEIGHTS = {
+        "bias": -1.2,
+        "log_words": 0.9,
+        "question_mark": 1.1,
+        "question_start": 1.0,
+        "ack_ratio": -2.5,
+        "has_digit": 0.4,
+        "answers_question": 1.3,
+        "overlap_with_assistant": 1.0,
+    }
+
+    def __init__(self, threshold: float = 0.5, max_chunks: int = 5, min_chunks: int = 1):
+        self.threshold = threshold
+        self.max_chunks = max_chunks
+        self.min_chunks = min_chunks
+        self._term_patterns: Dict[tuple, Optional[re.Pattern]] = {}
+
+    @staticmethod
+    def get_config(app_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the app's retrieval_gate block if gating is enabled for it"""
+        gate_config = app_config.get("retrieval_gate")
+        if isinstance(gate_config, dict) and gate_config.get("enabled", False):
+            return gate_config
+        return None
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text.strip().lower())
+
+    def _domain_terms(self, terms: Optional[List[str]]) -> Optional[re.Pattern]:
+        """Compile (once) an app's doc_terms into a word-boundary pattern"""
+        key = tuple(terms or ())
+        if key not in self._term_patterns:
+            alternatives = []
+            for term in key:
+                term = self._normalize(str(term))
+                if term.endswith("*"):
+                    alternatives.append(re.escape(term[:-1]) + r"\w*")
+                elif term:
+                    alternatives.append(re.escape(term))
+            self._term_patterns[key] = re.compile(rf"\b({'|'.join(alternatives)})\b") if alternatives else None
+        return self._term_patterns[key]
+
+    def _decision(self, retrieve: bool, reason: str, score: float, confident: bool,
+                  max_chunks: int) -> Dict[str, Any]:
+        top_k = 0
+        if retrieve:
+            top_k = max(self.min_chunks, min(max_chunks, math.ceil(max_chunks * score)))
+        return {
+            "retrieve": retrieve,
+            "top_k": top_k,
+            "reason": reason,
+            "score": round(score, 3),
+            "confident": confident,
+        }
+
+    def _features(self, query: str, last_assistant: Optional[str]) -> Dict[str, float]:
+        words = re.findall(r"[a-z0-9']+", query)
+        features = {
+            "bias": 1.0,
+            "log_words": math.log1p(len(words)),
+            "question_mark": 1.0 if "?" in query else 0.0,
+            "question_start": 1.0 if self.QUESTION_START.match(query) else 0.0,
+            "ack_ratio": sum(w in self.ACK_WORDS for w in words) / len(words) if words else 1.0,
+            "has_digit": 1.0 if re.search(r"\d", query) else 0.0,
+            "answers_question": 0.0,
+            "overlap_with_assistant": 0.0,
+        }
+        if last_assistant:
+            last = self._normalize(last_assistant)
+            # A substantive reply to a question (e.g. a quiz answer) needs grounding to be assessed
+            if last.rstrip().endswith("?") and len(words) >= 3:
+                features["answers_question"] = 1.0
+            content_words = {w for w in words if len(w) > 3}
+            if content_words:
+                assistant_words = set(re.findall(r"[a-z0-9']+", last))
+                features["overlap_with_assistant"] = len(content_words & assistant_words) / len(content_words)
+        return features
+
+    def score(self, query: str, last_assistant: Optional[str] = None) -> float:
+        """Probability-like score that the query needs retrieval"""
+        features = self._features(self._normalize(query), last_assistant)
+        z = sum(self.WEIGHTS[name] * value for name, value in features.items())
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def decide(self, query: str, recent_messages: Optional[List[Dict[str, str]]] = None,
+               config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Decide whether to retrieve for this query.
+
+        Without recent_messages only the rules are applied; if they don't settle it the
+        decision comes back with confident=False and should be retaken with the history.
+        """
+        config = config or {}
+        threshold = config.get("threshold", self.threshold)
+        max_chunks = config.get("max_chunks", self.max_chunks)
+        normalized = self._normalize(query)
+
+        if not normalized or self.CHITCHAT.match(normalized):
+            return self._decision(False, "chit-chat", 0.0, True, max_chunks)
+        if self.DOC_REFERENCE.search(normalized):
+            return self._decision(True, "document reference", 1.0, True, max_chunks)
+        domain_terms = self._domain_terms(config.get("doc_terms"))
+        if domain_terms and domain_terms.search(normalized):
+            return self._decision(True, "domain term", 1.0, True, max_chunks)
+
+        last_assistant = None
+        for message in reversed(recent_messages or []):
+            if message["role"] == "assistant":
+                last_assistant = message["content"]
+                break
+
+        score = self.score(query, last_assistant)
+        retrieve = score >= threshold
+        return self._decision(retrieve, "classifier", score, recent_messages is not None, max_chunks)
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class StubOllama:
+    """
+    Minimal Ollama stand-in on a local port.
+
+    mode controls POST /api/chat: "ok" answers (after delay seconds) with a
+    final chat response naming the server, "drop" closes the connection without
+    a response. healthy controls GET /api/tags. Requests are counted per path and
+    POST bodies kept in payloads.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.mode = "ok"
+        self.healthy = True
+        self.delay = 0.0
+        self.requests = {}
+        self.payloads = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                if stub.healthy:
+                    self._reply(200, {"models": [{"name": "llama3:8b"}]})
+                else:
+                    self._reply(500, {"error": "unavailable"})
+
+            def do_POST(self):
+                stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                stub.payloads.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}"))
+                if stub.mode == "drop":
+                    self.close_connection = True
+                    return
+                time.sleep(stub.delay)
+                self._reply(200, {"model": "llama3:8b", "message": {"content": stub.name}, "done": True,
+                                  "prompt_eval_count": 10, "eval_count": 5})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def stop(self):
+        """Stop listening, so new connections are refused"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_ollama():
+    """Factory for StubOllama servers, all stopped after the test"""
+    stubs = []
+
+    def start(name: str = "stub") -> StubOllama:
+        stub = StubOllama(name)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        try:
+            stub.stop()
+        except Exception:
+            pass
@@ -0,0 +1,98 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+from database.archiver import ConversationArchiver
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+
+
+def set_updated_at(path, conversation_id, days_ago):
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("UPDATE conversations SET updated_at = ? WHERE conversation_id = ?",
+                           ((datetime.now() - timedelta(days=days_ago)).isoformat(), conversation_id))
+    connection.close()
+
+
+def contents(handler, conversation_id):
+    return [message["content"] for message in handler.get_conversation(conversation_id)["messages"]]
+
+
+def test_archive_skips_conversation_active_since_cutoff(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    try:
+        handler.create_conversation("c1")
+        handler.add_message("c1", "user", "hello")
+        cutoff = (datetime.now() - timedelta(days=1)).isoformat()
+        assert not handler.archive_conversation("c1", cutoff)
+        assert not handler.is_archived("c1")
+        assert handler.archive_conversation("c1", datetime.now().isoformat())
+        assert handler.is_archived("c1")
+    finally:
+        handler.close()
+
+
+def test_write_to_archived_conversation_restores_it_first(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    try:
+        handler.create_conversation("c1")
+        for content in ("same", "other"):
+            handler.add_message("c1", "user", content)
+        assert handler.archive_conversation("c1")
+        assert handler.add_message("c1", "assistant", "after archive")
+        assert not handler.is_archived("c1")
+        # Restored rows keep their hashes, so duplicates are still rejected
+        assert handler.add_message("c1", "user", "same") is None
+        assert contents(handler, "c1") == ["same", "other", "after archive"]
+        assert handler.get_conversation("c1")["message_count"] == 3
+        assert handler.search_conversations("same")["results"][0]["conversation_id"] == "c1"
+
+        assert handler.archive_conversation("c1")
+        result = handler.sync_messages("c1", 3, [{"role": "user", "content": "synced"}])
+        assert (result["applied"], result["last_seq"]) == (1, 4)
+        assert contents(handler, "c1")[-1] == "synced"
+    finally:
+        handler.close()
+
+
+def test_pass_compacts_only_after_changes(tmp_path):
+    path = str(tmp_path / "chat.db")
+    settings = {"default": {"retention": {"archive_after_days": 30}}}
+    store = AsyncChatHistory(ChatHistoryHandler(path))
+    archiver = ConversationArchiver(store, lambda: settings)
+
+    async def run():
+        await store.create_conversation("old")
+        await store.add_message("old", "user", "x" * 50000)
+        await store.create_conversation("new")
+        set_updated_at(path, "old", 60)
+        first = await archiver.run_once()
+        second = await archiver.run_once()
+        restored = await store.get_conversation("old")
+        return first, second, restored
+
+    try:
+        first, second, restored = asyncio.run(run())
+        assert first["archived"] == 1 and first["compaction"]["mode"] == "incremental"
+        assert second == {"archived": 0, "deleted": 0, "compaction": None}
+        assert restored["messages"][0]["content"] == "x" * 50000
+        assert archiver.status()["runs"] == 2
+    finally:
+        store.close()
+
+
+def test_enable_incremental_vacuum_converts_old_database(tmp_path):
+    path = str(tmp_path / "chat.db")
+    ChatHistoryHandler(path, {"auto_vacuum": "NONE"}).close()
+    handler = ChatHistoryHandler(path)
+    try:
+        assert handler.compact()["mode"] == "none"
+        handler.create_conversation("c1")
+        handler.add_message("c1", "user", "searchable text")
+        assert handler.enable_incremental_vacuum()["changed"] is True
+        assert handler.enable_incremental_vacuum()["changed"] is False
+        assert handler.compact()["mode"] == "incremental"
+        assert handler.search_conversations("searchable")["results"][0]["conversation_id"] == "c1"
+    finally:
+        handler.close()
@@ -0,0 +1,145 @@
+import asyncio
+
+import httpx
+import pytest
+
+from models.backend_pool import OllamaBackendPool, OllamaEndpoint
+
+
+def chat_sync(base_url: str) -> str:
+    response = httpx.post(base_url + "/api/chat", json={"model": "llama3:8b", "messages": []}, timeout=5)
+    response.raise_for_status()
+    return response.json()["message"]["content"]
+
+
+async def chat(base_url: str) -> str:
+    async with httpx.AsyncClient(timeout=5) as client:
+        response = await client.post(base_url + "/api/chat", json={"model": "llama3:8b", "messages": []})
+        response.raise_for_status()
+        return response.json()["message"]["content"]
+
+
+def make_pool(*stubs, **kwargs) -> OllamaBackendPool:
+    kwargs.setdefault("health_interval", 0)
+    return OllamaBackendPool([OllamaEndpoint(stub.url) for stub in stubs], **kwargs)
+
+
+def test_select_prefers_least_outstanding(stub_ollama):
+    a, b = stub_ollama("a"), stub_ollama("b")
+    pool = make_pool(a, b)
+    first = pool.select("llama3:8b")
+    second = pool.select("llama3:8b")
+    assert {first.url, second.url} == {a.url, b.url}
+    # first is released; it now has fewer outstanding requests than second
+    pool.release(first)
+    assert pool.select("llama3:8b") is first
+
+
+def test_concurrent_requests_spread_across_endpoints(stub_ollama):
+    a, b = stub_ollama("a"), stub_ollama("b")
+    a.delay = b.delay = 0.2
+    pool = make_pool(a, b)
+
+    async def run():
+        return await asyncio.gather(*(pool.request("llama3:8b", chat) for _ in range(4)))
+
+    answers = asyncio.run(run())
+    assert sorted(answers) == ["a", "a", "b", "b"]
+    assert all(endpoint.outstanding == 0 for endpoint in pool.endpoints)
+
+
+def test_sticky_key_keeps_conversation_on_one_endpoint(stub_ollama):
+    a, b = stub_ollama("a"), stub_ollama("b")
+    pool = make_pool(a, b)
+    answers = {pool.request_sync("llama3:8b", chat_sync, sticky_key="conversation-1") for _ in range(5)}
+    assert len(answers) == 1
+    # Without a key, idle endpoints take turns
+    assert {pool.request_sync("llama3:8b", chat_sync) for _ in range(4)} == {"a", "b"}
+
+
+def test_sticky_key_moves_when_endpoint_fails(stub_ollama):
+    a, b = stub_ollama("a"), stub_ollama("b")
+    pool = make_pool(a, b)
+    home = pool.request_sync("llama3:8b", chat_sync, sticky_key="conversation-1")
+    (a if home == "a" else b).stop()
+    other = "b" if home == "a" else "a"
+    assert pool.request_sync("llama3:8b", chat_sync, sticky_key="conversation-1") == other
+    assert pool.request_sync("llama3:8b", chat_sync, sticky_key="conversation-1") == other
+
+
+def test_failover_on_connect_error(stub_ollama):
+    down, up = stub_ollama("down"), stub_ollama("up")
+    down.stop()
+    pool = make_pool(down, up)
+    answers = [pool.request_sync("llama3:8b", chat_sync) for _ in range(3)]
+    assert answers == ["up", "up", "up"]
+    down_endpoint = pool.endpoints[0]
+    assert not down_endpoint.healthy and down_endpoint.failures == 1
+
+
+def test_failover_on_remote_protocol_error(stub_ollama):
+    dropping, up = stub_ollama("dropping"), stub_ollama("up")
+    dropping.mode = "drop"
+    pool = make_pool(dropping, up)
+
+    async def run():
+        return [await pool.request("llama3:8b", chat, sticky_key=f"c{i}") for i in range(3)]
+
+    assert asyncio.run(run()) == ["up", "up", "up"]
+    assert dropping.requests.get("/api/chat") == 1
+    assert not pool.endpoints[0].healthy
+
+
+def test_error_raised_when_every_endpoint_fails(stub_ollama):
+    a, b = stub_ollama("a"), stub_ollama("b")
+    a.stop()
+    b.stop()
+    pool = make_pool(a, b)
+    with pytest.raises(httpx.ConnectError):
+        pool.request_sync("llama3:8b", chat_sync)
+    assert [endpoint.healthy for endpoint in pool.endpoints] == [False, False]
+
+
+def test_model_routing(stub_ollama):
+    chat_host, embed_host = stub_ollama("chat"), stub_ollama("embed")
+    pool = OllamaBackendPool.from_spec(f"{chat_host.url}|llama3:8b,{embed_host.url}|nomic-embed-text",
+                                       "http://unused:11434", health_interval=0)
+    assert pool.select("llama3:8b").url == chat_host.url
+    assert pool.select("nomic-embed-text").url == embed_host.url
+    with pytest.raises(ValueError):
+        pool.select("mistral")
+
+
+def test_health_loop_brings_endpoint_back(stub_ollama):
+    flaky, up = stub_ollama("flaky"), stub_ollama("up")
+    pool = make_pool(flaky, up, health_interval=0.05)
+    flaky_endpoint = pool.endpoints[0]
+
+    async def run():
+        flaky.healthy = False
+        pool.ensure_health_checks()
+        await asyncio.sleep(0.3)
+        down_after_probe = flaky_endpoint.healthy
+        flaky.healthy = True
+        await asyncio.sleep(0.3)
+        pool.stop_health_checks()
+        return down_after_probe
+
+    assert asyncio.run(run()) is False
+    assert flaky_endpoint.healthy
+    assert flaky_endpoint.available_models == ["llama3:8b"]
+    assert flaky.requests["/api/tags"] >= 2
+
+
+def test_failed_endpoint_rejoins_rotation_after_probe(stub_ollama):
+    flaky, up = stub_ollama("flaky"), stub_ollama("up")
+    flaky.mode = "drop"
+    pool = make_pool(flaky, up)
+    # Whichever endpoint is picked first, the answer comes from the working one
+    assert pool.request_sync("llama3:8b", chat_sync) == "up"
+    pool.mark_failed(pool.endpoints[0])
+    assert {pool.request_sync("llama3:8b", chat_sync) for _ in range(3)} == {"up"}
+    flaky.mode = "ok"
+    asyncio.run(pool.probe())
+    assert pool.endpoints[0].healthy
+    assert {pool.request_sync("llama3:8b", chat_sync) for _ in range(4)} == {"flaky", "up"}
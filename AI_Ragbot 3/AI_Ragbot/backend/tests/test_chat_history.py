@@ -0,0 +1,24 @@
+from database.chat_history import ChatHistoryHandler
+
+
+def test_transcript_follows_seq_when_timestamps_tie(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    try:
+        result = handler.sync_messages("c1", 0, [{"role": "user", "content": f"synced {i}"} for i in range(5)],
+                                       title="Synced")
+        assert len({message["timestamp"] for message in result["messages"]}) == 1
+        assert [m["content"] for m in handler.get_conversation("c1")["messages"]] == [f"synced {i}" for i in range(5)]
+
+        # Imported rows stored out of order with one timestamp still read back in seq order
+        conversation = {"type": "conversation", "conversation_id": "c2", "title": "Imported",
+                        "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00",
+                        "metadata": {}, "message_count": 4, "last_seq": 4}
+        messages = [{"type": "message", "message_id": f"m{seq}", "conversation_id": "c2", "seq": seq,
+                     "role": "user", "content": f"imported {seq}", "timestamp": "2024-01-01T00:00:00"}
+                    for seq in (4, 2, 3, 1)]
+        handler.import_conversations([conversation] + messages)
+        assert [m["seq"] for m in handler.get_conversation("c2")["messages"]] == [1, 2, 3, 4]
+        assert handler.archive_conversation("c2") and handler.restore_conversation("c2")
+        assert [m["seq"] for m in handler.get_conversation("c2")["messages"]] == [1, 2, 3, 4]
+    finally:
+        handler.close()
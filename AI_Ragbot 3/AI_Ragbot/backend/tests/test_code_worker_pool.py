@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from processors.code_worker_pool import CodeWorkerPool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="snippets run in forked children on POSIX only")
+
+
+@pytest.fixture
+def pool():
+    pool = CodeWorkerPool(size=1, timeout=2, max_runs=50, memory_mb=256)
+    yield pool
+    pool.close()
+
+
+def test_snippets_do_not_share_interpreter_state_or_cwd(pool):
+    first = pool.execute("import math, builtins, os\n"
+                         "math.pi = 3\nbuiltins.leaked = True\n"
+                         "open('left-behind.txt', 'w').write('x')\nprint(os.getcwd())")
+    second = pool.execute("import math, builtins, os\n"
+                          "print(math.pi, hasattr(builtins, 'leaked'), os.path.exists('left-behind.txt'), os.getcwd())")
+    assert first["success"] and second["success"], (first, second)
+    pi, leaked, exists, cwd = second["output"].split()
+    assert (pi, leaked, exists) == ("3.141592653589793", "False", "False")
+    assert cwd != first["output"].strip()
+    assert not os.path.exists(first["output"].strip())
+    # Both ran on the same warm worker
+    assert pool.status()["started"] == 1 and pool.status()["recycled_single_run"] == 0
+
+
+def test_timeout_and_exit_keep_the_worker(pool):
+    slow = pool.execute("import time\ntime.sleep(10)")
+    assert not slow["success"] and "timed out" in slow["error"]
+    assert slow["execution_time"] < 5
+    died = pool.execute("import os\nos._exit(3)")
+    assert not died["success"] and "status 3" in died["error"]
+    failed = pool.execute("raise ValueError('boom')")
+    assert not failed["success"] and "ValueError: boom" in failed["error"]
+    assert pool.execute("print('still warm')")["output"] == "still warm\n"
+    status = pool.status()
+    assert status["started"] == 1
+    assert status["recycled_timeout"] == status["recycled_crash"] == 0
+
+
+def test_output_is_capped():
+    pool = CodeWorkerPool(size=1, timeout=2, max_output_size=100)
+    try:
+        result = pool.execute("print('x' * 1000)")
+        assert result["success"]
+        assert result["output"].startswith("x" * 100) and result["output"].endswith("(output truncated)")
+    finally:
+        pool.close()
+
+
+def test_failed_worker_start_is_retried_with_backoff(monkeypatch):
+    real_start = CodeWorkerPool._start_worker
+    attempts = []
+
+    def flaky_start(self):
+        attempts.append(1)
+        return None if len(attempts) < 3 else real_start(self)
+
+    monkeypatch.setattr(CodeWorkerPool, "_start_worker", flaky_start)
+    pool = CodeWorkerPool(size=1, timeout=2, retry_delay=0.01, max_retry_delay=0.02)
+    try:
+        assert pool.execute("print(1 + 1)")["output"] == "2\n"
+        assert len(attempts) == 3
+        assert pool.status()["start_failures"] == 2
+    finally:
+        pool.close()
+
@@ -0,0 +1,112 @@
+import asyncio
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from database.conversation_cache import ConversationCache
+
+
+def loaded(conversation_id, count, has_more=False, last_seq=None):
+    messages = [{"message_id": f"m{seq}", "seq": seq, "role": "user", "content": f"text {seq}",
+                 "timestamp": f"t{seq}"} for seq in range(1, count + 1)]
+    last_seq = count if last_seq is None else last_seq
+    return {"conversation_id": conversation_id, "title": "Chat", "created_at": "t0", "updated_at": f"t{count}",
+            "message_count": last_seq, "last_seq": last_seq, "metadata": {"system_prompt": "Be brief."},
+            "messages": messages, "has_more": has_more}
+
+
+def load(cache, conversation):
+    cache.start_load(conversation["conversation_id"])
+    cache.finish_load(conversation["conversation_id"], conversation)
+
+
+def test_hit_after_load_and_window_slicing():
+    cache = ConversationCache()
+    assert cache.get_full("c") is None
+    load(cache, loaded("c", 5))
+    full = cache.get_full("c")
+    assert [m["seq"] for m in full["messages"]] == [1, 2, 3, 4, 5]
+    assert full["metadata"] == {"system_prompt": "Be brief."}
+    window = cache.get_window("c", 2)
+    assert [m["seq"] for m in window["messages"]] == [4, 5]
+    assert window["has_more"] and window["next_cursor"] == "m4"
+    assert cache.stats["hits"] == 2 and cache.stats["misses"] == 1
+
+
+def test_partial_entry_serves_only_windows_it_holds():
+    cache = ConversationCache()
+    load(cache, loaded("c", 3, has_more=True, last_seq=10))
+    assert cache.get_window("c", 3) is not None
+    assert cache.get_window("c", 4) is None
+    assert cache.get_full("c") is None
+
+
+def test_message_cap_keeps_newest_messages():
+    cache = ConversationCache(max_messages=3)
+    load(cache, loaded("c", 5))
+    assert cache.get_full("c") is None
+    assert [m["seq"] for m in cache.get_window("c", 3)["messages"]] == [3, 4, 5]
+
+
+def test_lru_eviction():
+    cache = ConversationCache(max_conversations=2)
+    load(cache, loaded("a", 1))
+    load(cache, loaded("b", 1))
+    cache.get_full("a")
+    load(cache, loaded("c", 1))
+    assert cache.get_full("b") is None
+    assert cache.get_full("a") is not None and cache.get_full("c") is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_write_through_appends_in_sequence():
+    cache = ConversationCache()
+    load(cache, loaded("c", 2))
+    cache.apply_message("c", {"message_id": "m3", "seq": 3, "role": "assistant", "content": "hi", "timestamp": "t3"})
+    cache.apply_title("c", "Renamed")
+    cache.apply_metadata("c", {"summary": "short"})
+    conversation = cache.get_full("c")
+    assert [m["seq"] for m in conversation["messages"]] == [1, 2, 3]
+    assert conversation["message_count"] == 3 and conversation["updated_at"] == "t3"
+    assert conversation["title"] == "Renamed" and conversation["metadata"]["summary"] == "short"
+
+
+def test_sequence_gap_invalidates():
+    cache = ConversationCache()
+    load(cache, loaded("c", 2))
+    cache.apply_message("c", {"message_id": "m5", "seq": 5, "role": "user", "content": "x", "timestamp": "t5"})
+    assert cache.get_full("c") is None
+    assert cache.stats["invalidations"] == 1
+
+
+def test_load_overlapping_a_write_is_not_cached():
+    cache = ConversationCache()
+    cache.start_load("c")
+    cache.apply_title("c", "Changed while reading")
+    cache.finish_load("c", loaded("c", 2))
+    assert cache.get_full("c") is None
+    assert cache.stats["stale_loads"] == 1
+
+
+def test_async_store_serves_cached_reads_consistently(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    store = AsyncChatHistory(handler, cache_size=8)
+
+    async def run():
+        conversation_id = await store.create_conversation(metadata={"system_prompt": "Be brief."})
+        await store.add_message(conversation_id, "user", "first")
+        await store.get_conversation(conversation_id)  # loads the cache
+        await store.add_message(conversation_id, "assistant", "second")
+        await store.update_conversation_title(conversation_id, "Titled")
+        cached = await store.get_conversation(conversation_id)
+        fresh = handler.get_conversation(conversation_id)
+        await store.delete_conversation(conversation_id)
+        return cached, fresh, store.cache.status()
+
+    try:
+        cached, fresh, status = asyncio.run(run())
+    finally:
+        store.close()
+    assert [m["content"] for m in cached["messages"]] == [m["content"] for m in fresh["messages"]] == ["first", "second"]
+    assert cached["title"] == fresh["title"] == "Titled"
+    assert cached["last_seq"] == fresh["last_seq"] == 2
+    assert status["hits"] >= 1 and status["conversations"] == 0
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from models.llm_handler import LlamaModel
+from processors.conversation_summarizer import ConversationSummarizer
+
+
+def sent_messages(payload):
+    """Message lines of the transcript in a summarization request"""
+    prompt = payload["messages"][-1]["content"]
+    transcript = prompt.split("New messages:\n", 1)[1].split("\n\n", 1)[0]
+    return [line.split(": ", 1)[1] for line in transcript.split("\n")]
+
+
+@pytest.mark.parametrize("cache_size", [0, 10])
+def test_refresh_reads_only_the_pending_messages(stub_ollama, tmp_path, monkeypatch, cache_size):
+    stub = stub_ollama("Summary.")
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    store = AsyncChatHistory(handler, cache_size=cache_size)
+    summarizer = ConversationSummarizer(LlamaModel(api_url=stub.url + "/api/chat"), store,
+                                        refresh_every_turns=1, recent_window=2)
+
+    def full_transcript(conversation_id):
+        raise AssertionError("refresh loaded the whole transcript")
+
+    monkeypatch.setattr(handler, "get_conversation", full_transcript)
+
+    async def add(conversation_id, start, count):
+        for i in range(start, start + count):
+            await store.add_message(conversation_id, "user" if i % 2 == 0 else "assistant", f"message {i}")
+
+    async def run():
+        conversation_id = await store.create_conversation()
+        await add(conversation_id, 0, 20)
+        first = await summarizer.refresh(conversation_id)
+        first_sent = sent_messages(stub.payloads[-1])
+        # Nothing new beyond the recent window: no request at all
+        requests = len(stub.payloads)
+        await summarizer.refresh(conversation_id)
+        assert len(stub.payloads) == requests
+        await add(conversation_id, 20, 4)
+        await summarizer.refresh(conversation_id)
+        conversation = await store.get_conversation_window(conversation_id, 1)
+        return first, first_sent, sent_messages(stub.payloads[-1]), conversation["metadata"]
+
+    try:
+        first, first_sent, second_sent, metadata = asyncio.run(run())
+        assert first == "Summary."
+        assert first_sent == [f"message {i}" for i in range(18)]
+        assert second_sent == [f"message {i}" for i in range(18, 22)]
+        assert metadata["summary_message_count"] == 22
+    finally:
+        store.close()
+
+
+def test_refresh_restores_an_archived_conversation(stub_ollama, tmp_path):
+    stub = stub_ollama("Summary.")
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    store = AsyncChatHistory(handler)
+    summarizer = ConversationSummarizer(LlamaModel(api_url=stub.url + "/api/chat"), store,
+                                        refresh_every_turns=1, recent_window=2)
+
+    async def run():
+        conversation_id = await store.create_conversation()
+        for i in range(6):
+            await store.add_message(conversation_id, "user", f"message {i}")
+        await store.archive_conversation(conversation_id)
+        return await summarizer.refresh(conversation_id)
+
+    try:
+        assert asyncio.run(run()) == "Summary."
+        assert sent_messages(stub.payloads[-1]) == [f"message {i}" for i in range(4)]
+    finally:
+        store.close()
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from models.generation_profile import TASK_PROFILES, GenerationProfile, load_generation_profiles
+from models.llm_handler import LlamaModel
+from processors.conversation_summarizer import ConversationSummarizer
+
+APPSETTINGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "appsettings.json")
+
+
+@pytest.fixture
+def profiles():
+    with open(APPSETTINGS, encoding="utf-8") as f:
+        return load_generation_profiles(json.load(f))
+
+
+def test_appsettings_configures_every_generation_path(profiles):
+    for name in TASK_PROFILES:
+        assert profiles[name].to_options(), name
+    assert profiles["code"].temperature == 0.1
+    assert profiles["summarizer"].num_predict == 512
+
+
+def test_invalid_task_profile_fails_validation():
+    with pytest.raises(ValueError, match="summarizer"):
+        load_generation_profiles({"summarizer": {"generation": {"temperature": 5}}})
+
+
+def test_generate_code_sends_the_code_profile(stub_ollama, profiles):
+    stub = stub_ollama("print('hi')")
+    llm = LlamaModel(api_url=stub.url + "/api/chat", task_profiles=profiles)
+    assert llm.generate_code("say hi") == "print('hi')"
+    assert stub.payloads[-1]["options"] == profiles["code"].to_options()
+
+    override = GenerationProfile(temperature=0.0, num_predict=64)
+    llm.generate_code("say hi again", profile=override)
+    assert stub.payloads[-1]["options"]["temperature"] == 0.0
+    assert stub.payloads[-1]["options"]["num_predict"] == 64
+
+
+def test_summary_refresh_sends_the_summarizer_profile(stub_ollama, profiles, tmp_path):
+    stub = stub_ollama("A short summary.")
+    llm = LlamaModel(api_url=stub.url + "/api/chat")
+    store = AsyncChatHistory(ChatHistoryHandler(str(tmp_path / "chat.db")))
+    summarizer = ConversationSummarizer(llm, store, refresh_every_turns=1, recent_window=2,
+                                        profile=profiles["summarizer"])
+
+    async def run():
+        conversation_id = await store.create_conversation()
+        for i in range(6):
+            await store.add_message(conversation_id, "user" if i % 2 == 0 else "assistant", f"message {i}")
+        return await summarizer.refresh(conversation_id)
+
+    try:
+        assert asyncio.run(run()) == "A short summary."
+        assert stub.payloads[-1]["options"] == profiles["summarizer"].to_options()
+    finally:
+        store.close()
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+from models.llm_handler import LlamaModel
+
+PAYLOAD = {"model": "llama3:8b", "messages": [{"role": "user", "content": "hi"}], "stream": False}
+
+
+def test_coalesced_callers_record_usage_once(stub_ollama):
+    stub = stub_ollama("answer")
+    stub.delay = 0.2
+    llm = LlamaModel(api_url=stub.url + "/api/chat")
+    usages = [{} for _ in range(3)]
+
+    async def run():
+        return await asyncio.gather(*(llm._make_api_request(dict(PAYLOAD), usage=usage) for usage in usages))
+
+    assert asyncio.run(run()) == ["answer"] * 3
+    assert stub.requests["/api/chat"] == 1
+    assert sorted(usage.get("eval_count", 0) for usage in usages) == [0, 0, 5]
+
+
+def test_coalesced_sync_callers_record_usage_once(stub_ollama):
+    stub = stub_ollama("answer")
+    stub.delay = 0.2
+    llm = LlamaModel(api_url=stub.url + "/api/chat")
+    usages = [{} for _ in range(3)]
+    threads = [threading.Thread(target=llm._make_sync_api_request, args=(dict(PAYLOAD),), kwargs={"usage": usage})
+               for usage in usages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub.requests["/api/chat"] == 1
+    assert sorted(usage.get("eval_count", 0) for usage in usages) == [0, 0, 5]
+
+
+def test_failed_request_returns_error_text_without_usage(stub_ollama):
+    stub = stub_ollama()
+    stub.stop()
+    llm = LlamaModel(api_url=stub.url + "/api/chat")
+    usage = {}
+    response = asyncio.run(llm._make_api_request(dict(PAYLOAD), usage=usage))
+    assert llm.is_error_response(response)
+    assert usage == {}
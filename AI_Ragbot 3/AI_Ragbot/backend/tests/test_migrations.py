@@ -0,0 +1,92 @@
+import json
+import sqlite3
+
+import pytest
+
+import database.migrations as migrations
+from database.migrations import LATEST_VERSION, content_hash, current_version, run_migrations
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "chat_history.db"))
+    yield conn
+    conn.close()
+
+
+def test_fresh_database_reaches_latest_version(conn):
+    assert run_migrations(conn) == list(range(1, LATEST_VERSION + 1))
+    assert current_version(conn) == LATEST_VERSION
+    # Running again is a no-op
+    assert run_migrations(conn) == []
+
+
+def test_target_stops_early(conn):
+    assert run_migrations(conn, target=2) == [1, 2]
+    assert current_version(conn) == 2
+    assert run_migrations(conn) == list(range(3, LATEST_VERSION + 1))
+
+
+def test_upgrade_keeps_legacy_history(conn):
+    # A database from before versioning: initial schema only, with duplicate messages
+    run_migrations(conn, target=2)
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id, title, created_at, updated_at, metadata) VALUES (?, ?, ?, ?, ?)",
+        [("c1", "One", "2024-01-01", "2024-01-02", json.dumps({"app_name": "support"})),
+         ("c2", "Two", "2024-01-01", "2024-01-03", "not json")]
+    )
+    conn.executemany(
+        "INSERT INTO messages (message_id, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+        [("m3", "c1", "user", "later question", "2024-01-01T00:00:03"),
+         ("m1", "c1", "user", "How do refunds work?", "2024-01-01T00:00:01"),
+         ("m2", "c1", "assistant", "Refunds take five days.", "2024-01-01T00:00:02"),
+         ("m4", "c1", "user", "How do refunds work?", "2024-01-01T00:00:04"),
+         ("m5", "c2", "user", "hello", "2024-01-01T00:00:01")]
+    )
+    conn.commit()
+
+    run_migrations(conn)
+
+    rows = conn.execute(
+        "SELECT message_id, seq, content_hash FROM messages WHERE conversation_id = 'c1' ORDER BY seq"
+    ).fetchall()
+    # Sequence numbers follow timestamps; the later duplicate is kept but loses its hash
+    assert [(message_id, seq) for message_id, seq, _ in rows] == [("m1", 1), ("m2", 2), ("m3", 3), ("m4", 4)]
+    assert rows[0][2] == content_hash("How do refunds work?")
+    assert rows[3][2] is None
+    assert conn.execute("SELECT conversation_id, message_count, last_seq, app_name FROM conversations "
+                        "ORDER BY conversation_id").fetchall() == [("c1", 4, 4, "support"), ("c2", 1, 1, None)]
+    # Existing messages are searchable and the dedup index rejects new duplicates
+    assert conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'refund'").fetchall()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(
+            "INSERT INTO messages (message_id, conversation_id, role, content, timestamp, content_hash, seq) "
+            "VALUES ('m6', 'c1', 'user', 'How do refunds work?', '2024-01-02', ?, 5)",
+            (content_hash("How do refunds work?"),)
+        )
+
+
+def test_failed_migration_rolls_back(conn, monkeypatch):
+    run_migrations(conn)
+
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("migration failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(LATEST_VERSION + 1, "broken", broken)])
+    monkeypatch.setattr(migrations, "LATEST_VERSION", LATEST_VERSION + 1)
+    with pytest.raises(RuntimeError):
+        migrations.run_migrations(conn)
+    assert current_version(conn) == LATEST_VERSION
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+
+
+def test_concurrent_connections_apply_each_migration_once(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first, second = sqlite3.connect(path), sqlite3.connect(path)
+    try:
+        applied = run_migrations(first, target=3) + run_migrations(second) + run_migrations(first)
+    finally:
+        first.close()
+        second.close()
+    assert sorted(applied) == list(range(1, LATEST_VERSION + 1))
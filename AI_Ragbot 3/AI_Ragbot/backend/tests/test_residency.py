@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from models.residency import ModelResidencyScheduler
+
+
+class FakeEmbedder:
+    model_name = "nomic-embed-text"
+
+    def embed_batch(self, texts, batch_size):
+        return [[float(len(text))] for text in texts]
+
+
+def scheduler(resident):
+    residency = ModelResidencyScheduler(FakeEmbedder(), burst_size=2, quiet_seconds=0.1, max_defer_seconds=5,
+                                        ps_interval=3600)
+    # Known (or unknown) residency without asking Ollama
+    residency._resident = resident
+    residency._resident_checked = time.monotonic()
+    return residency
+
+
+def run_during_deferral(residency, models):
+    """Hold one burst back with an active chat, then start interactive requests for models"""
+
+    async def run():
+        release = asyncio.Event()
+
+        async def chat(model):
+            async with residency.interactive(model):
+                await release.wait()
+
+        first = asyncio.ensure_future(chat("llama3:8b"))
+        await asyncio.sleep(0)
+        ingestion = asyncio.ensure_future(residency.bulk_embed(["a", "bb"]))
+        while not residency.status()["bursts_waiting"]:
+            await asyncio.sleep(0.01)
+        others = [asyncio.ensure_future(chat(model)) for model in models]
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(first, *others)
+        return await ingestion
+
+    return asyncio.run(run())
+
+
+def test_deferred_burst_counts_one_avoided_swap_pair():
+    residency = scheduler({"llama3:8b"})
+    assert run_during_deferral(residency, ["llama3:8b"] * 4) == [[1.0], [2.0]]
+    status = residency.status()
+    assert status["deferrals"] == 1
+    assert status["avoided_swaps"] == 2
+    assert status["interactive_requests"] == 5
+
+
+def test_no_avoided_swaps_without_known_residency():
+    residency = scheduler(None)
+    run_during_deferral(residency, ["llama3:8b"] * 2)
+    assert residency.status()["deferrals"] == 1
+    assert residency.status()["avoided_swaps"] == 0
+
+
+@pytest.mark.parametrize("resident, model", [({"llama3:8b", "nomic-embed-text:latest"}, "llama3:8b"),
+                                             (set(), "nomic-embed-text")])
+def test_no_avoided_swaps_when_co_resident_or_only_embedding(resident, model):
+    residency = scheduler(set(resident))
+
+    async def run():
+        release = asyncio.Event()
+
+        async def query_embedding():
+            async with residency.interactive("nomic-embed-text"):
+                await release.wait()
+
+        active = asyncio.ensure_future(query_embedding())
+        await asyncio.sleep(0)
+        ingestion = asyncio.ensure_future(residency.bulk_embed(["a"]))
+        while not residency.status()["bursts_waiting"]:
+            await asyncio.sleep(0.01)
+        async with residency.interactive(model):
+            pass
+        release.set()
+        await active
+        await ingestion
+
+    asyncio.run(run())
+    assert residency.status()["deferrals"] == 1
+    assert residency.status()["avoided_swaps"] == 0
+
+
+def test_each_deferral_counts_separately():
+    residency = scheduler({"llama3:8b"})
+    run_during_deferral(residency, ["llama3:8b"])
+    # The burst loaded the embedding model; by the next deferral only the chat model is resident again
+    residency._resident = {"llama3:8b"}
+    run_during_deferral(residency, ["llama3:8b"])
+    assert residency.status()["deferrals"] == 2
+    assert residency.status()["avoided_swaps"] == 4
@@ -0,0 +1,225 @@
+import asyncio
+import zlib
+
+import pytest
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from database.sharded_chat_history import ShardedChatHistory, migrate
+
+APPS = ["support", "microtraining", None]
+
+
+def shard_counts(store: ShardedChatHistory):
+    return {shard["name"]: shard["conversations"] for shard in store.status()["shards"]}
+
+
+def all_pages(store, limit):
+    rows, cursor = [], None
+    while True:
+        page = store.list_conversations(limit, cursor)
+        rows.extend(page["conversations"])
+        if not page["has_more"]:
+            return rows
+        cursor = page["next_cursor"]
+
+
+def all_records(store, max_records):
+    records, after_id, after_seq = [], None, 0
+    while True:
+        batch = store.export_conversations(after_id, after_seq, max_records)
+        records.extend(batch["records"])
+        if batch["done"]:
+            return records
+        after_id, after_seq = batch["after_id"], batch["after_seq"]
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    """Single-file history: 20 conversations over three apps, one archived, with usage rows"""
+    path = str(tmp_path / "source.db")
+    handler = ChatHistoryHandler(path)
+    for i in range(20):
+        app_name = APPS[i % 3]
+        conversation_id = handler.create_conversation(f"conv-{i:02d}", f"Chat {i}",
+                                                      {"app_name": app_name} if app_name else {})
+        for j in range(i % 4 + 1):
+            handler.add_message(conversation_id, "user", f"printer question {i}.{j}", app_name=app_name)
+            handler.add_message(conversation_id, "assistant", f"answer {i}.{j}",
+                                usage={"model": "llama3:8b", "total_duration": 100, "eval_count": 10},
+                                app_name=app_name)
+    handler.archive_conversation("conv-05")
+    handler.log_uploaded_file("guide.pdf", "hash-guide")
+    handler.close()
+    return path
+
+
+def test_hash_mode_routes_by_crc32(tmp_path):
+    store = ShardedChatHistory(str(tmp_path), "hash", 4)
+    for i in range(40):
+        store.create_conversation(f"conv-{i}")
+    try:
+        expected = {f"{index:02d}": 0 for index in range(4)}
+        for i in range(40):
+            index = zlib.crc32(f"conv-{i}".encode("utf-8")) % 4
+            expected[f"{index:02d}"] += 1
+            assert store.shard_index(f"conv-{i}") == index
+            assert store.shard_for(f"conv-{i}").get_conversation(f"conv-{i}")["conversation_id"] == f"conv-{i}"
+        assert shard_counts(store) == expected
+        assert len([count for count in expected.values() if count]) > 1
+    finally:
+        store.close()
+
+
+def test_app_mode_routes_by_app_and_finds_conversations_again(tmp_path):
+    store = ShardedChatHistory(str(tmp_path), "app", apps=["support", "microtraining"])
+    store.create_conversation("a", metadata={"app_name": "support"})
+    store.create_conversation("b", metadata={"app_name": "microtraining"})
+    store.create_conversation("c", metadata={"app_name": "unknown"})
+    store.create_conversation("d")
+    store.close()
+
+    # A fresh instance has an empty routing cache and has to look conversations up
+    store = ShardedChatHistory(str(tmp_path), "app", apps=["support", "microtraining"])
+    try:
+        assert shard_counts(store) == {"default": 2, "microtraining": 1, "support": 1}
+        assert store.cached_shard_index("a") is None
+        assert store.shard_names[store.shard_index("a")] == "support"
+        assert store.cached_shard_index("a") == store.shard_index("a")
+        assert store.add_message("b", "user", "hello")
+        assert store.get_conversation("b")["messages"][0]["content"] == "hello"
+        assert store.shard_names[store.shard_index("b")] == "microtraining"
+        # Not created yet: where it would go
+        assert store.shard_names[store.shard_index("new", {"app_name": "support"})] == "support"
+        assert store.delete_conversation("a")
+        assert store.cached_shard_index("a") is None
+    finally:
+        store.close()
+
+
+def test_rejects_unknown_mode_and_unsafe_shard_names(tmp_path):
+    with pytest.raises(ValueError):
+        ShardedChatHistory(str(tmp_path), "range")
+    with pytest.raises(ValueError):
+        ShardedChatHistory(str(tmp_path), "app", apps=["../escape"])
+
+
+def test_route_cache_is_bounded(tmp_path):
+    store = ShardedChatHistory(str(tmp_path), "app", apps=["support"], route_cache_size=3)
+    try:
+        for i in range(5):
+            store.create_conversation(f"conv-{i}", metadata={"app_name": "support"})
+        assert store.status()["routes_cached"] == 3
+        assert store.cached_shard_index("conv-0") is None
+        assert store.shard_names[store.shard_index("conv-0")] == "support"
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("mode", ["hash", "app"])
+def test_migration_matches_single_file_reads(source_db, tmp_path, mode):
+    target = ShardedChatHistory(str(tmp_path / "shards"), mode, 3, apps=["support", "microtraining"])
+    stats = asyncio.run(migrate(source_db, target, batch_size=7))
+    single = ChatHistoryHandler(source_db)
+    try:
+        assert stats["conversations"] == 20
+        assert stats["generation_stats"] == 50
+        assert sum(shard["conversations"] for shard in stats["shards"]) == 20
+        if mode == "app":
+            assert shard_counts(target) == {"default": 6, "microtraining": 7, "support": 7}
+
+        # Paged list, merged across shards, is the single file's list
+        assert all_pages(target, 6) == all_pages(single, 6)
+        assert target.list_conversations(50) == single.list_conversations(50)
+        assert target.get_all_conversations(5, 3) == single.get_all_conversations(5, 3)
+
+        # Export records come back in the same order, whatever the batch size
+        assert all_records(target, 9) == all_records(single, 9) == all_records(single, 1000)
+
+        # Scores come from each shard's own index; the matches are the same
+        results = target.search_conversations("printer", limit=50)["results"]
+        expected = single.search_conversations("printer", limit=50)["results"]
+        assert sorted(row["conversation_id"] for row in results) == sorted(row["conversation_id"] for row in expected)
+        assert [row["score"] for row in results] == sorted((row["score"] for row in results), reverse=True)
+        assert "conv-05" not in {row["conversation_id"] for row in results}
+
+        # Archived conversation moved with its archive and still restores
+        assert target.is_archived("conv-05")
+        assert target.restore_conversation("conv-05") and single.restore_conversation("conv-05")
+        assert target.get_conversation("conv-05") == single.get_conversation("conv-05")
+        assert target.get_uploaded_files()[0]["filehash"] == "hash-guide"
+        assert target.get_generation_totals() == single.get_generation_totals()
+    finally:
+        single.close()
+        target.close()
+
+
+def test_migration_rerun_copies_nothing_twice(source_db, tmp_path):
+    target = ShardedChatHistory(str(tmp_path / "shards"), "hash", 2)
+    try:
+        first = asyncio.run(migrate(source_db, target, batch_size=5))
+        second = asyncio.run(migrate(source_db, target, batch_size=5))
+        assert (first["conversations"], first["generation_stats"]) == (20, 50)
+        assert (second["conversations"], second["messages"], second["files"], second["generation_stats"]) == (0, 0, 0, 0)
+        assert sum(shard_counts(target).values()) == 20
+        assert sum(row["generations"] for row in target.get_generation_totals()) == 50
+    finally:
+        target.close()
+
+
+def test_write_behind_batches_commit_on_each_shard(tmp_path):
+    handler = ShardedChatHistory(str(tmp_path), "hash", 3)
+    store = AsyncChatHistory(handler, write_behind_interval=0.05)
+
+    async def run():
+        conversation_ids = [await store.create_conversation(f"conv-{i}") for i in range(9)]
+        message_ids = await asyncio.gather(*(
+            store.add_message(conversation_id, "user", f"message {n}")
+            for n in range(3) for conversation_id in conversation_ids
+        ))
+        conversations = [await store.get_conversation(conversation_id) for conversation_id in conversation_ids]
+        return message_ids, conversations, store.write_behind.status()
+
+    try:
+        message_ids, conversations, status = asyncio.run(run())
+        assert all(message_ids) and len(set(message_ids)) == 27
+        for conversation in conversations:
+            assert [message["content"] for message in conversation["messages"]] == \
+                ["message 0", "message 1", "message 2"]
+            shard = handler.shard_for(conversation["conversation_id"])
+            assert shard.get_conversation(conversation["conversation_id"])["message_count"] == 3
+        assert len({handler.shard_index(conversation["conversation_id"]) for conversation in conversations}) > 1
+        assert status["pending"] == 0
+    finally:
+        store.close()
+
+
+def test_migration_of_a_live_database_keeps_sequences(source_db, tmp_path, monkeypatch):
+    target = ShardedChatHistory(str(tmp_path / "shards"), "hash", 2)
+    writer = ChatHistoryHandler(source_db)
+    export = ChatHistoryHandler.export_conversations
+    written = []
+
+    def export_while_writing(self, after_id=None, after_seq=0, max_records=1000):
+        batch = export(self, after_id, after_seq, max_records)
+        if self.db_path == source_db and not batch["done"] and batch["after_id"] not in written:
+            # A chat turn lands in the conversation being copied, after its record was read
+            written.append(batch["after_id"])
+            writer.add_message(batch["after_id"], "user", f"written during the copy to {batch['after_id']}")
+        return batch
+
+    monkeypatch.setattr(ChatHistoryHandler, "export_conversations", export_while_writing)
+    try:
+        asyncio.run(migrate(source_db, target, batch_size=3))
+        assert written
+        for conversation_id in written:
+            conversation = target.get_conversation(conversation_id)
+            seqs = [message["seq"] for message in conversation["messages"]]
+            assert seqs == list(range(1, len(seqs) + 1))
+            assert conversation["last_seq"] == conversation["message_count"] == len(seqs)
+            assert seqs and conversation["messages"][-1]["content"] == f"written during the copy to {conversation_id}"
+            assert target.add_message(conversation_id, "user", "next turn after the migration")
+            assert target.get_conversation(conversation_id)["last_seq"] == len(seqs) + 1
+    finally:
+        writer.close()
+        target.close()
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.single_flight import SingleFlight, request_key
+
+
+def test_request_key_ignores_dict_order():
+    assert request_key("/api/chat", {"a": 1, "b": [1, 2]}) == request_key("/api/chat", {"b": [1, 2], "a": 1})
+    assert request_key("/api/chat", {"a": 1}) != request_key("/api/chat", {"a": 2})
+    assert request_key("/api/chat", {"a": 1}) != request_key("/api/generate", {"a": 1})
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", upstream) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"upstream_calls": 1, "coalesced_calls": 4}
+
+
+def test_sequential_calls_are_not_cached():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        return [await flight.do("k", upstream) for _ in range(3)]
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def run():
+        async def upstream(value):
+            await asyncio.sleep(0.01)
+            return value
+        return await asyncio.gather(flight.do("a", lambda: upstream("a")), flight.do("b", lambda: upstream("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert flight.stats["upstream_calls"] == 2
+
+
+def test_error_is_shared_and_key_is_released():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+        after = await flight.do("k", lambda: asyncio.sleep(0, result="recovered"))
+        return results, after
+
+    results, after = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after == "recovered"
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("k", upstream))
+        second = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_do_sync_coalesces_threads():
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.1)
+        return "answer"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do_sync("k", upstream))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+
+
+def test_do_sync_shares_errors():
+    flight = SingleFlight()
+    errors = []
+
+    def upstream():
+        time.sleep(0.05)
+        raise ValueError("bad")
+
+    def call():
+        try:
+            flight.do_sync("k", upstream)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert flight.stats["upstream_calls"] == 1
+
+
+def test_stream_late_joiner_gets_every_chunk():
+    flight = SingleFlight()
+    opened = []
+
+    async def upstream():
+        opened.append(1)
+        for token in ["a", "b", "c", "d"]:
+            await asyncio.sleep(0.02)
+            yield token
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return [token async for token in flight.stream("k", upstream)]
+
+    async def run():
+        return await asyncio.gather(collect(0), collect(0.05))
+
+    assert asyncio.run(run()) == [["a", "b", "c", "d"], ["a", "b", "c", "d"]]
+    assert len(opened) == 1
+
+
+def test_stream_error_reaches_every_subscriber():
+    flight = SingleFlight()
+
+    async def upstream():
+        yield "a"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("stream broke")
+
+    async def collect():
+        tokens = []
+        with pytest.raises(RuntimeError):
+            async for token in flight.stream("k", upstream):
+                tokens.append(token)
+        return tokens
+
+    async def run():
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(run()) == [["a"], ["a"]]
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from database.transfer import (NDJSONImporter, decode_record, encode_record, export_records, iter_lines,
+                               last_checkpoint, parse_cursor)
+
+TABLE_QUERIES = [
+    "SELECT * FROM conversations ORDER BY conversation_id",
+    "SELECT * FROM messages ORDER BY message_id",
+    "SELECT * FROM conversation_archive ORDER BY conversation_id",
+    "SELECT filename, filehash FROM uploaded_files ORDER BY filehash",
+]
+
+
+class FakeChroma:
+    """export_chunks/import_chunks over a list, in place of ChromaDBHandler"""
+
+    def __init__(self, count: int = 0):
+        self.chunks = [{"id": f"doc-{i}", "content": f"chunk {i}", "metadata": {"source": "a.pdf"},
+                        "embedding": [0.5, i / 10]} for i in range(count)]
+        self.imported = []
+
+    def export_chunks(self, offset, limit):
+        return self.chunks[offset:offset + limit]
+
+    def import_chunks(self, chunks):
+        self.imported.extend(chunks)
+        return len(chunks)
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    path = str(tmp_path / "source.db")
+
+    async def build():
+        store = AsyncChatHistory(ChatHistoryHandler(path))
+        conversation_ids = []
+        for i in range(12):
+            conversation_id = await store.create_conversation(title=f"Chat {i}", metadata={"app_name": "support"})
+            for j in range(i):
+                await store.add_message(conversation_id, "user" if j % 2 == 0 else "assistant", f"message {i}.{j} ünï")
+            conversation_ids.append(conversation_id)
+        for i in range(9):
+            await store.log_uploaded_file(f"file{i}.pdf", f"hash{i}")
+        await store.archive_conversation(conversation_ids[7])
+        store.close()
+
+    asyncio.run(build())
+    return path
+
+
+def export_bytes(path, chroma=None, after=None, batch_size=5, sections=("files", "documents", "conversations")):
+    async def run():
+        store = AsyncChatHistory(ChatHistoryHandler(path))
+        try:
+            return b"".join([encode_record(record)
+                             async for record in export_records(store, chroma, after, batch_size, sections)])
+        finally:
+            store.close()
+
+    return asyncio.run(run())
+
+
+def import_bytes(path, data, chroma=None, chunk_size=333):
+    async def run():
+        store = AsyncChatHistory(ChatHistoryHandler(path))
+        importer = NDJSONImporter(store, chroma, batch_size=20)
+
+        async def chunks():
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+
+        try:
+            async for line in iter_lines(chunks()):
+                await importer.feed(line)
+            return await importer.finish()
+        finally:
+            store.close()
+
+    return asyncio.run(run())
+
+
+def data_records(data):
+    """Records other than header/checkpoint/end, as decoded dicts"""
+    records = [decode_record(line) for line in data.split(b"\n")]
+    return [r for r in records if r and r["type"] not in ("header", "checkpoint", "end")]
+
+
+def test_round_trip_reproduces_the_database(source_db, tmp_path):
+    chroma = FakeChroma(11)
+    data = export_bytes(source_db, chroma)
+    target = str(tmp_path / "target.db")
+    target_chroma = FakeChroma()
+    stats = import_bytes(target, data, target_chroma)
+
+    assert stats["files"] == 9 and stats["conversations"] == 12 and stats["documents"] == 11
+    assert target_chroma.imported == chroma.chunks
+    source, copy = sqlite3.connect(source_db), sqlite3.connect(target)
+    for query in TABLE_QUERIES:
+        assert source.execute(query).fetchall() == copy.execute(query).fetchall(), query
+    end = json.loads(data.rstrip(b"\n").rsplit(b"\n", 1)[1])
+    assert end == {"type": "end", "counts": {"files": 9, "documents": 11, "conversations": 12, "messages": 59}}
+
+
+def test_import_is_idempotent(source_db, tmp_path):
+    data = export_bytes(source_db)
+    target = str(tmp_path / "target.db")
+    import_bytes(target, data)
+    again = import_bytes(target, data)
+    assert again["files"] == 0 and again["conversations"] == 0 and again["messages"] == 0
+    copy = sqlite3.connect(target)
+    # 66 messages, less the 7 of the archived conversation (kept in its archive blob)
+    assert copy.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 59
+
+
+def test_resume_from_each_checkpoint_continues_exactly(source_db):
+    chroma = FakeChroma(11)
+    full = export_bytes(source_db, chroma)
+    lines = full.split(b"\n")
+    checkpoints = [index for index, line in enumerate(lines) if line.startswith(b'{"type":"checkpoint"')]
+    assert len(checkpoints) > 5
+    for index in checkpoints:
+        cursor = json.loads(lines[index])["cursor"]
+        resumed = export_bytes(source_db, chroma, after=cursor)
+        assert data_records(b"\n".join(lines[:index + 1])) + data_records(resumed) == data_records(full), cursor
+
+
+def test_archived_conversation_survives_and_restores(source_db, tmp_path):
+    target = str(tmp_path / "target.db")
+    import_bytes(target, export_bytes(source_db, sections=("conversations",)))
+
+    async def open_archived():
+        store = AsyncChatHistory(ChatHistoryHandler(target))
+        try:
+            conversation_id = sqlite3.connect(target).execute(
+                "SELECT conversation_id FROM conversations WHERE archived_at IS NOT NULL").fetchone()[0]
+            return await store.get_conversation(conversation_id)
+        finally:
+            store.close()
+
+    conversation = asyncio.run(open_archived())
+    assert conversation["title"] == "Chat 7"
+    assert [m["seq"] for m in conversation["messages"]] == list(range(1, 8))
+
+
+def test_last_checkpoint_of_a_truncated_file(source_db, tmp_path):
+    data = export_bytes(source_db)
+    lines = data.split(b"\n")
+    cut = [index for index, line in enumerate(lines) if line.startswith(b'{"type":"checkpoint"')][2]
+    partial = b"\n".join(lines[:cut + 1]) + b"\n" + lines[cut + 1][:10]
+    path = tmp_path / "partial.ndjson"
+    path.write_bytes(partial)
+    cursor, offset = last_checkpoint(str(path))
+    assert cursor == json.loads(lines[cut])["cursor"]
+    assert offset == len(b"\n".join(lines[:cut + 1])) + 1
+
+
+def test_cursor_parsing():
+    assert parse_cursor(None) == (0, [])
+    assert parse_cursor("files:12") == (0, ["12"])
+    assert parse_cursor("conversations:abc:def:7") == (2, ["abc:def", "7"])
+    for bad in ("nope:1", "files:x", "conversations:abc"):
+        with pytest.raises(ValueError):
+            parse_cursor(bad)
+
+
+def test_importer_rejects_foreign_or_newer_exports(tmp_path):
+    async def feed(record):
+        store = AsyncChatHistory(ChatHistoryHandler(str(tmp_path / "target.db")))
+        try:
+            await NDJSONImporter(store).feed(json.dumps(record).encode())
+        finally:
+            store.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(feed({"type": "header", "format": "something-else", "version": 1}))
+    with pytest.raises(ValueError):
+        asyncio.run(feed({"type": "header", "format": "ragbot-export", "version": 99}))
+    with pytest.raises(ValueError):
+        asyncio.run(feed({"type": "mystery"}))
+
+
+def test_messages_written_during_export_keep_sequence_consistent(tmp_path):
+    source = ChatHistoryHandler(str(tmp_path / "source.db"))
+    target = ChatHistoryHandler(str(tmp_path / "target.db"))
+    try:
+        source.create_conversation("c1")
+        for i in range(5):
+            source.add_message("c1", "user", f"message {i}")
+        batch = source.export_conversations(max_records=3)
+        target.import_conversations(batch["records"])
+        # Written after the conversation record was exported
+        source.add_message("c1", "assistant", "written during the export")
+        while not batch["done"]:
+            batch = source.export_conversations(batch["after_id"], batch["after_seq"], 3)
+            target.import_conversations(batch["records"])
+
+        conversation = target.get_conversation("c1")
+        assert (conversation["last_seq"], conversation["message_count"], len(conversation["messages"])) == (6, 6, 6)
+        assert target.add_message("c1", "user", "brand new message")
+        assert [m["seq"] for m in target.get_conversation("c1")["messages"]] == list(range(1, 8))
+    finally:
+        source.close()
+        target.close()
+
+
+def test_import_into_existing_conversation_updates_counts(tmp_path):
+    source = ChatHistoryHandler(str(tmp_path / "source.db"))
+    target = ChatHistoryHandler(str(tmp_path / "target.db"))
+    try:
+        source.create_conversation("c1")
+        source.add_message("c1", "user", "first")
+        target.import_conversations(source.export_conversations()["records"])
+        source.add_message("c1", "assistant", "second")
+        # Re-importing a later export only brings the new message; the counts follow it
+        assert target.import_conversations(source.export_conversations()["records"]) == \
+            {"conversations": 0, "messages": 1}
+        conversation = target.get_conversation("c1")
+        assert (conversation["last_seq"], conversation["message_count"]) == (2, 2)
+    finally:
+        source.close()
+        target.close()
+
+
+def test_stale_sequence_is_resynced_not_reported_as_duplicate(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    try:
+        handler.create_conversation("c1")
+        for i in range(4):
+            handler.add_message("c1", "user", f"message {i}")
+        with handler.pool.cursor() as cursor:
+            cursor.execute("UPDATE conversations SET last_seq = 2, message_count = 2 WHERE conversation_id = 'c1'")
+        assert handler.add_message("c1", "user", "new") is not None
+        assert handler.add_message("c1", "user", "new") is None
+
+        with handler.pool.cursor() as cursor:
+            cursor.execute("UPDATE conversations SET last_seq = 1 WHERE conversation_id = 'c1'")
+        result = handler.sync_messages("c1", 5, [{"role": "user", "content": "message 0"},
+                                                 {"role": "assistant", "content": "synced"}])
+        assert (result["applied"], result["last_seq"]) == (1, 6)
+        conversation = handler.get_conversation("c1")
+        assert conversation["message_count"] == 6
+        assert [m["seq"] for m in conversation["messages"]] == list(range(1, 7))
+    finally:
+        handler.close()
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from database.async_chat_history import AsyncChatHistory
+from database.chat_history import ChatHistoryHandler
+from database.write_behind import WriteBehindBuffer
+
+
+class RecordingStore:
+    """flush_fn stand-in that records each batch and returns a result per message"""
+
+    def __init__(self, fail_first: bool = False, delay: float = 0.0):
+        self.batches = []
+        self.fail_first = fail_first
+        self.delay = delay
+
+    async def flush(self, messages):
+        await asyncio.sleep(self.delay)
+        self.batches.append([message["content"] for message in messages])
+        if self.fail_first and len(self.batches) == 1:
+            raise RuntimeError("database is locked")
+        return [f"id-{message['content']}" for message in messages]
+
+
+def message(conversation_id, content):
+    return {"conversation_id": conversation_id, "role": "user", "content": content}
+
+
+def test_messages_within_interval_share_one_batch():
+    store = RecordingStore()
+
+    async def run():
+        buffer = WriteBehindBuffer(store.flush, interval=0.05)
+        futures = [buffer.submit(message(f"c{i}", str(i))) for i in range(5)]
+        return await asyncio.gather(*futures), buffer.status()
+
+    results, status = asyncio.run(run())
+    assert results == ["id-0", "id-1", "id-2", "id-3", "id-4"]
+    assert store.batches == [["0", "1", "2", "3", "4"]]
+    assert status["batches"] == 1 and status["pending"] == 0
+
+
+def test_full_batch_flushes_without_waiting_for_the_interval():
+    store = RecordingStore()
+
+    async def run():
+        buffer = WriteBehindBuffer(store.flush, interval=10, max_batch=3)
+        futures = [buffer.submit(message("c", str(i))) for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+
+    assert asyncio.run(run()) == ["id-0", "id-1", "id-2"]
+
+
+def test_failed_batch_fails_its_futures_only():
+    store = RecordingStore(fail_first=True)
+
+    async def run():
+        buffer = WriteBehindBuffer(store.flush, interval=0.01)
+        failed = buffer.submit(message("c", "a"))
+        with pytest.raises(RuntimeError):
+            await failed
+        later = await buffer.submit(message("c", "b"))
+        return later, buffer.stats["failed_batches"]
+
+    assert asyncio.run(run()) == ("id-b", 1)
+
+
+def test_wait_for_flushes_only_when_the_conversation_has_pending_messages():
+    store = RecordingStore()
+
+    async def run():
+        buffer = WriteBehindBuffer(store.flush, interval=10)
+        future = buffer.submit(message("c1", "a"))
+        await buffer.wait_for("c2")
+        assert buffer.pending_count() == 1
+        await buffer.wait_for("c1")
+        return future.done(), buffer.stats["forced_flushes"]
+
+    assert asyncio.run(run()) == (True, 1)
+
+
+def test_wait_for_waits_for_a_batch_already_being_flushed():
+    store = RecordingStore(delay=0.1)
+
+    async def run():
+        buffer = WriteBehindBuffer(store.flush, interval=0.01)
+        future = buffer.submit(message("c1", "a"))
+        await asyncio.sleep(0.03)  # the timer has started the flush
+        assert buffer.pending_count() == 0 and not future.done()
+        await buffer.wait_for("c1")
+        return future.done()
+
+    assert asyncio.run(run())
+
+
+def test_async_store_reads_its_own_buffered_writes(tmp_path):
+    handler = ChatHistoryHandler(str(tmp_path / "chat.db"))
+    store = AsyncChatHistory(handler, write_behind_interval=10)
+
+    async def run():
+        conversation_ids = [await store.create_conversation() for _ in range(3)]
+        adds = [asyncio.ensure_future(store.add_message(conversation_id, "user", f"question {index}"))
+                for index, conversation_id in enumerate(conversation_ids)]
+        await asyncio.sleep(0)
+        # Reading waits for the conversation's buffered insert, forcing the batch out long
+        # before the 10 s interval
+        conversation = await asyncio.wait_for(store.get_conversation(conversation_ids[1]), timeout=2)
+        await asyncio.gather(*adds)
+        duplicate = asyncio.ensure_future(store.add_message(conversation_ids[1], "user", "question 1"))
+        await asyncio.sleep(0)
+        await store.flush()
+        return conversation, await duplicate, store.write_behind.status()
+
+    try:
+        conversation, duplicate, status = asyncio.run(run())
+    finally:
+        store.close()
+    assert [m["content"] for m in conversation["messages"]] == ["question 1"]
+    assert duplicate is None
+    assert status["messages"] == 4 and status["largest_batch"] == 3
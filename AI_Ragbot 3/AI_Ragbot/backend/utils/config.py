@@ -10,6 +10,18 @@ class Settings(BaseSettings):
     APP_NAME: str = "Advanced Chatbot"
     DEBUG: bool = True
     LLAMA_API_URL: str = os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")
+    # Comma separated Ollama hosts, each optionally followed by "|"-separated models it serves,
+    # e.g. "http://gpu1:11434|llama3:8b,http://gpu2:11434". Empty means LLAMA_API_URL only.
+    OLLAMA_ENDPOINTS: str = os.getenv("OLLAMA_ENDPOINTS", "")
+    OLLAMA_HEALTH_INTERVAL: float = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 15))
+    # Model residency and prompt layout
+    CHAT_MODEL: str = os.getenv("CHAT_MODEL", "llama3:8b")
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # Per-model overrides of OLLAMA_KEEP_ALIVE, e.g. "llama3:8b=1h,nomic-embed-text=10m"
+    MODEL_KEEP_ALIVE: str = os.getenv("MODEL_KEEP_ALIVE", "")
+    PROMPT_LAYOUT: str = os.getenv("PROMPT_LAYOUT", "prefix_stable")
     CHROMA_DB_PATH: str = os.getenv("CHROMA_DB_PATH", "./chroma_db")
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", 1000))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", 200))
@@ -18,10 +30,63 @@ class Settings(BaseSettings):
     CODE_EXECUTION_ENABLED: bool = os.getenv("CODE_EXECUTION_ENABLED", "True").lower() == "true"
     CODE_EXECUTION_TIMEOUT: int = int(os.getenv("CODE_EXECUTION_TIMEOUT", 5))
     MAX_CODE_OUTPUT_SIZE: int = int(os.getenv("MAX_CODE_OUTPUT_SIZE", 10000))
+    # Warm code workers: interpreters kept running (0 = new interpreter per snippet), snippets per
+    # worker before it is replaced, per-snippet memory limit and modules imported ahead of time
+    CODE_WORKER_POOL_SIZE: int = int(os.getenv("CODE_WORKER_POOL_SIZE", 2))
+    CODE_WORKER_MAX_RUNS: int = int(os.getenv("CODE_WORKER_MAX_RUNS", 50))
+    CODE_WORKER_MEMORY_MB: int = int(os.getenv("CODE_WORKER_MEMORY_MB", 512))
+    CODE_WORKER_PRELOAD: str = os.getenv("CODE_WORKER_PRELOAD", "math,json,re,random,datetime,collections,itertools,statistics")
     # Security settings for code execution
     ALLOWED_MODULES: list = os.getenv("ALLOWED_MODULES", "math,random,datetime,json,collections,re,string,itertools,functools").split(",")
     RESTRICTED_MODULES: list = os.getenv("RESTRICTED_MODULES", "os,subprocess,sys,shutil,requests,socket,pickle,urllib").split(",")
+    # Rolling conversation summary settings
+    SUMMARY_REFRESH_TURNS: int = int(os.getenv("SUMMARY_REFRESH_TURNS", 6))
+    SUMMARY_MAX_CHARS: int = int(os.getenv("SUMMARY_MAX_CHARS", 1500))
+    # Semantic response cache settings (enabled per app in appsettings.json)
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+    RESPONSE_CACHE_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.92))
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))
+    # Idempotency-Key handling for /chat and /upload retries
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+    IDEMPOTENCY_MAX_KEYS: int = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+    # Batch chat API (/chat/batch)
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", 5000))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))
+    # Model residency: ingestion embeds in bursts, held back while chat is active
+    RESIDENCY_BURST_SIZE: int = int(os.getenv("RESIDENCY_BURST_SIZE", 64))
+    RESIDENCY_QUIET_SECONDS: float = float(os.getenv("RESIDENCY_QUIET_SECONDS", 2.0))
+    RESIDENCY_MAX_DEFER_SECONDS: float = float(os.getenv("RESIDENCY_MAX_DEFER_SECONDS", 30.0))
+    # Chat history: reader threads behind the async store (writes use one dedicated thread)
+    DB_READ_THREADS: int = int(os.getenv("DB_READ_THREADS", 4))
+    # Write-behind: group message inserts of all requests into shared transactions (off by default)
+    CHAT_WRITE_BEHIND: bool = os.getenv("CHAT_WRITE_BEHIND", "False").lower() == "true"
+    CHAT_WRITE_BEHIND_INTERVAL_MS: int = int(os.getenv("CHAT_WRITE_BEHIND_INTERVAL_MS", 20))
+    CHAT_WRITE_BEHIND_MAX_BATCH: int = int(os.getenv("CHAT_WRITE_BEHIND_MAX_BATCH", 256))
+    # Chat history sharding: "" keeps one database file, "hash" spreads conversations over
+    # CHAT_SHARD_COUNT files, "app" uses one file per app (migrate with python -m database.sharded_chat_history)
+    CHAT_SHARD_MODE: str = os.getenv("CHAT_SHARD_MODE", "")
+    CHAT_SHARD_COUNT: int = int(os.getenv("CHAT_SHARD_COUNT", 4))
+    CHAT_SHARD_DIR: str = os.getenv("CHAT_SHARD_DIR", "./database/shards")
+    # Hot-conversation cache: conversations kept (0 disables) and newest messages kept per conversation
+    CONVERSATION_CACHE_SIZE: int = int(os.getenv("CONVERSATION_CACHE_SIZE", 256))
+    CONVERSATION_CACHE_MESSAGES: int = int(os.getenv("CONVERSATION_CACHE_MESSAGES", 100))
+    # Cold storage: archive/delete idle conversations per app "retention" policy, then vacuum (opt-in)
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "False").lower() == "true"
+    ARCHIVE_INTERVAL_SECONDS: int = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", 200))
+    ARCHIVE_VACUUM_PAGES: int = int(os.getenv("ARCHIVE_VACUUM_PAGES", 2000))
+    # NDJSON export/import: records read per export batch and written per import transaction
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", 2000))
  
+    def keep_alive_for(self, model: str) -> str:
+        """Return the keep_alive duration for a model (MODEL_KEEP_ALIVE overrides OLLAMA_KEEP_ALIVE)"""
+        for entry in self.MODEL_KEEP_ALIVE.split(","):
+            name, _, duration = entry.strip().rpartition("=")
+            if name == model and duration:
+                return duration
+        return self.OLLAMA_KEEP_ALIVE
+
     class Config:
         env_file = ".env"
  
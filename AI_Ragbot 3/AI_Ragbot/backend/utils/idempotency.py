@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request"""
+
+
+class IdempotencyStore:
+    """
+    Remembers the outcome of requests sent with an idempotency key.
+
+    The first request with a key runs; retries with the same key attach to it while
+    it is still running and get its stored result once it has finished, until the
+    TTL expires. Failed requests are forgotten so that a retry runs again. Reusing a
+    key for a different request (other fingerprint) raises IdempotencyConflict.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, max_keys: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        # (scope, key) -> {"fingerprint", "task", "created_at"}
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.stats = {"executions": 0, "joined": 0, "replayed": 0, "conflicts": 0,
+                      "failures": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        """Hash the request fields a key must stay bound to"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expire(self, now: float):
+        expired = [entry_key for entry_key, entry in self._entries.items()
+                   if entry["task"].done() and now - entry["created_at"] > self.ttl_seconds]
+        for entry_key in expired:
+            del self._entries[entry_key]
+        self.stats["expirations"] += len(expired)
+
+    def _evict(self):
+        # Only finished entries can go; dropping a running one would let a retry start a second run
+        for entry_key in list(self._entries):
+            if len(self._entries) <= self.max_keys:
+                break
+            if self._entries[entry_key]["task"].done():
+                del self._entries[entry_key]
+                self.stats["evictions"] += 1
+
+    def _on_done(self, entry_key: Tuple[str, str], entry: Dict[str, Any], task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            self.stats["failures"] += 1
+            if self._entries.get(entry_key) is entry:
+                del self._entries[entry_key]
+
+    async def run(self, scope: str, key: str, fingerprint: str,
+                  fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn once for (scope, key) and return (result, replayed).
+
+        replayed is True when the result came from an earlier request with the same key.
+        """
+        self._expire(time.time())
+        entry_key = (scope, key)
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            if entry["fingerprint"] != fingerprint:
+                self.stats["conflicts"] += 1
+                raise IdempotencyConflict(f"Idempotency key '{key}' was already used for a different request")
+            self._entries.move_to_end(entry_key)
+            self.stats["replayed" if entry["task"].done() else "joined"] += 1
+            return await asyncio.shield(entry["task"]), True
+
+        # Run as its own task so the work finishes (and is stored) even if this client goes away
+        task = asyncio.ensure_future(fn())
+        entry = {"fingerprint": fingerprint, "task": task, "created_at": time.time()}
+        self._entries[entry_key] = entry
+        self.stats["executions"] += 1
+        task.add_done_callback(lambda t: self._on_done(entry_key, entry, t))
+        self._evict()
+        return await asyncio.shield(task), False
+
+    def status(self) -> Dict[str, Any]:
+        """Return counters and the number of running and stored keys"""
+        running = sum(1 for entry in self._entries.values() if not entry["task"].done())
+        return {**self.stats, "keys": len(self._entries), "in_progress": running}
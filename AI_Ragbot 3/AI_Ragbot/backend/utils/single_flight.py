@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+
+def request_key(url: str, payload: Dict[str, Any]) -> str:
+    """Hash an upstream request (endpoint, model, messages/prompt and options) into a flight key"""
+    raw = json.dumps({"url": url, "payload": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _SyncCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests into one upstream call.
+
+    Callers that arrive while a call with the same key is in flight wait for and
+    share its result instead of issuing their own. Nothing is cached: once the
+    call finishes the next request with that key goes upstream again.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._sync_calls: Dict[str, _SyncCall] = {}
+        self._sync_lock = threading.Lock()
+        self.stats = {"upstream_calls": 0, "coalesced_calls": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once per key among concurrent async callers and share its result"""
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["upstream_calls"] += 1
+            # Run as its own task so a cancelled caller doesn't cancel the shared call
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.stats["coalesced_calls"] += 1
+        return await asyncio.shield(task)
+
+    def do_sync(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Thread-based counterpart of do() for synchronous callers"""
+        with self._sync_lock:
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = _SyncCall()
+                self._sync_calls[key] = call
+                self.stats["upstream_calls"] += 1
+            else:
+                self.stats["coalesced_calls"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._sync_lock:
+                self._sync_calls.pop(key, None)
+            call.event.set()
+
+    async def stream(self, key: str, fn: Callable[[], AsyncGenerator[Any, None]]) -> AsyncGenerator[Any, None]:
+        """
+        Share one upstream stream among concurrent callers.
+
+        Every subscriber receives the full sequence of chunks; late joiners first
+        get the chunks produced so far, then follow the live stream.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            self.stats["upstream_calls"] += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, fn))
+        else:
+            self.stats["coalesced_calls"] += 1
+
+        index = 0
+        while True:
+            while index < len(flight.chunks):
+                yield flight.chunks[index]
+                index += 1
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return
+            await flight.wait()
+
+    async def _pump(self, key: str, flight: _StreamFlight, fn: Callable[[], AsyncGenerator[Any, None]]):
+        """Drain the upstream generator into the shared flight"""
+        try:
+            async for chunk in fn():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._streams.pop(key, None)
+            flight.notify()
@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Records wall-clock durations (ms) of named pipeline stages; stages may overlap"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    def _elapsed_ms(self, since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self._elapsed_ms(started)
+
+    def mark(self, name: str):
+        """Record the time elapsed since the timer was created under the given name"""
+        self.timings[name] = self._elapsed_ms(self._started)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**self.timings, "total": self._elapsed_ms(self._started)}
@@ -14,6 +14,10 @@ const state = {
 // Define API URL
 const API_URL = 'http://localhost:8000'; // Adjust if your FastAPI is on a different port
 const DB_API_URL = `${API_URL}/db`;
+// Messages loaded when a chat is opened and per scroll-back page
+const MESSAGE_PAGE_SIZE = 50;
+// Conversations per page of the sidebar list
+const CHAT_LIST_PAGE_SIZE = 50;
 // Cache control headers to prevent 304 responses
 const NO_CACHE_HEADERS = {
     'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -26,6 +30,14 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize state
     let currentChatId = null;
+    // Cursor for the page of messages before the oldest one shown (null when all are loaded)
+    let olderMessagesCursor = null;
+    let loadingOlderMessages = false;
+    // Last message sequence number the server acknowledged, per chat
+    const syncedSeq = new Map();
+    // Cursor for the next page of the sidebar chat list (null when all are shown)
+    let chatListCursor = null;
+    let loadingChatList = false;
     let settings = loadSettings();
     applyTheme(settings.theme);
 
@@ -106,6 +118,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Update startNewChat function
     async function startNewChat() {
     currentChatId = generateUniqueId();
+    olderMessagesCursor = null;
     const defaultTitle = 'New Chat';
 
     // Create chat in history
@@ -148,7 +161,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Save to database
-    await saveChat(currentChatId, defaultTitle, []);
+    await syncChat(currentChatId, { title: defaultTitle });
 
     // Focus on input
     messageInput.focus();
@@ -163,7 +176,7 @@ document.addEventListener('DOMContentLoaded', function() {
 }
 
 
-    // Update loadChatHistory function
+    // Update loadChatHistory function (first page; further pages load as the sidebar scrolls)
     async function loadChatHistory() {
     if (!settings.saveHistory || !chatHistory) {
         if (chatHistory) chatHistory.innerHTML = '';
@@ -171,41 +184,54 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     try {
-        const chats = await getAllChats();
+        const page = await getAllChats();
         chatHistory.innerHTML = '';
+        chatListCursor = page.next_cursor;
+        page.conversations.forEach(addChatItemToSidebar);
+    } catch (error) {
+        console.error('Error loading chat history:', error);
+        showToast('Error', 'Failed to load chat history', 'error');
+    }
+}
 
-        if (chats.length === 0) {
-            return;
+    // Load the next page of the chat list
+    async function loadMoreChats() {
+        if (!chatListCursor || loadingChatList) return;
+        loadingChatList = true;
+        try {
+            const page = await getAllChats(chatListCursor);
+            chatListCursor = page.next_cursor;
+            page.conversations.forEach(addChatItemToSidebar);
+        } finally {
+            loadingChatList = false;
         }
+    }
 
-        // Add chat items to sidebar
-        chats.forEach(chat => {
-            const chatId = chat.conversation_id || chat.id;
-            const chatItem = document.createElement('div');
-            chatItem.classList.add('chat-item');
-            chatItem.dataset.chatId = chatId;
-            chatItem.innerHTML = `
-                <span class="icon"><i class="fas fa-comment"></i></span>
-                <span>${chat.title}</span>
-            `;
-            chatHistory.appendChild(chatItem);
+    function addChatItemToSidebar(chat) {
+        const chatId = chat.conversation_id || chat.id;
+        const chatItem = document.createElement('div');
+        chatItem.classList.add('chat-item');
+        chatItem.dataset.chatId = chatId;
+        chatItem.innerHTML = `
+            <span class="icon"><i class="fas fa-comment"></i></span>
+            <span>${chat.title}</span>
+        `;
+        if (chat.preview) {
+            chatItem.title = chat.preview;
+        }
+        chatHistory.appendChild(chatItem);
 
-            // Add click event
-            chatItem.addEventListener('click', () => {
-                loadChat(chatId);
-            });
+        // Add click event
+        chatItem.addEventListener('click', () => {
+            loadChat(chatId);
         });
-    } catch (error) {
-        console.error('Error loading chat history:', error);
-        showToast('Error', 'Failed to load chat history', 'error');
     }
-}
 
 
     // Improved loadChat function with better error handling
 async function loadChat(chatId) {
     try {
-        const chat = await getChat(chatId);
+        const chat = await getChat(chatId, MESSAGE_PAGE_SIZE);
         if (!chat) {
             console.warn(`Chat ${chatId} not found or failed to load. Starting a new chat.`);
             await startNewChat();
@@ -247,6 +273,9 @@ async function loadChat(chatId) {
         } else {
             console.warn('Chat has no messages or messages is not an array');
         }
+        // Older messages are fetched when the user scrolls to the top
+        olderMessagesCursor = chat.next_cursor || null;
+        syncedSeq.set(chatId, chat.last_seq || 0);
 
         // Scroll to bottom
         scrollToBottom();
@@ -282,8 +311,9 @@ async function handleSendMessage() {
     addMessageToUI('user', message);
 
     // Attempt to update chat messages in storage
+    let synced = null;
     try {
-        await updateChatMessages(currentChatId, { role: 'user', content: message });
+        synced = await updateChatMessages(currentChatId, { role: 'user', content: message });
     } catch (error) {
         console.error('Failed to update chat history:', error);
         // Continue anyway - UI already updated
@@ -291,8 +321,7 @@ async function handleSendMessage() {
 
     // Update title if appropriate
     try {
-        const chat = await getChat(currentChatId);
-        if (chat && chat.messages && chat.messages.length === 1) {
+        if (synced && synced.last_seq === 1) {
             const newTitle = message.substring(0, 30) + (message.length > 30 ? '...' : '');
             await updateChatTitle(currentChatId, newTitle);
             
@@ -332,23 +361,18 @@ async function handleSendMessage() {
         formData.append('chat_id', currentChatId || '');
         formData.append('use_docs', useDocuments);
         formData.append('system_prompt', systprompt);
+        formData.append('app_name', typeof appName !== 'undefined' ? appName : '');
 
         console.log('Sending message to API:', message);
         console.log('Using chat ID:', currentChatId);
         console.log('API endpoint:', `${API_URL}/chat`);
 
-        // Set a timeout for the fetch request
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 300000); // 30 second timeout
-
-        // Send to API using the correct endpoint
-        const response = await fetch(`${API_URL}/chat`, {
+        // Send to API using the correct endpoint; retries reuse one idempotency key
+        // so a timed-out request is joined or replayed instead of generated twice
+        const response = await fetchWithIdempotency(`${API_URL}/chat`, {
             method: 'POST',
-            body: formData,
-            signal: controller.signal
-        });
-
-        clearTimeout(timeoutId); // Clear the timeout if the request completes
+            body: formData
+        }, { timeoutMs: 300000 });
 
         if (!response.ok) {
             const errorText = await response.text();
@@ -393,8 +417,40 @@ async function handleSendMessage() {
     scrollToBottom();
 }
 
-    // Function to add a message to the UI
-    function addMessageToUI(role, content) {
+    // Lazy-load the page of messages before the oldest one shown
+    async function loadOlderMessages() {
+        if (!olderMessagesCursor || loadingOlderMessages || !currentChatId) return;
+        loadingOlderMessages = true;
+        const chatId = currentChatId;
+        try {
+            const params = new URLSearchParams({ limit: MESSAGE_PAGE_SIZE, before: olderMessagesCursor });
+            const response = await fetch(`${API_URL}/api/conversations/${chatId}/messages?${params}`, {
+                method: 'GET',
+                headers: NO_CACHE_HEADERS
+            });
+            if (!response.ok) {
+                throw new Error('Failed to load older messages');
+            }
+            const page = await response.json();
+            // The user may have opened another chat while the page was loading
+            if (chatId !== currentChatId) return;
+
+            const previousHeight = messagesContainer.scrollHeight;
+            page.messages.slice().reverse().forEach(msg => {
+                addMessageToUI(msg.role, msg.content, true);
+            });
+            // Keep the messages the user was reading in place
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+            olderMessagesCursor = page.next_cursor || null;
+        } catch (error) {
+            console.error(`Error loading older messages for ${chatId}:`, error);
+        } finally {
+            loadingOlderMessages = false;
+        }
+    }
+
+    // Function to add a message to the UI (prepend=true puts it above the messages shown)
+    function addMessageToUI(role, content, prepend = false) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message', role === 'user' ? 'user-message' : 'bot-message');
 
@@ -421,7 +477,11 @@ async function handleSendMessage() {
             `;
         }
 
-        messagesContainer.appendChild(messageElement);
+        if (prepend) {
+            messagesContainer.insertBefore(messageElement, messagesContainer.firstChild);
+        } else {
+            messagesContainer.appendChild(messageElement);
+        }
         console.log(`${role} message added to chat:`, content.substring(0, 50) + (content.length > 50 ? '...' : ''));
 
         // Add copy functionality
@@ -659,7 +719,7 @@ async function handleSendMessage() {
             }
             scrollToBottom();
             
-            const response = await fetch(`${API_URL}/upload`, {
+            const response = await fetchWithIdempotency(`${API_URL}/upload`, {
                 method: 'POST',
                 body: formData
             });
@@ -761,6 +821,22 @@ async function handleSendMessage() {
 
     // Function for event listeners
     function initializeEventListeners() {
+        // Load more chats when the sidebar list is scrolled near its end
+        if (chatHistory) {
+            chatHistory.addEventListener('scroll', () => {
+                if (chatHistory.scrollTop + chatHistory.clientHeight >= chatHistory.scrollHeight - 100) {
+                    loadMoreChats();
+                }
+            });
+        }
+
+        // Load older messages when the user scrolls near the top of the chat
+        messagesContainer.addEventListener('scroll', () => {
+            if (messagesContainer.scrollTop < 100) {
+                loadOlderMessages();
+            }
+        });
+
         // Send message when send button is clicked
         if (sendButton) {
             sendButton.addEventListener('click', handleSendMessage);
@@ -791,6 +867,7 @@ async function handleSendMessage() {
                 if (currentChatId && confirm('Are you sure you want to delete this chat?')) {
                     deleteChat(currentChatId);
                     currentChatId = null;
+                    olderMessagesCursor = null;
                     
                     if (welcomeContainer) {
                         welcomeContainer.style.display = 'flex';
@@ -902,59 +979,44 @@ async function handleSendMessage() {
         return Date.now().toString(36) + Math.random().toString(36).substr(2);
     }
 
-    async function saveChat(id, title, messages = []) {
-        
-        if (!settings.saveHistory) return;
-        
-        
-        // const chats = getAllChats();
-        // const existingChatIndex = chats.findIndex(chat => chat.id === id);
+    // Send a chat's new messages (and title, if given) to the database. Only messages
+    // added since the last sequence number the server acknowledged are sent.
+    async function syncChat(id, { title = null, messages = [] } = {}) {
+        if (!settings.saveHistory) return null;
         if (!id) {
-            console.error('Cannot save chat: Missing ID');
+            console.error('Cannot sync chat: Missing ID');
             throw new Error('Missing chat ID');
         }
-        const chatData = {
-            id,
-            title,
-            messages,
-            timestamp: Date.now()
-        };
-        
-        
+
         try {
-            console.log(`Saving chat ${id} to database`);
-            const response = await fetch(`${DB_API_URL}/save-chat`, {
+            const response = await fetch(`${DB_API_URL}/sync-chat/${id}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                     ...NO_CACHE_HEADERS
                 },
-                body: JSON.stringify(chatData)
+                body: JSON.stringify({ base_seq: syncedSeq.get(id) || 0, title, messages })
             });
-            
+
             if (!response.ok) {
-                const errorText = await response.text();
                 throw new Error('Failed to save chat to database');
             }
             const result = await response.json();
-            console.log(`Chat ${id} saved successfully:`, result);
+            syncedSeq.set(id, result.last_seq);
+            console.log(`Chat ${id} synced: ${result.applied} new message(s), last_seq ${result.last_seq}`);
             return result;
         } catch (error) {
-            // console.error('Error saving chat:', error);
-            // showToast('Error', 'Failed to save chat history', 'error');
-            console.error(`Error saving chat ${id}:`, error);
+            console.error(`Error syncing chat ${id}:`, error);
             showToast('Error', `Failed to save chat: ${error.message}`, 'error');
             throw error; // Re-throw for the caller to handle if needed
         }
-        
     }
 
-    
-
-    // Replace getChat function
-    async function getChat(id) {
+    // Replace getChat function (limit loads only the last messages, plus next_cursor for older ones)
+    async function getChat(id, limit = null) {
         try {
-            const response = await fetch(`${DB_API_URL}/get-chat/${id}`, {
+            const query = limit ? `?limit=${limit}` : '';
+            const response = await fetch(`${DB_API_URL}/get-chat/${id}${query}`, {
             method: 'GET',
             headers: NO_CACHE_HEADERS
             });
@@ -975,72 +1037,45 @@ async function handleSendMessage() {
         }
     }
     
-    // Replace the getAllChats function
-    async function getAllChats() {
-     try {
-            const response = await fetch(`${DB_API_URL}/get-all-chats`, {
+    // Replace the getAllChats function: one page of the chat list (list fields only)
+    async function getAllChats(before = null) {
+        try {
+            const params = new URLSearchParams({ limit: CHAT_LIST_PAGE_SIZE });
+            if (before) params.set('before', before);
+            const response = await fetch(`${API_URL}/api/conversation-list?${params}`, {
                 method: 'GET',
                 headers: NO_CACHE_HEADERS
             });
-        
-         if (!response.ok) {
+
+            if (!response.ok) {
                 throw new Error('Failed to retrieve chats from database');
             }
-        
-            const data = await response.json();
-            console.log(data)
-            return data || [];
+
+            return await response.json();
         } catch (error) {
             console.error('Error getting all chats:', error);
-            return [];
+            return { conversations: [], next_cursor: null };
         }
     }
     // Update updateChatTitle function
     async function updateChatTitle(id, title) {
         try {
-            const chat = await getChat(id);
-            if (chat) {
-                chat.title = title;
-                await saveChat(id, title, chat.messages);
-            }
+            await syncChat(id, { title });
         } catch (error) {
             console.error('Error updating chat title:', error);
             showToast('Error', 'Failed to update chat title', 'error');
         }
     }
 
-    // Update updateChatMessages function
+    // Store a new message of a chat; returns the sync result (with last_seq).
+    // Clearing only empties the UI: stored history is kept, as before.
     async function updateChatMessages(id, message, clear = false) {
-        try {
-            if (!id) {
-                console.warn('Cannot update messages: Invalid chat ID');
-                return;
-            }
-            const chat = await getChat(id);
-            // if (!chat) return;
-            if (!chat) {
-                console.warn(`Chat ${id} not found. Creating new chat before updating messages.`);
-                // Create a new chat if needed
-                await saveChat(id, 'New Chat', message ? [message] : []);
-                return;
-            }
-            // Update messages
-            let updatedMessages = chat.messages || [];
-        
-            if (clear) {
-                chat.messages = [];
-            } else if (message) {
-                updatedMessages.push(message);
-            }
-        
-            await saveChat(id, chat.title, chat.messages);
-        } catch (error) {
-            // console.error('Error updating chat messages:', error);
-            // showToast('Error', 'Failed to update chat messages', 'error');
-            console.error(`Error updating chat messages for ${id}:`, error);
-            throw error; // Re-throw for the caller to handle if needed
-        
+        if (!id) {
+            console.warn('Cannot update messages: Invalid chat ID');
+            return null;
         }
+        if (clear || !message) return null;
+        return await syncChat(id, { messages: [message] });
     }
     
     async function deleteChat(id) {
@@ -71,4 +71,36 @@ function downloadChatHistory() {
   a.click();
   
   URL.revokeObjectURL(url);
-}
\ No newline at end of file
+}
+
+// Generate a unique key for an idempotent request
+function generateIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Fetch with an Idempotency-Key header, retrying on network errors, timeouts and 5xx.
+// Every attempt sends the same key, so the server joins or replays the first attempt
+// instead of generating the answer (or ingesting the file) again.
+async function fetchWithIdempotency(url, options = {}, { retries = 2, timeoutMs = 300000 } = {}) {
+  const headers = { ...(options.headers || {}), 'Idempotency-Key': generateIdempotencyKey() };
+  for (let attempt = 0; ; attempt++) {
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), timeoutMs);
+    try {
+      const response = await fetch(url, { ...options, headers, signal: controller.signal });
+      if (response.status < 500 || attempt >= retries) {
+        return response;
+      }
+    } catch (error) {
+      if (attempt >= retries) {
+        throw error;
+      }
+    } finally {
+      clearTimeout(timeoutId);
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+  }
+}